@@ -1,11 +1,13 @@
-import math
 import random
+import time
 
 import numpy as np
 from matplotlib import colors
 from matplotlib import pyplot as plt
 import plotly.express as px
 
+from GridPlanner import EXHAUSTED, TIMEOUT, MoveModel, PlanResult, createSearch, getLandmarks, pathCost, retraceActions
+
 
 class Map:
     '''Used to create a Map object'''
@@ -13,7 +15,7 @@ class Map:
         self.h = height
         self.w = width
         self.n = numObjects
-        self.occupancies = np.zeros((self.h, self.w))
+        self.occupancies = np.zeros((self.h, self.w), dtype=np.uint8)
         self.obstacles = set()
         self.placeObjects()
 
@@ -39,6 +41,14 @@ class Simulation:
         self.obstacles = mapDict['obstacles']
         self.robot = None
         self.goal = None
+        self.planner = 'astar' # 'astar', 'jps', 'jps8', 'bidirectional', 'hpa', 'dstar', 'lpa' or 'ara', see GridPlanner.createSearch
+        self.search = None # Search object whose buffers are reused across plans
+        self.landmarks = None # ALT landmark tables of the 'astar', 'bidirectional' and 'ara' planners, see useLandmarks
+        self.moves = MoveModel(4) # Moves of the 'astar', 'bidirectional' and 'ara' planners, see useMoves
+        self.hooks = None # SearchHooks of the 'astar' planner, see useHooks
+        self.maxiterations = 1000000 # Expansions allowed per plan
+        self.timebudget = None # Milliseconds allowed per plan, or None for no limit
+        self.status = None # Outcome of the last plan: GridPlanner.FOUND, UNREACHABLE, EXHAUSTED or TIMEOUT
 
     def createGoal(self, h, w):
         '''
@@ -73,89 +83,157 @@ class Simulation:
             print "Cannot create robot. goal already exists"
             return
 
+    def addObstacle(self, h, w):
+        '''
+        Puts an obstacle on a free cell. With the 'dstar' planner the next plan only repairs the previous one.
+        :param h: height or 'y' coordinate of the obstacle
+        :param w: width or 'x' coordinate of the obstacle
+        '''
+        if self.occupancies[h][w] == 0:
+            self.occupancies[h][w] = 1
+            self.obstacles.add((h, w))
+        else:
+            print "Cannot create obstacle at this position"
+
+    def removeObstacle(self, h, w):
+        '''
+        :param h: height or 'y' coordinate of the obstacle
+        :param w: width or 'x' coordinate of the obstacle
+        '''
+        if self.occupancies[h][w] == 1:
+            self.occupancies[h][w] = 0
+            self.obstacles.discard((h, w))
+        else:
+            print "No obstacle at this position"
+
     def getMap(self):
         return self.occupancies
 
+    def getObstacleGrid(self):
+        '''Returns a uint8 grid, the same shape as the occupancies, that is 1 on obstacles and 0 elsewhere'''
+        return (self.occupancies == 1).astype(np.uint8)
+
+    def getSearch(self):
+        '''Returns the search object of the selected planner, created once and reused by consecutive plans'''
+        if self.search is None or self.search.planner != self.planner:
+            self.search = createSearch(self.planner, self.h, self.w, self.moves)
+            if self.landmarks is not None and self.planner in ('astar', 'bidirectional', 'ara'):
+                self.search.heuristics = self.landmarks
+        self.search.hooks = self.hooks
+        return self.search
+
+    def useLandmarks(self, filename=None, count=8):
+        '''
+        Switches the 'astar', 'bidirectional' and 'ara' planners to the ALT landmark heuristic. The landmark tables
+        only hold for the current obstacles, so call this again after adding or removing obstacles.
+        :param filename: .npz file the tables are loaded from if they were saved for this map, and saved to otherwise
+        :param count: number of landmarks
+        '''
+        if self.moves.connectivity != 4:
+            raise ValueError('Landmark tables hold 4-connected distances')
+        self.landmarks = getLandmarks(self.getObstacleGrid(), filename, count)
+        self.search = None
+
+    def useMoves(self, connectivity=8, cutcorners=False):
+        '''
+        Lets the 'astar', 'bidirectional' and 'ara' planners move diagonally, at cost sqrt(2). The landmark tables
+        only hold for 4-connected moves, so they are dropped.
+        :param connectivity: 4 or 8, see GridPlanner.MoveModel
+        :param cutcorners: allow a diagonal move past an obstacle on one of the two cells beside it
+        '''
+        self.moves = MoveModel(connectivity, cutcorners)
+        if connectivity != 4:
+            self.landmarks = None
+        self.search = None
+
+    def useHooks(self, hooks):
+        '''
+        Calls hooks at every push, pop, expansion and goal of the 'astar' planner. The other planners ignore them.
+        :param hooks: GridPlanner.SearchHooks, e.g. a SearchRecorder, or None to plan without instrumentation
+        '''
+        self.hooks = hooks
+
     def getRobotCoordinates(self):
         return self.robot
 
     def getGoalCoordinates(self):
         return self.goal
 
+    def getDeadline(self):
+        '''Returns the time.time() value a plan started now has to end by, or None without a time budget'''
+        if self.timebudget is None:
+            return None
+        return time.time() + self.timebudget / 1000.0
+
     def plan(self):
         '''
-        A* Algorithm planner
+        A* Algorithm planner (or Jump Point Search or bidirectional A*, see self.planner). The search runs on flat integer cell ids
+        with g-scores, parents and closed flags kept in buffers that are reused by consecutive calls.
+        If self.maxiterations or self.timebudget runs out first, self.status is EXHAUSTED or TIMEOUT and the path
+        leads to the expanded cell closest to the goal.
+        :return: GridPlanner.PlanResult with the path, actions, status, cost, search statistics and time per phase;
+        result.astuple() is (retrpath, visited)
         '''
+        started = time.time()
+        deadline = self.getDeadline()
         initpose = self.getRobotCoordinates()
         goalpose = self.getGoalCoordinates()
-        obstacles = self.obstacles
-        agenda = Agenda()
-        initcost = heuristic(initpose, goalpose)
-        visited = {initpose}
-        visited.update(obstacles)
-        initpath = [] + [initpose]
-        agenda.addToAgenda(initpath, initcost)
-        count = 0
-        while True:
-            a = agenda.getFromAgenda()
-            #            print "Getting from agenda : "
-            #            print a
-            count += 1
-            if count == 1000000:
-                print "Too long to search"
-                print "iterations taken =  " + str(count)
-                return [], visited
-                break
-            if a[1][-1] == goalpose:
-                retrpath = a[1]
-                print "optimal path found"
-                print "iterations taken = " + str(count)
-                return retrpath, visited
-            else:
-                retrpath = a[1]
-                last_state_x = retrpath[-1][0]
-                last_state_y = retrpath[-1][1]
-                if last_state_x - 1 < 0 or last_state_y + 0 >= self.w or (
-                last_state_x - 1, last_state_y + 0) in visited:
-                    pass
-                else:
-                    pose_up = retrpath + [(last_state_x - 1, last_state_y + 0)]
-                    visited.add((last_state_x - 1, last_state_y + 0))
-                    agenda.addToAgenda(pose_up, heuristic((last_state_x - 1, last_state_y + 0), goalpose))
-
-                if last_state_x + 1 >= self.h or last_state_y + 0 >= self.w or (
-                last_state_x + 1, last_state_y + 0) in visited:
-                    pass
-                else:
-                    pose_down = retrpath + [(last_state_x + 1, last_state_y + 0)]
-                    visited.add((last_state_x - 1, last_state_y + 0))
-                    agenda.addToAgenda(pose_down, heuristic((last_state_x + 1, last_state_y + 0), goalpose))
-
-                if last_state_x + 0 >= self.h or last_state_y + 1 >= self.w or (
-                last_state_x + 0, last_state_y + 1) in visited:
-                    pass
-                else:
-                    pose_right = retrpath + [(last_state_x + 0, last_state_y + 1)]
-                    visited.add((last_state_x + 0, last_state_y + 1))
-                    agenda.addToAgenda(pose_right, heuristic((last_state_x + 0, last_state_y + 1), goalpose))
-
-                if last_state_x + 0 >= self.h or last_state_y - 1 < 0 or (last_state_x + 0, last_state_y - 1) in visited:
-                    pass
-                else:
-                    pose_left = retrpath + [(last_state_x + 0, last_state_y - 1)]
-                    visited.add((last_state_x + 0, last_state_y - 1))
-                    agenda.addToAgenda(pose_left, heuristic((last_state_x + 0, last_state_y - 0), goalpose))
+        self.getSearch()
+        obstaclegrid = self.getObstacleGrid()
+        searched = time.time()
+        retrpath = self.search.search(obstaclegrid, initpose, goalpose, self.maxiterations, deadline)
+        finished = time.time()
+        visited = self.search.getVisited(obstaclegrid)
+        self.status = self.search.status
+        if self.status in (EXHAUSTED, TIMEOUT):
+            retrpath = self.search.partialPath()
+            print "Planning budget ran out (" + self.status + "), partial path to the closest cell"
+        elif retrpath:
+            print "near-optimal path found" if self.planner == 'hpa' else "optimal path found"
+        else:
+            print "goal unreachable"
+        print "iterations taken = " + str(self.search.count)
+        result = PlanResult(retrpath, retraceActions(retrpath) if retrpath else [], self.status, visited,
+                            (retrpath, visited))
+        result.cost = pathCost(retrpath)
+        result.setStatistics(self.search)
+        result.times['setup'] = searched - started
+        result.times['search'] = finished - searched
+        result.times['result'] = time.time() - finished
+        return result
+
+    def planAnytime(self):
+        '''
+        With the 'ara' planner, yields a first path found with an inflated heuristic as soon as there is one, then
+        better paths until the path is optimal. Stopping the iteration early keeps the last path; self.maxiterations
+        and self.timebudget hold for all the paths together.
+        :return: yields (retrpath, bound), where the cost of retrpath is at most bound times the optimal cost
+        '''
+        if self.planner != 'ara':
+            raise ValueError("planAnytime needs sim.planner = 'ara'")
+        search = self.getSearch()
+        deadline = self.getDeadline()
+        for (retrpath, bound) in search.improve(self.getObstacleGrid(), self.getRobotCoordinates(),
+                                                self.getGoalCoordinates(), self.maxiterations, deadline):
+            yield retrpath, bound
+
+    def planMany(self, pairs):
+        '''
+        Plans many queries on this map in one call, without printing or changing the occupancies. The obstacle grid,
+        search buffers and heuristic fields are shared by the whole batch.
+        :param pairs: array-like of n pairs ((start row, start col), (goal row, goal col))
+        :return: (poses, offsets) where path i is the int32 (row, col) array poses[offsets[i]:offsets[i + 1]], empty
+        if the pair is out of bounds, on an obstacle or unreachable
+        '''
+        return self.getSearch().searchMany(self.getObstacleGrid(), pairs)
 
     def plot(self):
         '''Does the plotting task for occupancy grid after complete planning'''
         self.getFigure()
-        planned_path,visited_nodes = self.plan()
-        for item in visited_nodes:
-            x = item[0]
-            y = item[1]
-            self.occupancies[x][y] = 5
-            self.occupancies[self.robot[0]][self.robot[1]] = 2
-            self.occupancies[self.goal[0]][self.goal[1]] = 3
+        planned_path,visited_nodes = self.plan().astuple()
+        self.occupancies[visited_nodes == 1] = 5
+        self.occupancies[self.robot[0]][self.robot[1]] = 2
+        self.occupancies[self.goal[0]][self.goal[1]] = 3
         for item in planned_path:
             x = item[0]
             y = item[1]
@@ -179,39 +257,6 @@ class Simulation:
         plt.pause(1e-5)
 
 
-
-class Agenda:
-    '''A priority queue'''
-    def __init__(self):
-        '''Initialize empty agenda'''
-        self.agenda = []
-
-    def addToAgenda(self, path, hc):
-        '''
-        :param path: A list of poses (tuples) that signify a succession of states of the robot
-        :param hc: heuristic cost as computed from the heuristic function
-        '''
-        cost = len(path) + hc
-        self.agenda.append([cost, path])
-        self.agenda = sorted(self.agenda, key=lambda x: x[0])
-
-    def getFromAgenda(self):
-        '''Returns the first element of the Agenda'''
-        return self.agenda.pop(0)
-
-    def isEmpty(self):
-        return not any(self.agenda)
-
-
-def heuristic(ip, gp):
-    '''
-        :param ip: A tuple of x and y coordinates of current pose of robot
-        :param gp: A tuple of x and y coordinates of goal of robot
-        :return: A numerical (double) value of the heuristic cost
-        '''
-    return math.sqrt((ip[0] - gp[0]) ** 2 + (ip[1] - gp[1]) ** 2)
-#    return abs(ip[0]-gp[0]) + abs(ip[1]-gp[1]) # Alternative heuristic - Manhattan Distance. Uncomment this and comment the previous line to use this heuristic
-
 if __name__ == '__main__':
     '''User inputs should be h, w, n.
     h: height of gridmap
@@ -1,8 +1,14 @@
 import pygame
 from pygame.locals import *
-import random, math, sys
+import random, math, sys, heapq, time
+from collections import OrderedDict
 import numpy as np
 
+from GridPlanner import EXHAUSTED, FOUND, TIMEOUT, UNREACHABLE, FlowFields, GridSearch, MoveModel, PlanResult, \
+    getLandmarks, pathCost, planParallel, retraceActions
+from CooperativePlanner import SpaceTimeSearch, WindowedPlanner, findGoalClashes, planConflictBased, planCooperative
+from MapFiles import readGridMap, readMovingAIMap, readMovingAIScenarios, writeGridMap
+
 OBSTACLES = 2000
 ROWS = 100
 COLUMNS = 100
@@ -24,8 +30,9 @@ class Map:
         self.h = height
         self.w = width
         self.n = numObjects
-        self.occupancies = np.zeros((self.h, self.w))
+        self.occupancies = np.zeros((self.h, self.w), dtype=np.uint8)
         self.obstacles = set()
+        self.mapfile = None # Binary grid map the obstacles were loaded from, see loadMap
         self.placeObjects()
 
     def placeObjects(self):
@@ -36,11 +43,38 @@ class Map:
             self.obstacles.add((h, w))
 
     def getObjects(self):
+        if self.obstacles is None: # A loaded map only lists its obstacles once they are asked for, e.g. to draw them
+            self.obstacles = set(map(tuple, np.argwhere(self.occupancies == 1).tolist()))
         return self.obstacles
 
+    def getObstacleGrid(self):
+        """Returns a uint8 grid, the same shape as occupancies, that is 1 on obstacles and 0 elsewhere"""
+        return (self.occupancies == 1).astype(np.uint8)
+
     def loadMap(self, file):
-        """Convert binary file to occupancy grid"""
-        pass
+        """
+        Replaces the map with the grid of a binary grid map (.gmap, see MapFiles.writeGridMap) or of a MovingAI .map
+        file; occupancies becomes a uint8 grid of its size. A .gmap grid is a copy-on-write view of the file, so only
+        the pages that robots and goals are written to get copied.
+        :param file: path of the .gmap or .map file
+        """
+        if file.endswith('.gmap'):
+            self.occupancies = readGridMap(file).getOccupancies()
+            self.mapfile = file
+        else:
+            self.occupancies = readMovingAIMap(file)
+            self.mapfile = None
+        (self.h, self.w) = self.occupancies.shape
+        self.obstacles = None # See getObjects
+        self.n = int(np.count_nonzero(self.occupancies))
+
+    def saveMap(self, file, layers=None, bytegrid=False):
+        """
+        Writes the obstacles to a binary grid map, see MapFiles.writeGridMap
+        :param layers: optional dictionary of layer name -> h x w grid of per-cell costs
+        :param bytegrid: also store one byte per cell, which the 'decoupled' workers then search in place
+        """
+        writeGridMap(file, self.getObstacleGrid(), layers, bytegrid)
 
 def createObstacles(objects):
     """
@@ -124,21 +158,58 @@ class Robot(pygame.sprite.Sprite):
 
 class Agenda:
     def __init__(self):
-        self.agenda = []
-
-    def addToAgenda(self, path, hc, actionplan):
-        cost = len(path) + hc
-        self.agenda.append([cost, path, actionplan])
-        self.agenda = sorted(self.agenda, key=lambda x: x[0])
+        self.agenda = [] # Binary heap of [cost, counter, item, key] entries
+        self.entries = {} # Live entries by key, so an entry can be replaced or removed lazily
+        self.counter = 0 # Insertion counter; equal costs come out first-in first-out
+        self.size = 0 # Number of live entries
+        self.peak = 0 # Largest number of live entries so far
+
+    def addToAgenda(self, pose, hc, g, key=None):
+        cost = g + hc # g is the cost of the moves so far
+        self.pushToAgenda(cost, [cost, pose, g], key)
+
+    def pushToAgenda(self, cost, item, key=None):
+        if key is not None: # Adding a key again replaces its older entry
+            self.removeFromAgenda(key)
+        entry = [cost, self.counter, item, key]
+        self.counter += 1
+        if key is not None:
+            self.entries[key] = entry
+        heapq.heappush(self.agenda, entry)
+        self.size += 1
+        if self.size > self.peak:
+            self.peak = self.size
+
+    def removeFromAgenda(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            entry[2] = None # Stale entries are dropped when they reach the top of the heap
+            self.size -= 1
+
+    def dropStale(self):
+        while self.agenda and self.agenda[0][2] is None:
+            heapq.heappop(self.agenda)
 
     def getFromAgenda(self):
-        return self.agenda.pop(0)
+        self.dropStale()
+        if not self.agenda:
+            raise IndexError('get from empty agenda')
+        entry = heapq.heappop(self.agenda)
+        if entry[3] is not None:
+            del self.entries[entry[3]]
+        self.size -= 1
+        return entry[2]
 
     def isEmpty(self):
-        return not any(self.agenda)
+        return self.size == 0
 
     def viewFromAgenda(self):
-        return self.agenda[0]
+        self.dropStale()
+        return self.agenda[0][2]
+
+def goalKey(key):
+    '''Returns the key of the goal of robot key: goal_001 for robot_001, goal_1000 for robot_1000'''
+    return 'goal_' + key.split('_', 1)[1]
 
 def heuristic(ip, gp):
     return math.sqrt((ip[0] - gp[0]) ** 2 + (ip[1] - gp[1]) ** 2)
@@ -149,18 +220,22 @@ class Simulator(Map):
         Map.__init__(self, height, width, numObjects)
         self.robot = None
         self.goal = None
+        self.search = None
+        self.landmarks = None # ALT landmark tables, see useLandmarks
+        self.moves = MoveModel(4) # Moves of the 'astar' and 'decoupled' planners, see useMoves
+        self.hooks = None # SearchHooks of the 'astar' planner and of planMany, see useHooks
 
     def createGoal(self, h, w, name):
         if not self.goal:
-            if self.occupancies[h][w]==0: # If self.goal is not created and h,w is not occupied
+            if self.occupancies[h][w] in (0, 3): # If self.goal is not created and h,w is not occupied (goals may share a station, see checkGoals)
                 self.goal = {name: (h, w)}
                 self.occupancies[h][w] = 3
                 print "Goal created at (" + str(h) + "," + str(w) + ") : " + str(self.occupancies[h][w])
-            elif self.occupancies[h][w] != 0: # If self.goal is not created and h,w is occupied
+            else: # If self.goal is not created and h,w is occupied
                 print "Cannot create goal at this position. Randomly generating a goal."
-                newh, neww = random.randint(0, ROWS - 1), random.randint(0, COLUMNS - 1)
+                newh, neww = random.randint(0, self.h - 1), random.randint(0, self.w - 1)
                 while self.occupancies[newh][neww] != 0:  # if occupied
-                    newh, neww = random.randint(0, ROWS - 1), random.randint(0, COLUMNS - 1)
+                    newh, neww = random.randint(0, self.h - 1), random.randint(0, self.w - 1)
                 self.goal = {name: (newh, neww)}
                 self.occupancies[newh][neww] = 3
                 print "Goal created at (" + str(newh) + "," + str(neww) + ") : " + str(self.occupancies[newh][neww])
@@ -169,15 +244,15 @@ class Simulator(Map):
                 print "Cannot create goal. Goal already exists"
                 return
             elif name not in self.goal:
-                if self.occupancies[h][w]==0: # If self.goal is created, name does not exist and unoccupied
+                if self.occupancies[h][w] in (0, 3): # If self.goal is created, name does not exist and unoccupied
                     self.goal[name] = (h, w)
                     self.occupancies[h][w] = 3
                     print "Goal created at (" + str(h) + "," + str(w) + ") : " + str(self.occupancies[h][w])
-                elif self.occupancies[h][w]!=0: # If self.goal is created, name does not exist and occupied
+                else: # If self.goal is created, name does not exist and occupied
                     print "Cannot create goal at this position. Randomly generating a goal."
-                    newh, neww = random.randint(0, ROWS - 1), random.randint(0, COLUMNS - 1)
+                    newh, neww = random.randint(0, self.h - 1), random.randint(0, self.w - 1)
                     while self.occupancies[newh][neww] != 0:  # if occupied
-                        newh, neww = random.randint(0, ROWS - 1), random.randint(0, COLUMNS - 1)
+                        newh, neww = random.randint(0, self.h - 1), random.randint(0, self.w - 1)
                     self.goal[name] = (newh, neww)
                     self.occupancies[newh][neww] = 3
                     print "Goal created at (" + str(newh) + "," + str(neww) + ") : " + str(self.occupancies[newh][neww])
@@ -190,9 +265,9 @@ class Simulator(Map):
                 print "Robot created at (" + str(h) + "," + str(w) + ") : " + str(self.occupancies[h][w])
             elif self.occupancies[h][w] != 0: # If self.goal is not created and h,w is occupied
                 print "Cannot create robot at this position. Randomly generating a goal."
-                newh, neww = random.randint(0, ROWS - 1), random.randint(0, COLUMNS - 1)
+                newh, neww = random.randint(0, self.h - 1), random.randint(0, self.w - 1)
                 while self.occupancies[newh][neww] != 0:  # if occupied
-                    newh, neww = random.randint(0, ROWS - 1), random.randint(0, COLUMNS - 1)
+                    newh, neww = random.randint(0, self.h - 1), random.randint(0, self.w - 1)
                 self.robot = {name: (newh, neww)}
                 self.occupancies[newh][neww] = 2
                 print "Robot created at (" + str(newh) + "," + str(neww) + ") : " + str(self.occupancies[newh][neww])
@@ -207,9 +282,9 @@ class Simulator(Map):
                     print "Robot created at (" + str(h) + "," + str(w) + ") : " + str(self.occupancies[h][w])
                 elif self.occupancies[h][w]!=0: # If self.goal is created, name does not exist and occupied
                     print "Cannot create robot at this position. Randomly generating a goal."
-                    newh, neww = random.randint(0, ROWS - 1), random.randint(0, COLUMNS - 1)
+                    newh, neww = random.randint(0, self.h - 1), random.randint(0, self.w - 1)
                     while self.occupancies[newh][neww] != 0:  # if occupied
-                        newh, neww = random.randint(0, ROWS - 1), random.randint(0, COLUMNS - 1)
+                        newh, neww = random.randint(0, self.h - 1), random.randint(0, self.w - 1)
                     self.robot[name] = (newh, neww)
                     self.occupancies[newh][neww] = 2
                     print "Robot created at (" + str(newh) + "," + str(neww) + ") : " + str(self.occupancies[newh][neww])
@@ -226,32 +301,87 @@ class Simulator(Map):
         """Returns a dictionary of tuples of goal coordinates"""
         return self.goal
 
-    def moveUpYRows(self, last_y):
-        return last_y - 1
-
-    def moveDownYRows(self, last_y):
-        return last_y + 1
-
-    def moveRightXCols(self, last_x):
-        return last_x + 1
-
-    def moveLeftXCols(self, last_x):
-        return last_x - 1
+    def planMany(self, pairs):
+        '''
+        Plans many (start, goal) pairs on this map in one call, without printing or changing the occupancies
+        :param pairs: array-like of n pairs ((start row, start col), (goal row, goal col))
+        :return: (poses, offsets) where path i is the int32 (row, col) array poses[offsets[i]:offsets[i + 1]], empty
+        if the pair is out of bounds, on an obstacle or unreachable
+        '''
+        if self.search is None: # Buffers and heuristic fields are shared by every batch on this map
+            self.search = GridSearch(self.h, self.w, self.landmarks or 'euclidean', moves=self.moves)
+        self.search.hooks = self.hooks
+        return self.search.searchMany(self.getObstacleGrid(), pairs)
 
-    def dontMove(self, coord):
-        return coord
+    def loadMap(self, file):
+        """Loads a .gmap or MovingAI .map file (see Map.loadMap); robots, goals and the old map's tables are dropped"""
+        Map.loadMap(self, file)
+        self.robot = None
+        self.goal = None
+        self.search = None
+        self.landmarks = None
+
+    def loadScenarios(self, file, count):
+        """
+        Creates a robot and its goal for each of the first count scenarios of a MovingAI .scen file, robot_001 and
+        goal_001 for the first one and so on, on the map loaded with loadMap. A scenario whose start is not a free
+        cell or whose goal is an obstacle or a robot is skipped, so that no robot or goal is moved elsewhere. Goals
+        of several scenarios may fall on the same cell, which only the 'flowfield' planner accepts.
+        :param count: number of scenarios, which all move in the same lockstep plan
+        :return: The scenarios as returned by MapFiles.readMovingAIScenarios; their pairs can also be passed to
+        planMany as they are
+        """
+        scenarios = readMovingAIScenarios(file)
+        for (i, (startrow, startcol, goalrow, goalcol)) in enumerate(scenarios['pairs'][:count].tolist()):
+            identity = '%03d' % (i + 1)
+            if not (0 <= startrow < self.h and 0 <= startcol < self.w and 0 <= goalrow < self.h and
+                    0 <= goalcol < self.w):
+                print "Skipping scenario " + identity + ": it is outside the map"
+            elif self.occupancies[startrow][startcol] != 0 or self.occupancies[goalrow][goalcol] not in (0, 3) or \
+                    (startrow, startcol) == (goalrow, goalcol):
+                print "Skipping scenario " + identity + ": its start or goal is taken"
+            else:
+                self.createRobot(startrow, startcol, 'robot_' + identity)
+                self.createGoal(goalrow, goalcol, 'goal_' + identity)
+        return scenarios
 
-    def up(self):
-        return (-1, 0)
+    def useLandmarks(self, filename=None, count=8):
+        '''
+        Switches the planners from the Euclidean heuristic to the ALT landmark heuristic, which is much closer to the
+        true distance on maps with many obstacles. The tables only hold for the current obstacles.
+        :param filename: .npz file the tables are loaded from if they were saved for this map, and saved to otherwise
+        :param count: number of landmarks
+        '''
+        if self.moves.connectivity != 4:
+            raise ValueError('Landmark tables hold 4-connected distances')
+        self.landmarks = getLandmarks(self.getObstacleGrid(), filename, count)
+        self.search = None
 
-    def down(self):
-        return (1, 0)
+    def useMoves(self, connectivity=8, cutcorners=False):
+        '''
+        Lets the 'astar' and 'decoupled' planners move diagonally, at cost sqrt(2). The other planners keep to
+        4-connected moves. The landmark tables only hold for 4-connected moves, so they are dropped.
+        :param connectivity: 4 or 8, see GridPlanner.MoveModel
+        :param cutcorners: allow a diagonal move past an obstacle on one of the two cells beside it
+        '''
+        self.moves = MoveModel(connectivity, cutcorners)
+        if connectivity != 4:
+            self.landmarks = None
+        self.search = None
 
-    def right(self):
-        return (0, 1)
+    def useHooks(self, hooks):
+        '''
+        Calls hooks at every push, pop, expansion, goal and robot clash of the lockstep 'astar' planner, and at every
+        push, pop, expansion and goal of planMany. The other planners ignore them.
+        :param hooks: GridPlanner.SearchHooks, e.g. a SearchRecorder, or None to plan without instrumentation
+        '''
+        self.hooks = hooks
 
-    def left(self):
-        return (0, -1)
+    def estimate(self, pose, goalpose):
+        """Returns the heuristic distance from pose to goalpose, from the landmark tables if there are any"""
+        if self.landmarks is None:
+            return heuristic(pose, goalpose)
+        return self.landmarks.getField(goalpose)[pose[0] * self.w + pose[1]]
 
 # MODIFY ONLY THIS ---------------------------------------------------------------------------------------------------------
 
@@ -259,11 +389,10 @@ class AStarSimulator(Simulator):
     def __init__(self, height = ROWS, width = COLUMNS, numObjects = OBSTACLES):
         Simulator.__init__(self, height, width, numObjects)
         self.initpose = {}
-        self.initaction = {}
         self.goalpose = {}
         self.agenda = {}
         self.visited = {}
-        self.initpath = {}
+        self.parents = {} # Pose each pushed pose was reached from, per robot; None at the initial pose
         self.count = {}
         self.flag = {}
         self.a = {}
@@ -271,267 +400,430 @@ class AStarSimulator(Simulator):
         self.actionplan = {}
         self.next_state = {}
         self.last_state = {}
+        self.masks = None # Bits of the moves that are valid from every cell, set by plan
+        self.kernel = None # Move model as (mask bit, action, cost), set by plan
+        self.maxiterations = 10000 # Expansions allowed per robot
+        self.timebudget = None # Milliseconds allowed per plan of every planner but 'flowfield', or None
+        self.status = {} # Outcome of the last plan per robot: FOUND, UNREACHABLE, EXHAUSTED or TIMEOUT
+        self.closest = {} # (heuristic value, pose) of the expanded pose closest to the goal, per robot
+        self.statistics = {} # (pushed, peak, reopened) of the last plan per robot, where the planner reports them
+        self.times = None # Seconds spent in each phase of the last plan
+        self.planner = 'astar' # 'astar' plans all robots in lockstep, 'decoupled' plans them independently in parallel,
+                               # 'flowfield' follows one cached field per goal, 'cooperative' plans them one after the
+                               # other around a space-time reservation table so that no two robots collide, 'cbs'
+                               # finds optimal collision-free plans and 'ecbs' ones within self.suboptimality of optimal,
+                               # 'whca' reserves a rolling window and replans while the robots move (see stepWindowed)
+        self.workers = None # Worker processes used by the decoupled planner, defaults to one per CPU
+        self.flowfields = None # Fields cached per goal by the flowfield planner
+        self.spacetime = None # Space-time search of the cooperative planner, keeps its distance fields between plans
+        self.suboptimality = 1.5 # Bound on the cost of 'ecbs' plans, as a multiple of the optimal cost
+        self.window = 16 # Timesteps reserved by every robot with the 'whca' planner
+        self.replanperiod = 8 # Timesteps between two replans of the 'whca' planner
+        self.windowed = None # WindowedPlanner of the robots being moved by the 'whca' planner
         self.penalty = 10000
 
-    def checkAndMoveUp(self, last_state_row, last_state_col, key, next_state):
-        # Move Up Conditions
-        if self.moveUpYRows(last_state_row) < 0 or self.dontMove(last_state_col) >= self.w:  # Check for out of bounds
-            #print "Checking MoveUp, out of bounds"
-            pass  # Do nothing
-        else:
-            if (self.moveUpYRows(last_state_row), self.dontMove(last_state_col)) in self.visited[key]:  # Check for visited nodes
-                #print "Checking MoveUp, visited node"
-                pass  # Do nothing
-            else:
-                if next_state:  # If next_state has been filled
-                    templist = []
-                    for vals in next_state.values(): # Get a list of tuples
-                        templist += vals # Append to larger list
-                    #print "templist of states", templist
-                    if (self.moveUpYRows(last_state_row), self.dontMove(last_state_col)) in templist:  # Check for robot clashes
-                        # If robot clashes, update next state. We will heavily penalize and add to agenda. Keep next state same as now.
-                        if key not in next_state:
-                            next_state[key] = [] + [(self.moveUpYRows(last_state_row), self.dontMove(last_state_col))]
-                        else:
-                            next_state[key] += [(self.moveUpYRows(last_state_row), self.dontMove(last_state_col))]
-                        pose_up = self.retrpath[key] + [(self.moveUpYRows(last_state_row), self.dontMove(last_state_col))]
-                        action_next = self.actionplan[key] + [self.up()]
-                        self.visited[key].add((self.moveUpYRows(last_state_row), self.dontMove(last_state_col)))
-                        self.agenda[key].addToAgenda(pose_up, self.penalty + heuristic((self.moveUpYRows(last_state_row), self.dontMove(last_state_col)), self.goalpose[key]), action_next)
-                    else: # If no robot clashes, only then update next_state
-                        #print "Currently key is : ", key
-                        if key not in next_state:
-                            #print "Key not there"
-                            next_state[key] = [] + [(self.moveUpYRows(last_state_row), self.dontMove(last_state_col))]
-                            #print "Is Key there now? : ", key in next_state
-                        else:
-                            #print "Key is there"
-                            next_state[key] += [(self.moveUpYRows(last_state_row), self.dontMove(last_state_col))]
-                        pose_up = self.retrpath[key] + [(self.moveUpYRows(last_state_row), self.dontMove(last_state_col))]
-                        action_next = self.actionplan[key] + [self.up()]
-                        self.visited[key].add((self.moveUpYRows(last_state_row), self.dontMove(last_state_col)))
-                        self.agenda[key].addToAgenda(pose_up, heuristic((self.moveUpYRows(last_state_row), self.dontMove(last_state_col)), self.goalpose[key]), action_next)
-                else:  # If next_state has not been filled, update next_state
-                    next_state[key] = [] + [(self.moveUpYRows(last_state_row), self.dontMove(last_state_col))]
-                    pose_up = self.retrpath[key] + [(self.moveUpYRows(last_state_row), self.dontMove(last_state_col))]
-                    action_next = self.actionplan[key] + [self.up()]
-                    self.visited[key].add((self.moveUpYRows(last_state_row), self.dontMove(last_state_col)))
-                    self.agenda[key].addToAgenda(pose_up, heuristic((self.moveUpYRows(last_state_row), self.dontMove(last_state_col)), self.goalpose[key]), action_next)
-        #print "MoveUp Complete\n\n\n\n"
-        return next_state # Returns the dictionary of lists of tuples
-
-    def checkAndMoveDown(self, last_state_row, last_state_col, key, next_state):
-        # Move Down Conditions
-        if self.moveDownYRows(last_state_row) >= self.h or self.dontMove(last_state_col) >= self.w:
-            #print "Checking MoveDown, out of bounds"
-            pass  # Do nothing
-        else:
-            if (self.moveDownYRows(last_state_row), self.dontMove(last_state_col)) in self.visited[key]:  # Check for visited nodes
-                #print "Checking MoveDown, visited node"
-                pass  # Do nothing
-            else:
-                if next_state:  # If next_state has been filled
-                    templist = []
-                    for vals in next_state.values(): # Get a list of tuples
-                        #print vals
-                        templist += vals # Append to larger list
-                    #print "templist of states", templist
-                    if (self.moveDownYRows(last_state_row), self.dontMove(last_state_col)) in templist:  # Check for robot clashes
-                        if key not in next_state:
-                            next_state[key] = [] + [(self.moveDownYRows(last_state_row), self.dontMove(last_state_col))]
-                        else:
-                            next_state[key] += [(self.moveDownYRows(last_state_row), self.dontMove(last_state_col))]
-                        pose_up = self.retrpath[key] + [(self.moveDownYRows(last_state_row), self.dontMove(last_state_col))]
-                        action_next = self.actionplan[key] + [self.down()]
-                        self.visited[key].add((self.moveDownYRows(last_state_row), self.dontMove(last_state_col)))
-                        self.agenda[key].addToAgenda(pose_up,self.penalty + heuristic((self.moveDownYRows(last_state_row), self.dontMove(last_state_col)), self.goalpose[key]), action_next)
-                    else:
-                        #print "Currently key is : ", key
-                        if key not in next_state:
-                            #print "Key not there"
-                            next_state[key] = [] + [(self.moveDownYRows(last_state_row), self.dontMove(last_state_col))]
-                            #print "Is Key there now? : ", key in next_state
-                        else:
-                            #print "Key is there"
-                            next_state[key] += [(self.moveDownYRows(last_state_row), self.dontMove(last_state_col))]
-                        pose_up = self.retrpath[key] + [(self.moveDownYRows(last_state_row), self.dontMove(last_state_col))]
-                        action_next = self.actionplan[key] + [self.down()]
-                        self.visited[key].add((self.moveDownYRows(last_state_row), self.dontMove(last_state_col)))
-                        self.agenda[key].addToAgenda(pose_up, heuristic((self.moveDownYRows(last_state_row), self.dontMove(last_state_col)), self.goalpose[key]), action_next)
-                else:  # If next_state has not been filled
-                    next_state[key] = [] + [(self.moveDownYRows(last_state_row), self.dontMove(last_state_col))]
-                    pose_up = self.retrpath[key] + [(self.moveDownYRows(last_state_row), self.dontMove(last_state_col))]
-                    action_next = self.actionplan[key] + [self.down()]
-                    self.visited[key].add((self.moveDownYRows(last_state_row), self.dontMove(last_state_col)))
-                    self.agenda[key].addToAgenda(pose_up, heuristic((self.moveDownYRows(last_state_row), self.dontMove(last_state_col)), self.goalpose[key]), action_next)
-        #print "MoveDown Complete\n\n\n\n"
-        return next_state
-
-    def checkAndMoveRight(self, last_state_row, last_state_col, key, next_state):
-        # Move Right Conditions
-        if self.dontMove(last_state_row) >= self.h or self.moveRightXCols(last_state_col) >= self.w:
-            #print "Checking MoveRight, out of bounds"
-            pass  # Do nothing
-        else:
-            if (self.dontMove(last_state_row), self.moveRightXCols(last_state_col)) in self.visited[key]:  # Check for visited nodes
-                #print "Checking MoveRight, visited node"
-                pass  # Do nothing
-            else:
-                if next_state:  # If next_state has been filled
-                    templist = []
-                    for vals in next_state.values(): # Get a list of tuples
-                        templist += vals # Append to larger list
-                    #print "templist of states", templist
-                    if (self.dontMove(last_state_row), self.moveRightXCols(last_state_col)) in templist:  # Check for robot clashes
-                        if key not in next_state:
-                            next_state[key] = [] + [(self.dontMove(last_state_row), self.moveRightXCols(last_state_col))]
-                        else:
-                            next_state[key] += [(self.dontMove(last_state_row), self.moveRightXCols(last_state_col))]
-                        pose_up = self.retrpath[key] + [(self.dontMove(last_state_row), self.moveRightXCols(last_state_col))]
-                        action_next = self.actionplan[key] + [self.right()]
-                        self.visited[key].add((self.dontMove(last_state_row), self.moveRightXCols(last_state_col)))
-                        self.agenda[key].addToAgenda(pose_up, self.penalty + heuristic((self.dontMove(last_state_row), self.moveRightXCols(last_state_col)), self.goalpose[key]),action_next)
-                    else:
-                        #print "Currently key is : ", key
-                        if key not in next_state:
-                            #print "Key not there"
-                            next_state[key] = [] + [(self.dontMove(last_state_row), self.moveRightXCols(last_state_col))]
-                            #print "Is Key there now? : ", key in next_state
-                        else:
-                            #print "Key is there"
-                            next_state[key] += [(self.dontMove(last_state_row), self.moveRightXCols(last_state_col))]
-                        pose_up = self.retrpath[key] + [(self.dontMove(last_state_row), self.moveRightXCols(last_state_col))]
-                        action_next = self.actionplan[key] + [self.right()]
-                        self.visited[key].add((self.dontMove(last_state_row), self.moveRightXCols(last_state_col)))
-                        self.agenda[key].addToAgenda(pose_up, heuristic((self.dontMove(last_state_row), self.moveRightXCols(last_state_col)), self.goalpose[key]), action_next)
-                else:  # If next_state has not been filled
-                    next_state[key] = [] + [(self.dontMove(last_state_row), self.moveRightXCols(last_state_col))]
-                    pose_up = self.retrpath[key] + [(self.dontMove(last_state_row), self.moveRightXCols(last_state_col))]
-                    action_next = self.actionplan[key] + [self.right()]
-                    self.visited[key].add((self.dontMove(last_state_row), self.moveRightXCols(last_state_col)))
-                    self.agenda[key].addToAgenda(pose_up, heuristic((self.dontMove(last_state_row), self.moveRightXCols(last_state_col)), self.goalpose[key]),action_next)
-        #print "MoveRight Complete\n\n\n\n"
-        return next_state
-
-    def checkAndMoveLeft(self, last_state_row, last_state_col, key, next_state):
-        # Move Left Conditions
-        if self.dontMove(last_state_row) + 0 >= self.h or self.moveLeftXCols(last_state_col) < 0:
-            #print "Checking MoveLeft, out of bounds"
-            pass  # Do nothing
-        else:
-            if (self.dontMove(last_state_row), self.moveLeftXCols(last_state_col)) in self.visited[key]:  # Check for visited nodes
-                #print "Checking MoveLeft, visited node"
-                pass  # Do nothing
-            else:
-                if next_state:  # If next_state has been filled
-                    #print "next_state is : ",next_state
-                    templist = []
-                    for vals in next_state.values(): # Get a list of tuples
-                        templist += vals # Append to larger list
-                    #print "templist of states", templist
-                    if (self.dontMove(last_state_row), self.moveLeftXCols(last_state_col)) in templist:  # Check for robot clashes
-                        if key not in next_state:
-                            next_state[key] = [] + [(self.dontMove(last_state_row), self.moveLeftXCols(last_state_col))]
-                        else:
-                            next_state[key] += [(self.dontMove(last_state_row), self.moveLeftXCols(last_state_col))]
-                        pose_up = self.retrpath[key] + [(self.dontMove(last_state_row), self.moveLeftXCols(last_state_col))]
-                        action_next = self.actionplan[key] + [self.left()]
-                        self.visited[key].add((self.dontMove(last_state_row), self.moveLeftXCols(last_state_col)))
-                        self.agenda[key].addToAgenda(pose_up, self.penalty + heuristic((self.dontMove(last_state_row), self.moveLeftXCols(last_state_col)), self.goalpose[key]), action_next)
-                    else:
-                        #print "Currently key is : ", key
-                        if key not in next_state:
-                            #print "Key not there"
-                            next_state[key] = [] + [(self.dontMove(last_state_row), self.moveLeftXCols(last_state_col))]
-                            #print "Is Key there now? : ", key in next_state
-                        else:
-                            #print "Key is there"
-                            next_state[key] += [(self.dontMove(last_state_row), self.moveLeftXCols(last_state_col))]
-                        pose_up = self.retrpath[key] + [(self.dontMove(last_state_row), self.moveLeftXCols(last_state_col))]
-                        action_next = self.actionplan[key] + [self.left()]
-                        self.visited[key].add((self.dontMove(last_state_row), self.moveLeftXCols(last_state_col)))
-                        self.agenda[key].addToAgenda(pose_up, heuristic((self.dontMove(last_state_row), self.moveLeftXCols(last_state_col)), self.goalpose[key]), action_next)
-                else:  # If next_state has not been filled
-                    next_state[key] = [] + [(self.dontMove(last_state_row), self.moveLeftXCols(last_state_col))]
-                    pose_up = self.retrpath[key] + [(self.dontMove(last_state_row), self.moveLeftXCols(last_state_col))]
-                    action_next = self.actionplan[key] + [self.left()]
-                    self.visited[key].add((self.dontMove(last_state_row), self.moveLeftXCols(last_state_col)))
-                    self.agenda[key].addToAgenda(pose_up, heuristic((self.dontMove(last_state_row), self.moveLeftXCols(last_state_col)), self.goalpose[key]),action_next)
-        #print "MoveLeft Complete\n\n\n\n"
-        return next_state
+    def checkGoals(self, tasks):
+        '''
+        Raises ValueError if two robots share a goal cell. The 'flowfield', 'decoupled' and 'astar' planners let
+        robots share a station, but the collision-free planners park every robot on its goal, so the others sharing
+        it could never arrive.
+        :param tasks: list of (key, initpose, goalpose)
+        '''
+        clashes = findGoalClashes(tasks)
+        if clashes:
+            raise ValueError('Goals shared by ' + ', '.join(key + ' and ' + other + ' at ' + str(pose)
+                                                            for (key, other, pose) in clashes) +
+                             "; the '" + self.planner + "' planner needs a goal cell per robot")
+
+    def getDeadline(self):
+        '''Returns the time.time() value a plan started now has to end by, or None without a time budget'''
+        if self.timebudget is None:
+            return None
+        return time.time() + self.timebudget / 1000.0
 
-    def plan(self):
+    def loadMap(self, file):
+        """Loads a .gmap or MovingAI .map file, see Simulator.loadMap, and drops the planners' caches of the old map"""
+        Simulator.loadMap(self, file)
+        self.flowfields = None
+        self.spacetime = None
+        self.windowed = None
+
+    def expandNeighbours(self, key, claimed):
         '''
-        :return: retrpath (dictionary of lists of full paths), visited (dictionary of sets of visited nodes), actionplan (dictionary of lists of actions)
+        Puts every move of the move model that is valid from the last pose of robot key on its agenda. A move onto a
+        cell another robot already claimed in this step is heavily penalized.
+        :param claimed: set of the cells the robots move to in this step; the new cells are added to it
         '''
+        (row, col) = self.last_state[key]
+        mask = self.masks[row][col]
+        visited = self.visited[key]
+        goalpose = self.goalpose[key]
+        g = self.a[key][2]
+        parents = self.parents[key]
+        for (bit, action, cost) in self.kernel:
+            if not mask & bit: # Off the grid or onto an obstacle
+                continue
+            pose = (row + action[0], col + action[1])
+            if visited[pose]:
+                continue
+            hc = self.estimate(pose, goalpose)
+            if pose in claimed: # Robot clash
+                hc += self.penalty
+            claimed.add(pose)
+            visited[pose] = 1
+            parents[pose] = (row, col)
+            self.agenda[key].addToAgenda(pose, hc, g + cost)
+
+    def expandNeighboursHooked(self, key, claimed):
+        '''expandNeighbours with a call to self.hooks at every push and clash'''
+        (row, col) = self.last_state[key]
+        mask = self.masks[row][col]
+        visited = self.visited[key]
+        goalpose = self.goalpose[key]
+        g = self.a[key][2]
+        parents = self.parents[key]
+        hooks = self.hooks
+        for (bit, action, cost) in self.kernel:
+            if not mask & bit: # Off the grid or onto an obstacle
+                continue
+            pose = (row + action[0], col + action[1])
+            if visited[pose]:
+                continue
+            hc = self.estimate(pose, goalpose)
+            if pose in claimed: # Robot clash
+                hooks.onClash(pose, key)
+                hc += self.penalty
+            claimed.add(pose)
+            visited[pose] = 1
+            parents[pose] = (row, col)
+            self.agenda[key].addToAgenda(pose, hc, g + cost)
+            hooks.onPush(pose, g + cost + hc, key)
 
+    def plan(self):
+        '''
+        :return: GridPlanner.PlanResult whose path, actions, status and visited are dictionaries by robot key, with
+        one PlanResult per robot in robots; result.astuple() is (retrpath, visited, actionplan), the dictionaries of
+        lists of full paths, of grids of visited nodes and of lists of actions
+        '''
+        started = time.time()
+        self.statistics = {}
+        self.times = OrderedDict()
+        if self.planner == 'decoupled':
+            planned = self.planDecoupled()
+        elif self.planner == 'flowfield':
+            planned = self.planFlowField()
+        elif self.planner == 'cooperative':
+            planned = self.planCooperative()
+        elif self.planner in ('cbs', 'ecbs'):
+            planned = self.planConflictBased()
+        elif self.planner == 'whca':
+            planned = self.planWindowed()
+        else:
+            planned = self.planLockstep()
+        finished = time.time()
+        self.times['search'] = finished - started - sum(self.times.values())
+        (retrpath, visited, actionplan) = planned
+        result = PlanResult({}, {}, {}, {}, planned)
+        for key in self.robot.keys():
+            path = retrpath.get(key, [])
+            status = self.status.get(key) if self.planner != 'flowfield' else None
+            if status is None: # The flow fields either lead to the goal or do not
+                status = FOUND if path else UNREACHABLE
+            robot = PlanResult(path, actionplan.get(key, []), status, visited.get(key))
+            robot.cost = pathCost(path)
+            robot.expanded = self.count.get(key, 0)
+            (robot.pushed, robot.peak, robot.reopened) = self.statistics.get(key, (0, 0, 0))
+            result.path[key] = robot.path
+            result.actions[key] = robot.actions
+            result.status[key] = status
+            result.visited[key] = robot.visited
+            result.addRobot(key, robot)
+        self.times['result'] = time.time() - finished
+        result.times = self.times
+        return result
+
+    def planLockstep(self):
+        '''
+        Plans all robots in lockstep: every step, each robot still searching expands one pose, and a robot may not
+        move onto a cell another robot moved onto in the same step.
+        :return: retrpath, visited and actionplan dictionaries as returned by plan
+        '''
+        started = time.time()
         # Initialize empty dictionaries for all variables we will use
 
+        deadline = self.getDeadline()
+        hooks = self.hooks
+        expandNeighbours = self.expandNeighbours if hooks is None else self.expandNeighboursHooked
+        obstaclegrid = self.getObstacleGrid() # Built once and copied for every robot
+        self.masks = self.moves.computeMasks(obstaclegrid).tolist() # Valid moves from every cell, as bits
+        self.kernel = [(1 << i, (drow, dcol), cost) for (i, (drow, dcol, cost)) in enumerate(self.moves.moves)]
         for key in self.robot.keys():
             self.initpose[key] = self.getRobotCoordinates()[key]
-            self.initaction[key] = [] + [(0,0)]
-            print 'goal_'+str(key[-3:]), key
-            self.goalpose[key] = self.getGoalCoordinates()['goal_'+str(key[-3:])]  # Here I am making the same key refer to goal and robot
+            print goalKey(key), key
+            self.goalpose[key] = self.getGoalCoordinates()[goalKey(key)]  # Here I am making the same key refer to goal and robot
             self.agenda[key] = Agenda()
-            self.visited[key] = {self.initpose[key]}
-            self.visited[key].update(self.obstacles) # Adding obstacles to list of visited points so we won't try to move to these points on map
-            self.initpath[key] = [] + [self.initpose[key]]
-            initcost = heuristic(self.initpose[key], self.goalpose[key])
-            self.agenda[key].addToAgenda(self.initpath[key], initcost, self.initaction[key])
+            self.visited[key] = obstaclegrid.copy() # Obstacles start out closed so we won't try to move to these points on map
+            self.visited[key][self.initpose[key]] = 1
+            self.parents[key] = {self.initpose[key]: None}
+            initcost = self.estimate(self.initpose[key], self.goalpose[key])
+            self.agenda[key].addToAgenda(self.initpose[key], initcost, 0)
+            if hooks is not None:
+                hooks.onPush(self.initpose[key], initcost, key)
             self.count[key] = 0
             self.flag[key] = 0
+            self.status[key] = None
+            self.closest[key] = (initcost, self.initpose[key])
+        self.times['setup'] = time.time() - started
 
         # Now the loop starts
 
         while True:
-            # First, check for exit condition : High number of iterations
-            if any(count >= 10000 for count in self.count.values()):
+            # First, check for exit condition : out of time. Robots still searching keep their best partial path
+            if deadline is not None and time.time() >= deadline:
                 print "Too long to search"
                 print "iterations taken =  " + str(self.count)
-                return {}, self.visited, {}
+                for key in self.robot.keys():
+                    if self.flag[key] == 0:
+                        self.stopAtClosest(key, TIMEOUT)
+                self.setAgendaStatistics()
+                return self.retrpath, self.visited, self.actionplan
 
             # Next, get from agendas if agendas are not empty and check for goal condition
             for key in self.robot.keys():
-                if not self.agenda[key].isEmpty(): # if agenda is not empty
+                if self.flag[key] == 1:
+                    pass
+                elif not self.agenda[key].isEmpty(): # if agenda is not empty
                     self.a[key] = self.agenda[key].getFromAgenda() # a has stored the items on agenda
                     self.count[key] += 1
-                    if self.a[key][1][-1] == self.goalpose[key]: # If reached goal
+                    if hooks is not None:
+                        hooks.onPop(self.a[key][1], self.a[key][0], self.agenda[key].size, key)
+                        hooks.onExpand(self.a[key][1], self.a[key][2], key)
+                    if self.a[key][1] == self.goalpose[key]: # If reached goal
                         print "goal reached for key = ", key
-                        if self.flag[key] == 0: # And flag is 0
-                            self.flag[key] = 1 # Set flag to 1
-                            self.retrpath[key] = self.a[key][1]
-                            lastaction = (self.goalpose[key][0] - self.a[key][1][-2][0], self.goalpose[key][1] - self.a[key][1][-2][1])
-                            self.actionplan[key] = self.a[key][2] + [lastaction]
-                            print "optimal path found"
-                            print "iterations taken = " + str(self.count[key])
-                        # If flag is nonzero, do nothing
-                        elif self.flag[key] == 1:
-                            pass
+                        self.flag[key] = 1 # Set flag to 1
+                        self.status[key] = FOUND
+                        if hooks is not None:
+                            hooks.onGoal(self.goalpose[key], self.count[key], key)
+                        self.retrpath[key] = self.retracePath(key, self.goalpose[key])
+                        self.actionplan[key] = retraceActions(self.retrpath[key])
+                        self.actionplan[key] += [self.actionplan[key][-1]]
+                        print "optimal path found"
+                        print "iterations taken = " + str(self.count[key])
                     else:
-                        pass
-                elif self.agenda[key].isEmpty(): # If no more options, trigger exit condition by setting flag
-                    #print "now agenda is empty"
+                        hc = self.a[key][0] - self.a[key][2] # Includes the clash penalty, so clashing poses are not picked
+                        if hc < self.closest[key][0]:
+                            self.closest[key] = (hc, self.a[key][1])
+                        if self.count[key] >= self.maxiterations: # Out of expansions, this robot stops searching
+                            print "Too long to search for key = ", key
+                            self.stopAtClosest(key, EXHAUSTED)
+                else: # If no more options, trigger exit condition by setting flag
                     self.flag[key] = 1
-                    #print self.flag[key]
+                    self.status[key] = UNREACHABLE
+                    self.retrpath[key] = []
+                    self.actionplan[key] = []
 
             if all(value == 1 for value in self.flag.values()): # If all flags are 1
                 print "Exit condition triggered"
+                self.setAgendaStatistics()
                 return self.retrpath, self.visited, self.actionplan
 
             else:
-                next_state = {} # Initialize empty dictionary of empty states
+                claimed = set() # Cells the robots move to in this step
                 for key in self.robot.keys():
                     if self.flag[key] == 0:
-                        self.retrpath[key] = self.a[key][1]
-                        self.actionplan[key] = self.a[key][2]
-                        last_state_row = self.retrpath[key][-1][0]
-                        last_state_col = self.retrpath[key][-1][1]
-                        self.last_state[key] = (last_state_row, last_state_col)
+                        self.last_state[key] = self.a[key][1]
+                        expandNeighbours(key, claimed)
+
+    def setAgendaStatistics(self):
+        '''Records the pushes and peak size of every robot's agenda; poses are closed when pushed, so none reopen'''
+        for key in self.robot.keys():
+            self.statistics[key] = (self.agenda[key].counter, self.agenda[key].peak, 0)
+
+    def stopAtClosest(self, key, status):
+        '''Ends the search of robot key with the path to the expanded pose closest to its goal'''
+        (hc, pose) = self.closest[key]
+        self.flag[key] = 1
+        self.status[key] = status
+        self.retrpath[key] = self.retracePath(key, pose)
+        self.actionplan[key] = retraceActions(self.retrpath[key])
+        self.actionplan[key] += [self.actionplan[key][-1]]
+
+    def retracePath(self, key, pose):
+        '''Returns the poses robot key moves along from its initial pose to pose, following the parent pointers'''
+        parents = self.parents[key]
+        path = [pose]
+        while parents[path[-1]] is not None:
+            path.append(parents[path[-1]])
+        path.reverse()
+        return path
+
+    def planDecoupled(self):
+        '''
+        Plans every robot on its own, ignoring the other robots, with the independent A* searches run in a pool of
+        worker processes. The obstacle grid is sent to each worker once.
+        :return: retrpath, visited and actionplan dictionaries as returned by plan
+        '''
+        tasks = []
+        for key in self.robot.keys():
+            self.initpose[key] = self.getRobotCoordinates()[key]
+            self.goalpose[key] = self.getGoalCoordinates()[goalKey(key)]
+            tasks.append((key, self.initpose[key], self.goalpose[key], self.maxiterations))
+        # Workers read a loaded binary map from the file rather than each receiving a copy of the grid
+        planned = planParallel(self.mapfile or self.getObstacleGrid(), tasks, self.workers,
+                               self.landmarks or 'euclidean', self.moves, self.getDeadline())
+        for key in planned.keys():
+            (path, visited, count, status, statistics) = planned[key]
+            self.retrpath[key] = path
+            self.visited[key] = visited
+            self.count[key] = count
+            self.status[key] = status
+            self.statistics[key] = statistics
+            self.actionplan[key] = []
+            if path:
+                self.actionplan[key] = retraceActions(path)
+                self.actionplan[key] += [self.actionplan[key][-1]]
+        return self.retrpath, self.visited, self.actionplan
+
+    def planFlowField(self):
+        '''
+        Plans every robot on its own, ignoring the other robots, by following the distance-to-goal field of its goal.
+        A field is computed once per goal and shared by every robot heading there; the cached fields are dropped
+        when the obstacles in occupancies change.
+        :return: retrpath, visited and actionplan dictionaries as returned by plan, where visited is 1 on obstacles and
+        on the cells the goal's field reaches
+        '''
+        if self.flowfields is None:
+            self.flowfields = FlowFields(self.h, self.w)
+        obstaclegrid = self.getObstacleGrid()
+        for key in self.robot.keys():
+            self.initpose[key] = self.getRobotCoordinates()[key]
+            self.goalpose[key] = self.getGoalCoordinates()[goalKey(key)]
+            path = self.flowfields.followField(obstaclegrid, self.initpose[key], self.goalpose[key])
+            (distance, nextstep) = self.flowfields.getField(obstaclegrid, self.goalpose[key])
+            self.retrpath[key] = path
+            self.visited[key] = ((distance >= 0) | (obstaclegrid != 0)).astype(np.uint8)
+            self.count[key] = len(path)
+            self.actionplan[key] = []
+            if path:
+                self.actionplan[key] = retraceActions(path)
+                self.actionplan[key] += [self.actionplan[key][-1]]
+        return self.retrpath, self.visited, self.actionplan
+
+    def planCooperative(self):
+        '''
+        Cooperative A*: robots are planned in the order of their keys, each one in (cell, timestep) space around the
+        cells and moves reserved by the robots before it. The plans have no vertex conflicts (two robots on a cell at
+        the same timestep) and no swap conflicts (two robots trading cells), and robots may wait in place, so paths
+        can hold the same pose several times in a row. Robots not planned within self.timebudget get an empty path.
+        :return: retrpath, visited and actionplan dictionaries as returned by plan
+        '''
+        if self.spacetime is None:
+            self.spacetime = SpaceTimeSearch(self.h, self.w)
+        tasks = []
+        for key in sorted(self.robot.keys()):
+            self.initpose[key] = self.getRobotCoordinates()[key]
+            self.goalpose[key] = self.getGoalCoordinates()[goalKey(key)]
+            tasks.append((key, self.initpose[key], self.goalpose[key]))
+        self.checkGoals(tasks)
+        planned = planCooperative(self.getObstacleGrid(), tasks, self.maxiterations, self.spacetime,
+                                  self.getDeadline())
+        for key in planned.keys():
+            (path, visited, count, status) = planned[key]
+            self.retrpath[key] = path
+            self.visited[key] = visited
+            self.count[key] = count
+            self.status[key] = status
+            self.actionplan[key] = []
+            if path:
+                self.actionplan[key] = retraceActions(path)
+                self.actionplan[key] += [self.actionplan[key][-1]]
+        return self.retrpath, self.visited, self.actionplan
+
+    def planConflictBased(self):
+        '''
+        Conflict-Based Search: robots are planned on their own and replanned under constraints wherever two plans
+        conflict, until no two robots collide. 'cbs' returns plans with the smallest total number of timesteps, 'ecbs'
+        trades up to self.suboptimality times that cost for much faster planning of large fleets.
+        :return: retrpath, visited and actionplan dictionaries as returned by plan; every path is empty if no
+        collision-free plan was found within self.maxiterations per search and self.timebudget, see self.status
+        '''
+        if self.spacetime is None:
+            self.spacetime = SpaceTimeSearch(self.h, self.w)
+        weight = self.suboptimality if self.planner == 'ecbs' else 1.0
+        tasks = []
+        for key in sorted(self.robot.keys()):
+            self.initpose[key] = self.getRobotCoordinates()[key]
+            self.goalpose[key] = self.getGoalCoordinates()[goalKey(key)]
+            tasks.append((key, self.initpose[key], self.goalpose[key]))
+        self.checkGoals(tasks)
+        planned = planConflictBased(self.getObstacleGrid(), tasks, weight, maxiterations=self.maxiterations,
+                                    search=self.spacetime, deadline=self.getDeadline())
+        if not any(planned[key][0] for key in planned):
+            print "No collision-free plan found"
+        for key in planned.keys():
+            (path, visited, count, status) = planned[key]
+            self.retrpath[key] = path
+            self.visited[key] = visited
+            self.count[key] = count
+            self.status[key] = status
+            self.actionplan[key] = []
+            if path:
+                self.actionplan[key] = retraceActions(path)
+                self.actionplan[key] += [self.actionplan[key][-1]]
+        return self.retrpath, self.visited, self.actionplan
+
+    def startWindowed(self, deadline=None):
+        '''
+        Starts moving the robots with Windowed Hierarchical Cooperative A*. Nothing is planned yet; call
+        stepWindowed once per timestep, so that the planning cost of a timestep stays bounded however long the paths.
+        :param deadline: time.time() value after which the robots stop, or None to move them until they arrive
+        :return: retrpath, visited and actionplan dictionaries holding only the initial poses and (0,0) actions
+        '''
+        if self.spacetime is None:
+            self.spacetime = SpaceTimeSearch(self.h, self.w)
+        tasks = []
+        for key in sorted(self.robot.keys()):
+            self.initpose[key] = self.getRobotCoordinates()[key]
+            self.goalpose[key] = self.getGoalCoordinates()[goalKey(key)]
+            tasks.append((key, self.initpose[key], self.goalpose[key]))
+            self.retrpath[key] = [self.initpose[key]]
+            self.actionplan[key] = [(0, 0)]
+        self.checkGoals(tasks)
+        self.windowed = WindowedPlanner(self.getObstacleGrid(), tasks, self.window, self.replanperiod,
+                                        self.maxiterations, 10 * (self.h + self.w), self.spacetime, deadline)
+        for key in self.robot.keys():
+            self.visited[key] = self.windowed.getVisited(key)
+        return self.retrpath, self.visited, self.actionplan
 
-                        next_state = self.checkAndMoveUp(last_state_row, last_state_col, key, next_state)
-                        next_state = self.checkAndMoveDown(last_state_row, last_state_col, key, next_state)
-                        next_state = self.checkAndMoveRight(last_state_row, last_state_col, key, next_state)
-                        next_state = self.checkAndMoveLeft(last_state_row, last_state_col, key, next_state)
+    def stepWindowed(self, retrpath, actionplan):
+        '''
+        Moves every robot one timestep, replanning every self.replanperiod timesteps, and appends the new poses and
+        actions to retrpath and actionplan
+        :return: False once every robot is at its goal
+        '''
+        moves = self.windowed.step()
+        for key in moves.keys():
+            (pose, action) = moves[key]
+            retrpath[key].append(pose)
+            actionplan[key].append(action)
+        return bool(moves)
+
+    def planWindowed(self):
+        '''
+        Runs Windowed Hierarchical Cooperative A* until every robot is at its goal, or until self.timebudget runs out
+        :return: retrpath, visited and actionplan dictionaries as returned by plan; the paths of robots that did not
+        arrive end where they stopped, see self.status
+        '''
+        (retrpath, visited, actionplan) = self.startWindowed(self.getDeadline())
+        while self.stepWindowed(retrpath, actionplan):
+            pass
+        for key in self.robot.keys():
+            self.visited[key] = self.windowed.getVisited(key)
+            self.count[key] = self.windowed.expanded[key]
+            self.status[key] = self.windowed.getStatus(key)
+            self.actionplan[key] = retraceActions(retrpath[key])
+            self.actionplan[key] += [self.actionplan[key][-1]]
+        return self.retrpath, self.visited, self.actionplan
 
 def visualise(sim):
     pygame.init()
@@ -542,7 +834,10 @@ def visualise(sim):
     DISPLAYSURF.fill(WHITE)
     pygame.display.set_caption("Game")
 
-    retrpath, visited, actionplan = sim.plan() # Will be dictionary of lists of tuple
+    if sim.planner == 'whca': # Planned while the robots move, a bounded amount every frame
+        retrpath, visited, actionplan = sim.startWindowed()
+    else:
+        retrpath, visited, actionplan = sim.plan().astuple() # Will be dictionary of lists of tuple
     obstacles = createObstacles(sim.getObjects()) # Will be sprite group
     goals = createGoal(sim.getGoalCoordinates()) # will be sprite group
     robots = createRobot(sim.getRobotCoordinates()) # will be dictionary of sprites
@@ -569,6 +864,8 @@ def visualise(sim):
                 sys.exit()
 
         DISPLAYSURF.fill(WHITE)  # Refresh the screen
+        if sim.planner == 'whca':
+            sim.stepWindowed(retrpath, actionplan)
 
         # Moves and redraws all Sprites
         # First, the static sprites : paths, obstacles and goals
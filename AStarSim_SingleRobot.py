@@ -1,8 +1,11 @@
 import pygame
 from pygame.locals import *
-import random, math, sys
+import random, sys, time
 import numpy as np
 
+from GridPlanner import EXHAUSTED, TIMEOUT, UNREACHABLE, MoveModel, PlanResult, createSearch, getLandmarks, pathCost, \
+    retraceActions
+
 OBSTACLES = 500
 ROWS = 100
 COLUMNS = 100
@@ -22,7 +25,7 @@ class Map:
         self.h = height
         self.w = width
         self.n = numObjects
-        self.occupancies = np.zeros((self.h, self.w))
+        self.occupancies = np.zeros((self.h, self.w), dtype=np.uint8)
         self.obstacles = set()
         self.placeObjects()
 
@@ -36,6 +39,10 @@ class Map:
     def getObjects(self):
         return self.obstacles
 
+    def getObstacleGrid(self):
+        """Returns a uint8 grid, the same shape as occupancies, that is 1 on obstacles and 0 elsewhere"""
+        return (self.occupancies == 1).astype(np.uint8)
+
 def createObstacles(objects):
     obstacles = pygame.sprite.Group()
     for i in objects:
@@ -107,6 +114,14 @@ class AStarSimulator(Map):
         Map.__init__(self, height, width, numObjects)
         self.robot = None
         self.goal = None
+        self.planner = 'astar' # 'astar', 'jps', 'jps8' (Jump Point Search with diagonal moves), 'bidirectional', 'hpa', 'dstar', 'lpa' or 'ara'
+        self.search = None
+        self.landmarks = None # ALT landmark tables used by the 'astar', 'bidirectional' and 'ara' planners
+        self.moves = MoveModel(4) # Moves of the 'astar', 'bidirectional' and 'ara' planners, see useMoves
+        self.hooks = None # SearchHooks of the 'astar' planner, see useHooks
+        self.maxiterations = 1000000 # Expansions allowed per plan
+        self.timebudget = None # Milliseconds allowed per plan, or None for no limit
+        self.status = None # Outcome of the last plan: GridPlanner.FOUND, UNREACHABLE, EXHAUSTED or TIMEOUT
 
     def createGoal(self, h, w, name):
         if not self.goal and self.occupancies[h][w]==0:
@@ -140,9 +155,63 @@ class AStarSimulator(Map):
             print "Cannot create robot at this position"
             return
 
+    def addObstacle(self, h, w):
+        """Puts an obstacle on a free cell; with the 'dstar' planner the next plan only repairs the previous one"""
+        if self.occupancies[h][w] == 0:
+            self.occupancies[h][w] = 1
+            self.obstacles.add((h, w))
+        else:
+            print "Cannot create obstacle at this position"
+
+    def removeObstacle(self, h, w):
+        """Clears an obstacle cell"""
+        if self.occupancies[h][w] == 1:
+            self.occupancies[h][w] = 0
+            self.obstacles.discard((h, w))
+        else:
+            print "No obstacle at this position"
+
     def getMap(self):
         return self.occupancies
 
+    def getSearch(self):
+        """Returns the search object of the selected planner; its buffers are reused by every plan on this map"""
+        if self.search is None or self.search.planner != self.planner:
+            self.search = createSearch(self.planner, self.h, self.w, self.moves)
+            if self.landmarks is not None and self.planner in ('astar', 'bidirectional', 'ara'):
+                self.search.heuristics = self.landmarks
+        self.search.hooks = self.hooks
+        return self.search
+
+    def useLandmarks(self, filename=None, count=8):
+        """
+        Switches the 'astar', 'bidirectional' and 'ara' planners to the ALT landmark heuristic; call again after
+        changing obstacles. The tables are loaded from filename (.npz) if saved there for this map, and saved to it
+        otherwise.
+        """
+        if self.moves.connectivity != 4:
+            raise ValueError('Landmark tables hold 4-connected distances')
+        self.landmarks = getLandmarks(self.getObstacleGrid(), filename, count)
+        self.search = None
+
+    def useMoves(self, connectivity=8, cutcorners=False):
+        """
+        Lets the 'astar', 'bidirectional' and 'ara' planners move diagonally (connectivity 8, at cost sqrt(2)), past
+        obstacle corners if cutcorners is set. The landmark tables only hold for 4-connected moves, so they are
+        dropped.
+        """
+        self.moves = MoveModel(connectivity, cutcorners)
+        if connectivity != 4:
+            self.landmarks = None
+        self.search = None
+
+    def useHooks(self, hooks):
+        """
+        Calls hooks (a GridPlanner.SearchHooks such as a SearchRecorder) at every push, pop, expansion and goal of the
+        'astar' planner; the other planners ignore them. None plans without instrumentation.
+        """
+        self.hooks = hooks
+
     def getRobotCoordinates(self):
         """Returns a dictionary of tuples of robot coordinates"""
         return self.robot
@@ -151,98 +220,76 @@ class AStarSimulator(Map):
         """Returns a dictionary of tuples of goal coordinates"""
         return self.goal
 
+    def getDeadline(self):
+        """Returns the time.time() value a plan started now has to end by, or None without a time budget"""
+        if self.timebudget is None:
+            return None
+        return time.time() + self.timebudget / 1000.0
+
     def plan(self):
         '''
-        :param initpose: A tuple of x and y coordinates of initial pose of robot
-        :param goalpose: A tuple of x and y coordinates of goal of robot
-        :param obstacles: A set containing tuples of x and y coordinates of static obstacles
-        :param robots: A set containing tuples of x and y coordinates of all other robots in the environment
-        :return: Empty list if no path found in 20000 iterations, or Optimal List of coordinates to visit
+        :return: GridPlanner.PlanResult with the list of coordinates to visit, the list of actions, the grid of
+        visited cells and the search statistics; result.astuple() is (retrpath, visited, actionplan). The path is
+        optimal if the status is FOUND (near-optimal with the 'hpa' planner), leads to the cell closest to the goal if self.maxiterations or
+        self.timebudget ran out (EXHAUSTED or TIMEOUT), and is empty if the goal cannot be reached (UNREACHABLE)
         '''
+        started = time.time()
+        deadline = self.getDeadline()
         initpose = self.getRobotCoordinates()['robot_1'] #This is now a dictionary
-        initaction = [] + [(0,0)]
         goalpose = self.getGoalCoordinates()['goal_1'] # This is now a dictionary
-        obs = self.obstacles
-        agenda = Agenda()
-        initcost = heuristic(initpose, goalpose)
-        visited = {initpose}
-        visited.update(obs) # Adding obstacles to list of visited points so we won't try to move to these points on map
-        initpath = [] + [initpose]
-        agenda.addToAgenda(initpath, initcost, initaction)
-        count = 0
-        while True:
-            a = agenda.getFromAgenda()
-            count += 1
-            if count == 1000000:
-                print "Too long to search"
-                print "iterations taken =  " + str(count)
-                return [], visited, []
-            if a[1][-1] == goalpose:
-                retrpath = a[1]
-                lastaction = (goalpose[0] - a[1][-2][0], goalpose[1] - a[1][-2][1])
-                actionplan = a[2] + [lastaction]
-                print "optimal path found"
-                print "iterations taken = " + str(count)
-                return retrpath, visited, actionplan
-            else:
-                retrpath = a[1]
-                actionplan = a[2]
-                last_state_x = retrpath[-1][0]
-                last_state_y = retrpath[-1][1]
-                if last_state_x - 1 < 0 or last_state_y + 0 >= self.w or (
-                        last_state_x - 1, last_state_y + 0) in visited:
-                    pass
-                else:
-                    pose_up = retrpath + [(last_state_x - 1, last_state_y + 0)]
-                    action_next = actionplan + [(-1,0)]
-                    visited.add((last_state_x - 1, last_state_y + 0))
-                    agenda.addToAgenda(pose_up, heuristic((last_state_x - 1, last_state_y + 0), goalpose), action_next)
-
-                if last_state_x + 1 >= self.h or last_state_y + 0 >= self.w or (
-                        last_state_x + 1, last_state_y + 0) in visited:
-                    pass
-                else:
-                    pose_down = retrpath + [(last_state_x + 1, last_state_y + 0)]
-                    action_next = actionplan + [(1, 0)]
-                    visited.add((last_state_x - 1, last_state_y + 0))
-                    agenda.addToAgenda(pose_down, heuristic((last_state_x + 1, last_state_y + 0), goalpose), action_next)
-
-                if last_state_x + 0 >= self.h or last_state_y + 1 >= self.w or (
-                        last_state_x + 0, last_state_y + 1) in visited:
-                    pass
-                else:
-                    pose_right = retrpath + [(last_state_x + 0, last_state_y + 1)]
-                    action_next = actionplan + [(0, 1)]
-                    visited.add((last_state_x + 0, last_state_y + 1))
-                    agenda.addToAgenda(pose_right, heuristic((last_state_x + 0, last_state_y + 1), goalpose), action_next)
-
-                if last_state_x + 0 >= self.h or last_state_y - 1 < 0 or (
-                        last_state_x + 0, last_state_y - 1) in visited:
-                    pass
-                else:
-                    pose_left = retrpath + [(last_state_x + 0, last_state_y - 1)]
-                    action_next = actionplan + [(0, -1)]
-                    visited.add((last_state_x + 0, last_state_y - 1))
-                    agenda.addToAgenda(pose_left, heuristic((last_state_x + 0, last_state_y - 0), goalpose), action_next)
-
-class Agenda:
-    def __init__(self):
-        self.agenda = []
-
-    def addToAgenda(self, path, hc, actionplan):
-        cost = len(path) + hc
-        self.agenda.append([cost, path, actionplan])
-        self.agenda = sorted(self.agenda, key=lambda x: x[0])
-
-    def getFromAgenda(self):
-        return self.agenda.pop(0)
-
-    def isEmpty(self):
-        return not any(self.agenda)
-
-def heuristic(ip, gp):
-    return math.sqrt((ip[0] - gp[0]) ** 2 + (ip[1] - gp[1]) ** 2)
-#    return abs(ip[0]-gp[0]) + abs(ip[1]-gp[1])
+        self.getSearch()
+        obstaclegrid = self.getObstacleGrid()
+        searched = time.time()
+        retrpath = self.search.search(obstaclegrid, initpose, goalpose, self.maxiterations, deadline)
+        finished = time.time()
+        visited = self.search.getVisited(obstaclegrid)
+        self.status = self.search.status
+        if self.status in (EXHAUSTED, TIMEOUT):
+            retrpath = self.search.partialPath()
+            print "Planning budget ran out (" + self.status + "), partial path to the closest cell"
+        actionplan = []
+        if not retrpath:
+            print "goal unreachable" if self.status == UNREACHABLE else "Too long to search"
+            print "iterations taken =  " + str(self.search.count)
+        else:
+            actionplan = retraceActions(retrpath)
+            lastaction = actionplan[-1]
+            actionplan = actionplan + [lastaction]
+            if self.status not in (EXHAUSTED, TIMEOUT):
+                print "near-optimal path found" if self.planner == 'hpa' else "optimal path found"
+            print "iterations taken = " + str(self.search.count)
+        result = PlanResult(retrpath, actionplan, self.status, visited, (retrpath, visited, actionplan))
+        result.cost = pathCost(retrpath)
+        result.setStatistics(self.search)
+        result.times['setup'] = searched - started
+        result.times['search'] = finished - searched
+        result.times['result'] = time.time() - finished
+        return result
+
+    def planAnytime(self):
+        '''
+        With the 'ara' planner (Anytime Repairing A*), yields a first path as soon as one is found with an inflated
+        heuristic, then better paths until the path is optimal or self.maxiterations or self.timebudget runs out; stop
+        iterating to keep the last one.
+        :return: yields (retrpath, actionplan, bound), where the cost of retrpath is at most bound times the optimal
+        '''
+        if self.planner != 'ara':
+            raise ValueError("planAnytime needs sim.planner = 'ara'")
+        search = self.getSearch()
+        deadline = self.getDeadline()
+        for (retrpath, bound) in search.improve(self.getObstacleGrid(), self.getRobotCoordinates()['robot_1'],
+                                                self.getGoalCoordinates()['goal_1'], self.maxiterations, deadline):
+            actionplan = retraceActions(retrpath)
+            yield retrpath, actionplan + [actionplan[-1]], bound
+
+    def planMany(self, pairs):
+        '''
+        Plans many (start, goal) pairs on this map in one call, without printing or changing the occupancies
+        :param pairs: array-like of n pairs ((start row, start col), (goal row, goal col))
+        :return: (poses, offsets) where path i is the int32 (row, col) array poses[offsets[i]:offsets[i + 1]], empty
+        if the pair is out of bounds, on an obstacle or unreachable
+        '''
+        return self.getSearch().searchMany(self.getObstacleGrid(), pairs)
 
 def visualise(sim):
     pygame.init()
@@ -253,7 +300,7 @@ def visualise(sim):
     DISPLAYSURF.fill(WHITE)
     pygame.display.set_caption("Game")
 
-    retrpath, visited, actionplan = sim.plan() # Will be lists of lists of tuples, maybe can make it a dictionary?
+    retrpath, visited, actionplan = sim.plan().astuple() # Will be lists of lists of tuples, maybe can make it a dictionary?
     obstacles = createObstacles(sim.getObjects())
     goals = createGoal(sim.getGoalCoordinates())
     robots = createRobot(sim.getRobotCoordinates())
@@ -307,7 +354,7 @@ for i in range(ROBOTS):
     sim.createGoal(random.randint(0, ROWS-1),random.randint(0, COLUMNS-1), 'goal_'+str(i+1))
 
 # Next, perform sequentially-simultaneous planning of the path for each robot
-retrpath, visited, actionplan = sim.plan()
+retrpath, visited, actionplan = sim.plan().astuple()
 
 # That's it. We have done the required computations. Now all we have to do is display stuff.
 visualise(sim)
@@ -0,0 +1,361 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from GridPlanner import FOUND, createSearch, wavefrontDistances
+from CooperativePlanner import SpaceTimeSearch, WindowedPlanner, planConflictBased, planCooperative
+from MapFiles import readMovingAIMap, readMovingAIScenarios
+
+QUERY_PLANNERS = ['astar', 'jps', 'bidirectional', 'hpa']
+FLEET_PLANNERS = ['cooperative', 'ecbs', 'whca']
+
+
+def randomMap(size, density, seed):
+    '''Returns a size x size uint8 grid whose cells are obstacles (1) with probability density'''
+    return (np.random.RandomState(seed).rand(size, size) < density).astype(np.uint8)
+
+
+def mazeMap(size, seed):
+    '''
+    Returns a size x size uint8 maze with corridors one cell wide, carved by a randomized depth-first search, so there
+    is exactly one path between any two free cells
+    '''
+    rng = np.random.RandomState(seed)
+    grid = np.ones((size, size), dtype=np.uint8)
+    (rows, cols) = ((size - 1) // 2, (size - 1) // 2) # Rooms sit on odd coordinates
+    if rows < 1 or cols < 1:
+        return grid
+    carved = np.zeros((rows, cols), dtype=bool)
+    carved[0, 0] = True
+    grid[1, 1] = 0
+    stack = [(0, 0)]
+    while stack:
+        (row, col) = stack[-1]
+        options = [(row + drow, col + dcol) for (drow, dcol) in ((-1, 0), (1, 0), (0, 1), (0, -1))
+                   if 0 <= row + drow < rows and 0 <= col + dcol < cols and not carved[row + drow, col + dcol]]
+        if not options:
+            stack.pop()
+            continue
+        (nextrow, nextcol) = options[rng.randint(len(options))]
+        carved[nextrow, nextcol] = True
+        grid[2 * nextrow + 1, 2 * nextcol + 1] = 0
+        grid[row + nextrow + 1, col + nextcol + 1] = 0 # The wall between the two rooms
+        stack.append((nextrow, nextcol))
+    return grid
+
+
+def getComponent(obstaclegrid, seed, tries=8):
+    '''
+    Returns the flat cell ids of a large 4-connected component of free cells: the largest of the components of a
+    few random free cells, found with wavefrontDistances
+    '''
+    rng = np.random.RandomState(seed)
+    free = np.flatnonzero(obstaclegrid.ravel() == 0)
+    best = np.zeros(0, dtype=np.int64)
+    for i in range(tries):
+        if not len(free) or len(best) * 2 > len(free):
+            break
+        cell = int(free[rng.randint(len(free))])
+        component = np.flatnonzero(wavefrontDistances(obstaclegrid, divmod(cell, obstaclegrid.shape[1])) >= 0)
+        if len(component) > len(best):
+            best = component
+    return best
+
+
+def samplePairs(obstaclegrid, count, seed, distinct=False):
+    '''
+    Returns count seeded (start, goal) pose pairs in the same component, so that every goal can be reached. With
+    distinct, no two pairs share a start or a goal, as robots of one fleet need.
+    '''
+    component = getComponent(obstaclegrid, seed)
+    w = obstaclegrid.shape[1]
+    rng = np.random.RandomState(seed + 1)
+    if distinct:
+        cells = rng.choice(component, 2 * count, replace=False)
+        (starts, goals) = (cells[:count], cells[count:])
+    else:
+        (starts, goals) = (rng.choice(component, count), rng.choice(component, count))
+    return [(divmod(int(start), w), divmod(int(goal), w)) for (start, goal) in zip(starts, goals)]
+
+
+def getScenarios(quick=False, seed=0):
+    '''
+    :param quick: smaller maps, fewer queries and no 200-robot fleet, for a run of a minute or two
+    :param seed: seed of the first scenario; every scenario gets its own seed derived from it
+    :return: list of scenario dictionaries: name, family ('density', 'size', 'maze' or 'fleet'), size, density, seed
+    and either queries (single-robot families) or robots and repeats (fleet family)
+    '''
+    scenarios = []
+    for density in (0.0, 0.1, 0.2, 0.3, 0.4):
+        scenarios.append({'family': 'density', 'size': 200, 'density': density, 'queries': 10 if quick else 50})
+    for size in (50, 100, 200, 500, 1000, 2000):
+        if quick and size > 200:
+            break
+        queries = 10 if quick else {500: 20, 1000: 10, 2000: 5}.get(size, 50)
+        scenarios.append({'family': 'size', 'size': size, 'density': 0.2, 'queries': queries})
+    for size in (51, 201, 501):
+        if quick and size > 201:
+            break
+        scenarios.append({'family': 'maze', 'size': size, 'density': None, 'queries': 10 if quick else 20})
+    for robots in (1, 20, 200):
+        if quick and robots > 20:
+            break
+        scenarios.append({'family': 'fleet', 'size': 200, 'density': 0.1, 'robots': robots,
+                          'repeats': 1 if quick else 3})
+    for (i, scenario) in enumerate(scenarios):
+        scenario['seed'] = seed + 1000 * i
+        scenario['name'] = '%s-%dx%d' % (scenario['family'], scenario['size'], scenario['size'])
+        if scenario['family'] == 'fleet':
+            scenario['name'] += '-%d-robots' % scenario['robots']
+        elif scenario['family'] != 'maze':
+            scenario['name'] += '-%d%%' % round(100 * scenario['density'])
+    return scenarios
+
+
+def getMovingAIScenarios(files, queries=100):
+    '''
+    Returns one scenario of the 'movingai' family per MovingAI .scen file, planning its first queries start/goal
+    pairs on the .map file it names, looked up next to the .scen file
+    '''
+    scenarios = []
+    for filename in files:
+        mapname = readMovingAIScenarios(filename)['map']
+        scenarios.append({'family': 'movingai', 'name': 'movingai-' + os.path.basename(filename), 'scen': filename,
+                          'map': os.path.join(os.path.dirname(filename), mapname or ''), 'size': None,
+                          'density': None, 'queries': queries, 'seed': 0})
+    return scenarios
+
+
+def getMap(scenario, seed=None):
+    '''Builds the obstacle grid of a scenario; seed overrides the scenario seed'''
+    seed = scenario['seed'] if seed is None else seed
+    if scenario['family'] == 'movingai':
+        return readMovingAIMap(scenario['map'])
+    if scenario['family'] == 'maze':
+        return mazeMap(scenario['size'], seed)
+    return randomMap(scenario['size'], scenario['density'], seed)
+
+
+def getPercentiles(seconds):
+    '''Returns the p50 and p99 of a list of durations, in milliseconds'''
+    if not seconds:
+        return None, None
+    (p50, p99) = np.percentile(np.array(seconds) * 1000.0, [50, 99])
+    return float(p50), float(p99)
+
+
+def runQueries(scenario, planner):
+    '''
+    Plans every query of a single-robot scenario with one search object, the way the simulators reuse it
+    :return: dictionary of metrics
+    '''
+    obstaclegrid = getMap(scenario)
+    if scenario['family'] == 'movingai':
+        pairs = [((startrow, startcol), (goalrow, goalcol)) for (startrow, startcol, goalrow, goalcol) in
+                 readMovingAIScenarios(scenario['scen'])['pairs'][:scenario['queries']].tolist()]
+    else:
+        pairs = samplePairs(obstaclegrid, scenario['queries'], scenario['seed'])
+    (h, w) = obstaclegrid.shape
+    search = createSearch(planner, h, w)
+    latencies = []
+    expanded = 0
+    found = 0
+    for (initpose, goalpose) in pairs:
+        started = time.time()
+        search.search(obstaclegrid, initpose, goalpose, h * w)
+        latencies.append(time.time() - started)
+        expanded += search.count
+        found += search.status == FOUND
+    (p50, p99) = getPercentiles(latencies)
+    return {'queries': len(pairs), 'found': found, 'expanded': expanded, 'seconds': sum(latencies),
+            'expansions_per_second': expanded / sum(latencies) if sum(latencies) > 0 else None,
+            'latency_p50_ms': p50, 'latency_p99_ms': p99}
+
+
+def getArrival(path):
+    '''Returns the timestep at which a robot reaches the last pose of its path for good'''
+    arrival = len(path) - 1
+    while arrival > 0 and path[arrival - 1] == path[-1]:
+        arrival -= 1
+    return max(arrival, 0)
+
+
+def planFleet(obstaclegrid, tasks, planner):
+    '''
+    Plans a fleet with one of the multi-robot planners of CooperativePlanner
+    :return: (arrival timestep by key, or None for robots left without a plan, states expanded)
+    '''
+    (h, w) = obstaclegrid.shape
+    search = SpaceTimeSearch(h, w)
+    if planner == 'whca':
+        windowed = WindowedPlanner(obstaclegrid, tasks, 16, 8, 10000, 10 * (h + w), search)
+        arrival = dict((key, 0) for (key, initpose, goalpose) in tasks)
+        moves = windowed.step()
+        while moves:
+            for key in moves.keys():
+                if moves[key][1] != (0, 0):
+                    arrival[key] = windowed.tick
+            moves = windowed.step()
+        for (key, initpose, goalpose) in tasks: # Robots that cannot reach their goal are given their start as goal
+            if windowed.positions[key] != goalpose[0] * w + goalpose[1]:
+                arrival[key] = None
+        return arrival, sum(windowed.expanded.values())
+    if planner == 'cooperative':
+        planned = planCooperative(obstaclegrid, tasks, search=search)
+    elif planner in ('cbs', 'ecbs'):
+        planned = planConflictBased(obstaclegrid, tasks, 1.5 if planner == 'ecbs' else 1.0, search=search)
+    else:
+        raise ValueError('Unknown fleet planner : ' + str(planner))
+    arrival = {}
+    for (key, initpose, goalpose) in tasks:
+        path = planned[key][0]
+        arrival[key] = getArrival(path) if path and path[-1] == goalpose else None
+    return arrival, sum(planned[key][2] for key in planned)
+
+
+def runFleet(scenario, planner):
+    '''
+    Plans repeats seeded instances of a fleet scenario, each on its own map
+    :return: dictionary of metrics, the makespan and sum of costs being averaged over the instances
+    '''
+    latencies = []
+    makespans = []
+    costs = []
+    expanded = 0
+    solved = 0
+    for repeat in range(scenario['repeats']):
+        seed = scenario['seed'] + repeat
+        obstaclegrid = getMap(scenario, seed)
+        pairs = samplePairs(obstaclegrid, scenario['robots'], seed, distinct=True)
+        tasks = [('robot_%03d' % (i + 1), initpose, goalpose) for (i, (initpose, goalpose)) in enumerate(pairs)]
+        started = time.time()
+        (arrival, count) = planFleet(obstaclegrid, tasks, planner)
+        latencies.append(time.time() - started)
+        expanded += count
+        if all(timestep is not None for timestep in arrival.values()):
+            solved += 1
+            makespans.append(max(arrival.values()))
+            costs.append(sum(arrival.values()))
+    (p50, p99) = getPercentiles(latencies)
+    return {'instances': scenario['repeats'], 'solved': solved, 'expanded': expanded, 'seconds': sum(latencies),
+            'expansions_per_second': expanded / sum(latencies) if sum(latencies) > 0 else None,
+            'latency_p50_ms': p50, 'latency_p99_ms': p99,
+            'makespan': float(np.mean(makespans)) if makespans else None,
+            'sum_of_costs': float(np.mean(costs)) if costs else None}
+
+
+def getPeakMemory():
+    '''Returns the peak resident memory of this process in MB'''
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0 # Bytes on macOS, KB elsewhere
+
+
+def runJob(job):
+    '''Runs one (scenario, planner) pair; meant to run in a fresh process so the peak memory is its own'''
+    (scenario, planner) = job
+    result = dict(scenario)
+    result['planner'] = planner
+    try:
+        if scenario['family'] == 'fleet':
+            result.update(runFleet(scenario, planner))
+        else:
+            result.update(runQueries(scenario, planner))
+    except Exception as error:
+        result['error'] = repr(error)
+    result['peak_memory_mb'] = getPeakMemory()
+    return result
+
+
+def getCommit():
+    '''Returns the git commit of the working tree, or None outside a git checkout'''
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=devnull,
+                                           cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def runBenchmark(scenarios, planners=QUERY_PLANNERS, fleetplanners=FLEET_PLANNERS, verbose=True):
+    '''
+    Runs every planner on every scenario, each (scenario, planner) pair in a fresh worker process
+    :return: dictionary with the commit, the platform and one result dictionary per pair
+    '''
+    jobs = []
+    for scenario in scenarios:
+        for planner in (fleetplanners if scenario['family'] == 'fleet' else planners):
+            jobs.append((scenario, planner))
+    pool = multiprocessing.Pool(1, maxtasksperchild=1)
+    results = []
+    try:
+        for result in pool.imap(runJob, jobs, chunksize=1):
+            results.append(result)
+            if verbose:
+                print formatResult(result)
+    finally:
+        pool.close()
+        pool.join()
+    return {'commit': getCommit(), 'python': platform.python_version(), 'machine': platform.machine(),
+            'processor': platform.processor(), 'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}
+
+
+def formatResult(result):
+    if 'error' in result:
+        return '%-28s %-14s error: %s' % (result['name'], result['planner'], result['error'])
+    line = '%-28s %-14s %10.0f exp/s  p50 %9.2f ms  p99 %9.2f ms  %7.1f MB' % \
+           (result['name'], result['planner'], result['expansions_per_second'] or 0, result['latency_p50_ms'],
+            result['latency_p99_ms'], result['peak_memory_mb'])
+    if result['family'] == 'fleet':
+        line += '  makespan %s  solved %d/%d' % (result['makespan'], result['solved'], result['instances'])
+    return line
+
+
+def compareResults(old, new):
+    '''
+    Prints the ratios new / old of the throughput and latencies of the (scenario, planner) pairs found in both runs
+    :param old: dictionary returned by runBenchmark (or loaded from its JSON file)
+    :param new: same, for the backend or commit being compared
+    '''
+    before = dict(((result['name'], result['planner']), result) for result in old['results'])
+    print '%-28s %-14s %10s %10s %10s %10s' % ('scenario', 'planner', 'exp/s', 'p50', 'p99', 'memory')
+    for result in new['results']:
+        other = before.get((result['name'], result['planner']))
+        if other is None or 'error' in result or 'error' in other:
+            continue
+        ratios = []
+        for field in ('expansions_per_second', 'latency_p50_ms', 'latency_p99_ms', 'peak_memory_mb'):
+            ratios.append('%9.2fx' % (result[field] / other[field]) if result[field] and other[field] else '%10s' % '-')
+        print '%-28s %-14s %s' % (result['name'], result['planner'], ' '.join(ratios))
+
+
+if __name__ == '__main__':
+    '''Seeded, headless planner benchmark; see python Benchmark.py --help'''
+    parser = argparse.ArgumentParser(description='Seeded, headless benchmark of the grid planners')
+    parser.add_argument('--out', default='benchmark.json', help='JSON file the results are written to')
+    parser.add_argument('--quick', action='store_true', help='small maps and fleets only')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the scenarios')
+    parser.add_argument('--families', default='density,size,maze,fleet', help='comma-separated scenario families')
+    parser.add_argument('--planners', default=','.join(QUERY_PLANNERS), help='single-robot planners, see createSearch')
+    parser.add_argument('--fleet-planners', default=','.join(FLEET_PLANNERS), help='cooperative, cbs, ecbs or whca')
+    parser.add_argument('--scen', nargs='+', default=[], help='MovingAI .scen files to add as scenarios')
+    parser.add_argument('--queries', type=int, default=100, help='queries planned from each .scen file')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files and exit')
+    args = parser.parse_args()
+    if args.compare:
+        compareResults(json.load(open(args.compare[0])), json.load(open(args.compare[1])))
+        sys.exit(0)
+    families = args.families.split(',')
+    scenarios = [scenario for scenario in getScenarios(args.quick, args.seed) if scenario['family'] in families]
+    scenarios += getMovingAIScenarios(args.scen, args.queries)
+    report = runBenchmark(scenarios, args.planners.split(','), args.fleet_planners.split(','))
+    with open(args.out, 'w') as output:
+        json.dump(report, output, indent=1, sort_keys=True)
+    print 'Results written to ' + args.out
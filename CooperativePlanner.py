@@ -0,0 +1,852 @@
+import heapq
+import time
+
+import numpy as np
+
+from GridPlanner import EXHAUSTED, FOUND, TIMEOUT, UNREACHABLE, wavefrontDistances
+
+
+class ReservationTable:
+    '''
+    Cells and moves claimed by the robots planned so far, hashed by (cell, timestep). A robot that reaches its goal
+    is parked there for good.
+    '''
+    def __init__(self, size):
+        '''
+        :param size: number of cells of the grid, h * w
+        '''
+        self.size = size
+        self.vertices = {} # t * size + cell -> owner at cell during timestep t
+        self.edges = {} # (t * size + a) * size + b -> owner moving from a to b between timesteps t and t + 1
+        self.parked = {} # cell -> (first timestep, owner) from which the owner stays at cell
+        self.last = {} # cell -> last timestep at which the cell is claimed before anyone parks there
+        self.horizon = 0 # Last timestep of any reservation
+
+    def reserve(self, cells, owner, park=True):
+        '''
+        :param cells: cell ids of the robot at timesteps 0, 1, ... len(cells) - 1
+        :param owner: key of the robot
+        :param park: if True the robot stays at its last cell after the path ends
+        '''
+        size = self.size
+        for (t, cell) in enumerate(cells):
+            self.vertices[t * size + cell] = owner
+            if cell not in self.last or self.last[cell] < t:
+                self.last[cell] = t
+            if t > 0 and cells[t - 1] != cell:
+                self.edges[((t - 1) * size + cells[t - 1]) * size + cell] = owner
+        if park and cells:
+            self.parked[cells[-1]] = (len(cells) - 1, owner)
+        self.horizon = max(self.horizon, len(cells) - 1)
+
+    def vertexFree(self, cell, t):
+        return t * self.size + cell not in self.vertices and not (cell in self.parked and self.parked[cell][0] <= t)
+
+    def edgeFree(self, a, b, t):
+        '''False if moving from a to b between timesteps t and t + 1 swaps places with a reserved robot'''
+        return (t * self.size + b) * self.size + a not in self.edges
+
+    def goalTime(self, cell):
+        '''Returns the first timestep from which a robot can stay at cell for good, or None if someone parks there'''
+        if cell in self.parked:
+            return None
+        return self.last.get(cell, -1) + 1
+
+
+class ConstraintTable:
+    '''
+    Vertices and moves forbidden to one robot by Conflict-Based Search, with the vertexFree, edgeFree and goalTime
+    methods of ReservationTable
+    '''
+    def __init__(self, size, constraints=()):
+        '''
+        :param size: number of cells of the grid, h * w
+        :param constraints: iterable of ('vertex', cell, t), forbidding cell at timestep t, and ('edge', a, b, t),
+        forbidding the move from a to b between timesteps t and t + 1
+        '''
+        self.size = size
+        self.vertices = set()
+        self.edges = set()
+        self.last = {} # cell -> last timestep at which the cell is forbidden
+        self.horizon = 0
+        for constraint in constraints:
+            if constraint[0] == 'vertex':
+                (cell, t) = constraint[1:]
+                self.vertices.add(t * size + cell)
+                self.last[cell] = max(self.last.get(cell, -1), t)
+            else:
+                (a, b, t) = constraint[1:]
+                self.edges.add((t * size + a) * size + b)
+            self.horizon = max(self.horizon, constraint[-1] + 1)
+
+    def vertexFree(self, cell, t):
+        return t * self.size + cell not in self.vertices
+
+    def edgeFree(self, a, b, t):
+        return (t * self.size + a) * self.size + b not in self.edges
+
+    def goalTime(self, cell):
+        return self.last.get(cell, -1) + 1
+
+
+class ConflictTable:
+    '''Counts the other robots met at every (cell, timestep) and move, so that a focal search can steer around them'''
+    def __init__(self, size, paths=()):
+        '''
+        :param size: number of cells of the grid, h * w
+        :param paths: lists of cell ids at every timestep; a robot stays at its last cell afterwards
+        '''
+        self.size = size
+        self.vertices = {} # t * size + cell -> number of robots
+        self.edges = {} # (t * size + a) * size + b -> number of robots moving from a to b after timestep t
+        self.parked = {} # cell -> timesteps from which robots stay at cell
+        self.horizon = 0
+        for cells in paths:
+            self.add(cells)
+
+    def add(self, cells, change=1):
+        '''Counts the path of one more robot; change -1 takes it out again'''
+        size = self.size
+        vertices = self.vertices
+        for (t, cell) in enumerate(cells):
+            key = t * size + cell
+            vertices[key] = vertices.get(key, 0) + change
+            if t > 0 and cells[t - 1] != cell:
+                key = ((t - 1) * size + cells[t - 1]) * size + cell
+                self.edges[key] = self.edges.get(key, 0) + change
+        if cells:
+            if change > 0:
+                self.parked.setdefault(cells[-1], []).append(len(cells) - 1)
+                self.horizon = max(self.horizon, len(cells) - 1)
+            else:
+                self.parked[cells[-1]].remove(len(cells) - 1)
+
+    def remove(self, cells):
+        self.add(cells, -1)
+
+    def conflicts(self, a, b, t):
+        '''Returns the number of robots met by moving from a to b between timesteps t and t + 1'''
+        size = self.size
+        count = self.vertices.get((t + 1) * size + b, 0) + self.edges.get((t * size + b) * size + a, 0)
+        if b in self.parked:
+            count += sum(1 for first in self.parked[b] if first <= t) # From first + 1 on, no longer in vertices
+        return count
+
+class ReverseResumableSearch:
+    '''
+    Exact distances to a goal on a 4-connected grid, ignoring other robots. A* runs from the goal towards the robot's
+    initial cell and is resumed only as far as each query needs, so the distances are cached and never recomputed
+    (Reverse Resumable A*).
+    '''
+    def __init__(self, blocked, h, w, goal, origin):
+        '''
+        :param blocked: flat bytearray indexed by cell id, nonzero on obstacles
+        :param goal: cell id the distances are measured to
+        :param origin: cell id the search heads for first, normally the robot's initial cell
+        '''
+        self.blocked = blocked
+        self.h = h
+        self.w = w
+        (self.row, self.col) = divmod(origin, w)
+        self.g = {goal: 0}
+        self.closed = {} # cell -> exact distance to the goal
+        self.agenda = [(self.estimate(goal), 0, goal)] if not blocked[goal] else []
+
+    def estimate(self, cell):
+        (row, col) = divmod(cell, self.w)
+        return abs(row - self.row) + abs(col - self.col)
+
+    def distance(self, cell):
+        '''Returns the number of moves from cell to the goal, or None if the goal cannot be reached from cell'''
+        if cell in self.closed:
+            return self.closed[cell]
+        (h, w) = (self.h, self.w)
+        blocked = self.blocked
+        g = self.g
+        closed = self.closed
+        agenda = self.agenda
+        while agenda:
+            (f, gcell, current) = heapq.heappop(agenda)
+            if current in closed:
+                continue
+            closed[current] = gcell
+            row = current // w
+            col = current - row * w
+            for (nextcell, inside) in ((current - w, row > 0), (current + w, row < h - 1),
+                                       (current + 1, col < w - 1), (current - 1, col > 0)):
+                if inside and not blocked[nextcell] and nextcell not in closed and \
+                        (nextcell not in g or gcell + 1 < g[nextcell]):
+                    g[nextcell] = gcell + 1
+                    heapq.heappush(agenda, (gcell + 1 + self.estimate(nextcell), gcell + 1, nextcell))
+            if current == cell:
+                return gcell
+        return None
+
+class SpaceTimeSearch:
+    '''
+    A* over (cell, timestep) states of a 4-connected grid, where a robot may also wait in place. It avoids the
+    vertices and moves claimed in a ReservationTable (or any object with the same vertexFree, edgeFree and goalTime
+    methods). The heuristic is the exact distance to the goal ignoring other robots, from a wavefront cached per goal.
+    '''
+    def __init__(self, h, w, maxfields=256):
+        '''
+        :param h: height or number of rows of the grid
+        :param w: width or number of columns of the grid
+        :param maxfields: number of goal distance fields kept
+        '''
+        self.h = h
+        self.w = w
+        self.size = h * w
+        self.maxfields = maxfields
+        self.obstaclegrid = None
+        self.blocked = None
+        self.fields = {} # goal cell -> list of distances to the goal, -1 where the goal cannot be reached
+        self.count = 0 # States expanded by the last search
+        self.closed = set() # States expanded by the last search
+        self.status = None # Outcome of the last search: FOUND, UNREACHABLE, EXHAUSTED or TIMEOUT
+
+    def setMap(self, obstaclegrid):
+        '''Switches to obstaclegrid, dropping the cached distance fields if the obstacles changed'''
+        if self.obstaclegrid is None or not np.array_equal(self.obstaclegrid, obstaclegrid != 0):
+            self.obstaclegrid = np.asarray(obstaclegrid) != 0
+            self.blocked = bytearray(self.obstaclegrid.astype(np.uint8).tobytes())
+            self.fields = {}
+
+    def getDistances(self, goal):
+        distances = self.fields.get(goal)
+        if distances is None:
+            if len(self.fields) >= self.maxfields:
+                self.fields.clear()
+            distances = wavefrontDistances(self.obstaclegrid, divmod(goal, self.w)).tolist()
+            self.fields[goal] = distances
+        return distances
+
+    def searchCells(self, start, goal, table, maxtime=None, maxiterations=1000000, deadline=None):
+        '''
+        :param start: cell id of the robot at timestep 0
+        :param goal: cell id where the robot stays once it arrives
+        :param table: ReservationTable of the robots to avoid
+        :param maxtime: last timestep the robot may arrive at, defaults to the reservation horizon plus the distance
+        to the goal plus h + w
+        :param maxiterations: number of states taken from the agenda before giving up
+        :param deadline: time.time() value after which the search gives up, checked every 64 expansions
+        :return: List of cell ids at timesteps 0, 1, ... ending at the goal, or an empty list if none was found (see
+        self.status)
+        '''
+        h = self.h
+        w = self.w
+        size = self.size
+        blocked = self.blocked
+        distances = self.getDistances(goal)
+        self.closed = closed = set()
+        self.count = 0
+        self.status = UNREACHABLE
+        if distances[start] < 0:
+            return []
+        goaltime = table.goalTime(goal)
+        if goaltime is None:
+            return []
+        if maxtime is None:
+            maxtime = max(table.horizon, goaltime) + distances[start] + h + w
+        # From timestep settled on only parked robots are left, so the world no longer changes: a cell reached then
+        # is never reached sooner by waiting, and a later visit of the same cell is never better
+        settled = max(table.horizon, goaltime) + 1
+        late = set() # Cells reached at or after settled
+        vertexFree = table.vertexFree
+        edgeFree = table.edgeFree
+        parent = {start: -1}
+        # The robot cannot stay at the goal before goaltime, so f is never below it
+        agenda = [(max(distances[start], goaltime), 0, 0, start)] # (f, -t, counter, state); later timesteps win ties
+        counter = 1
+        count = 0
+        while agenda:
+            state = heapq.heappop(agenda)[3]
+            if state in closed:
+                continue
+            closed.add(state)
+            count += 1
+            (t, cell) = divmod(state, size)
+            if cell == goal and t >= goaltime:
+                self.count = count
+                cells = []
+                while state != -1:
+                    cells.append(state % size)
+                    state = parent[state]
+                cells.reverse()
+                self.status = FOUND
+                return cells
+            if count >= maxiterations:
+                self.status = EXHAUSTED
+                break
+            if deadline is not None and not count & 63 and time.time() >= deadline:
+                self.status = TIMEOUT
+                break
+            nt = t + 1
+            if nt > maxtime:
+                continue
+            row = cell // w
+            col = cell - row * w
+            # Up, down, right, left, wait
+            for (nextcell, inside) in ((cell - w, row > 0), (cell + w, row < h - 1),
+                                       (cell + 1, col < w - 1), (cell - 1, col > 0), (cell, True)):
+                if not inside or blocked[nextcell]:
+                    continue
+                nextstate = nt * size + nextcell
+                if nextstate in parent:
+                    continue
+                if nt > settled:
+                    if nextcell in late:
+                        continue
+                    late.add(nextcell)
+                if not vertexFree(nextcell, nt) or not edgeFree(cell, nextcell, t):
+                    continue
+                parent[nextstate] = state
+                heapq.heappush(agenda, (max(nt + distances[nextcell], goaltime), -nt, counter, nextstate))
+                counter += 1
+        self.count = count
+        return []
+
+    def searchWindow(self, start, goal, table, window, distance, maxiterations=1000000, deadline=None):
+        '''
+        Windowed space-time A*: the reservations are only honoured for the next window timesteps, and the rest of the
+        way to the goal is estimated by distance
+        :param table: ReservationTable of the robots to avoid during the window
+        :param window: number of timesteps planned
+        :param distance: function giving the distance from a cell to the goal, or None where it cannot be reached,
+        e.g. ReverseResumableSearch.distance
+        :param deadline: time.time() value after which the best partial path is returned, checked every 64 expansions
+        :return: List of cell ids at timesteps 0, 1, ... that ends at timestep window, or earlier at the goal if the
+        robot can stay there until the end of the window, or earlier still if maxiterations or the deadline ran out
+        (see self.status); an empty list if there is none
+        '''
+        w = self.w
+        h = self.h
+        size = self.size
+        blocked = self.blocked
+        self.closed = closed = set()
+        self.count = 0
+        self.status = UNREACHABLE
+        goaltime = table.goalTime(goal)
+        if goaltime is None:
+            goaltime = window + 1
+        if distance(start) is None:
+            return []
+        vertexFree = table.vertexFree
+        edgeFree = table.edgeFree
+        parent = {start: -1}
+        agenda = [(distance(start), 0, 0, start)] # (f, -t, counter, state)
+        counter = 1
+        count = 0
+        while agenda:
+            state = heapq.heappop(agenda)[3]
+            if state in closed:
+                continue
+            closed.add(state)
+            count += 1
+            (t, cell) = divmod(state, size)
+            if t == window or (cell == goal and t >= goaltime):
+                self.status = FOUND
+            elif count >= maxiterations:
+                self.status = EXHAUSTED
+            elif deadline is not None and not count & 63 and time.time() >= deadline:
+                self.status = TIMEOUT
+            if self.status != UNREACHABLE:
+                self.count = count
+                cells = []
+                while state != -1:
+                    cells.append(state % size)
+                    state = parent[state]
+                cells.reverse()
+                return cells
+            nt = t + 1
+            row = cell // w
+            col = cell - row * w
+            # Up, down, right, left, wait
+            for (nextcell, inside) in ((cell - w, row > 0), (cell + w, row < h - 1),
+                                       (cell + 1, col < w - 1), (cell - 1, col > 0), (cell, True)):
+                if not inside or blocked[nextcell]:
+                    continue
+                nextstate = nt * size + nextcell
+                if nextstate in parent or not vertexFree(nextcell, nt) or not edgeFree(cell, nextcell, t):
+                    continue
+                remaining = distance(nextcell)
+                if remaining is None:
+                    continue
+                parent[nextstate] = state
+                heapq.heappush(agenda, (nt + remaining, -nt, counter, nextstate))
+                counter += 1
+        self.count = count
+        return []
+
+    def searchFocal(self, start, goal, table, avoid, weight=1.0, maxtime=None, maxiterations=1000000, deadline=None):
+        '''
+        Focal search: among the states whose f is within weight times the smallest f on the agenda, the one whose
+        path meets the fewest other robots is expanded first. With weight 1 this is A* breaking ties by conflicts.
+        :param avoid: ConflictTable of the paths of the other robots
+        :param weight: suboptimality bound, at least 1
+        :param deadline: time.time() value after which the search gives up, checked every 64 expansions
+        Other arguments as for searchCells. The outcome is kept in self.status.
+        :return: (cells, lower bound) where cells is as returned by searchCells, its length minus one is at most
+        weight times the lower bound on the arrival timestep
+        '''
+        h = self.h
+        w = self.w
+        size = self.size
+        blocked = self.blocked
+        heappush = heapq.heappush
+        distances = self.getDistances(goal)
+        self.closed = closed = set()
+        self.count = 0
+        self.status = UNREACHABLE
+        goaltime = table.goalTime(goal)
+        if distances[start] < 0 or goaltime is None:
+            return [], 0
+        if maxtime is None:
+            maxtime = max(table.horizon, avoid.horizon, goaltime) + distances[start] + h + w
+        vertexFree = table.vertexFree
+        edgeFree = table.edgeFree
+        conflicts = avoid.conflicts
+        fmin = max(distances[start], goaltime)
+        bound = weight * fmin
+        parent = {start: -1}
+        met = {start: 0} # Robots met on the best known path to each state
+        opencount = {fmin: 1} # f -> number of states on the agenda with that f
+        fvalues = [fmin] # Heap of the f values on the agenda, possibly stale
+        waiting = {} # f -> states above the bound, moved to focal once the bound reaches them
+        focal = [(0, fmin, 0, 0, start)] # (robots met, f, -t, counter, state)
+        counter = 1
+        count = 0
+        while focal:
+            (metsofar, f, negt, c, state) = heapq.heappop(focal)
+            if state in closed or metsofar != met[state]:
+                continue
+            closed.add(state)
+            opencount[f] -= 1
+            count += 1
+            (t, cell) = divmod(state, size)
+            if cell == goal and t >= goaltime:
+                self.count = count
+                cells = []
+                while state != -1:
+                    cells.append(state % size)
+                    state = parent[state]
+                cells.reverse()
+                self.status = FOUND
+                return cells, fmin
+            if count >= maxiterations:
+                self.status = EXHAUSTED
+                break
+            if deadline is not None and not count & 63 and time.time() >= deadline:
+                self.status = TIMEOUT
+                break
+            nt = t + 1
+            row = cell // w
+            col = cell - row * w
+            # Up, down, right, left, wait
+            for (nextcell, inside) in ((cell - w, row > 0), (cell + w, row < h - 1),
+                                       (cell + 1, col < w - 1), (cell - 1, col > 0), (cell, True)):
+                if nt > maxtime or not inside or blocked[nextcell]:
+                    continue
+                nextstate = nt * size + nextcell
+                if nextstate in closed or not vertexFree(nextcell, nt) or not edgeFree(cell, nextcell, t):
+                    continue
+                nextmet = metsofar + conflicts(cell, nextcell, t)
+                nextf = max(nt + distances[nextcell], goaltime)
+                if nextstate in met:
+                    if nextmet >= met[nextstate]:
+                        continue
+                else:
+                    opencount[nextf] = opencount.get(nextf, 0) + 1
+                    heappush(fvalues, nextf)
+                met[nextstate] = nextmet
+                parent[nextstate] = state
+                if nextf <= bound:
+                    heappush(focal, (nextmet, nextf, -nt, counter, nextstate))
+                    counter += 1
+                else:
+                    waiting.setdefault(nextf, []).append(nextstate)
+            while fvalues and opencount[fvalues[0]] == 0:
+                heapq.heappop(fvalues)
+            if fvalues and fvalues[0] > fmin: # Raise the bound and move the states it now covers to focal
+                fmin = fvalues[0]
+                bound = weight * fmin
+                for f in sorted(f for f in waiting if f <= bound):
+                    for state in waiting.pop(f):
+                        if state not in closed:
+                            heappush(focal, (met[state], f, -(state // size), counter, state))
+                            counter += 1
+        self.count = count
+        return [], fmin
+
+    def getVisited(self):
+        '''Returns a uint8 grid that is 1 on obstacles and on the cells expanded, at any timestep, by the last search'''
+        visited = self.obstaclegrid.astype(np.uint8).ravel()
+        visited[[state % self.size for state in self.closed]] = 1
+        return visited.reshape(self.h, self.w)
+
+
+def planCooperative(obstaclegrid, tasks, maxiterations=1000000, search=None, deadline=None):
+    '''
+    Cooperative A*: robots are planned one after the other in the order of tasks, each one in space-time around the
+    vertices and moves reserved by the robots before it, so the plans have no vertex or swap conflicts.
+    :param obstaclegrid: A h x w grid that is nonzero on obstacles
+    :param tasks: list of (key, initpose, goalpose)
+    :param maxiterations: number of states taken from the agenda before giving up, per robot
+    :param search: SpaceTimeSearch to reuse, so its distance fields are kept between calls
+    :param deadline: time.time() value after which the search gives up, or None; the robots not planned by then get
+    an empty path
+    :return: dictionary of key -> (path, visited, states expanded, status) where path holds the pose at every
+    timestep (an empty list if no plan was found), visited is a uint8 grid that is 1 on obstacles and expanded cells
+    and status is FOUND, UNREACHABLE, EXHAUSTED or TIMEOUT
+    '''
+    (h, w) = obstaclegrid.shape
+    if search is None:
+        search = SpaceTimeSearch(h, w)
+    search.setMap(obstaclegrid)
+    table = ReservationTable(h * w)
+    planned = {}
+    for (key, initpose, goalpose) in tasks:
+        if deadline is not None and time.time() >= deadline:
+            planned[key] = ([], search.obstaclegrid.astype(np.uint8), 0, TIMEOUT)
+            continue
+        cells = search.searchCells(initpose[0] * w + initpose[1], goalpose[0] * w + goalpose[1], table,
+                                   maxiterations=maxiterations, deadline=deadline)
+        if cells:
+            table.reserve(cells, key)
+        planned[key] = ([divmod(cell, w) for cell in cells], search.getVisited(), search.count, search.status)
+    return planned
+
+
+class WindowedPlanner:
+    '''
+    Windowed Hierarchical Cooperative A* (WHCA*). Robots only reserve the next window timesteps and the whole fleet is
+    replanned every period timesteps, taking turns at being planned first. Each goal keeps a ReverseResumableSearch
+    as the heuristic beyond the window, so the cost of a replan does not grow with the length of the paths.
+    '''
+    def __init__(self, obstaclegrid, tasks, window=16, period=8, maxiterations=10000, maxsteps=None, search=None,
+                 deadline=None):
+        '''
+        :param obstaclegrid: A h x w grid that is nonzero on obstacles
+        :param tasks: list of (key, initpose, goalpose)
+        :param window: number of timesteps reserved by every robot
+        :param period: number of timesteps between replans, at most window
+        :param maxiterations: number of states taken from the agenda before settling for the best partial plan. A
+        partial plan that ends where the robot cannot wait out the window is searched again without this limit
+        :param maxsteps: number of timesteps after which the robots stop even if some are not at their goal
+        :param search: SpaceTimeSearch to reuse
+        :param deadline: time.time() value after which the robots stop even if some are not at their goal, or None
+        '''
+        (self.h, self.w) = obstaclegrid.shape
+        self.size = self.h * self.w
+        if search is None:
+            search = SpaceTimeSearch(self.h, self.w)
+        search.setMap(obstaclegrid)
+        self.search = search
+        self.window = window
+        self.period = min(period, window)
+        self.maxiterations = maxiterations
+        self.maxsteps = maxsteps
+        self.deadline = deadline
+        self.keys = [key for (key, initpose, goalpose) in tasks]
+        self.positions = dict((key, initpose[0] * self.w + initpose[1]) for (key, initpose, goalpose) in tasks)
+        self.goals = dict((key, goalpose[0] * self.w + goalpose[1]) for (key, initpose, goalpose) in tasks)
+        self.distances = {} # goal cell -> ReverseResumableSearch, shared by the robots heading there
+        self.stranded = set() # Robots that cannot reach their goal, given their start as goal instead
+        for key in self.keys:
+            if deadline is not None and time.time() >= deadline: # The robots will not move anyway
+                break
+            goal = self.goals[key]
+            if goal not in self.distances:
+                self.distances[goal] = ReverseResumableSearch(search.blocked, self.h, self.w, goal,
+                                                              self.positions[key])
+            if self.distances[goal].distance(self.positions[key]) is None: # Cannot get there; it stays
+                self.stranded.add(key)
+                self.goals[key] = self.positions[key]
+                if self.goals[key] not in self.distances:
+                    self.distances[self.goals[key]] = ReverseResumableSearch(search.blocked, self.h, self.w,
+                                                                             self.goals[key], self.goals[key])
+        self.plans = dict((key, []) for key in self.keys) # Cells of every robot for the coming timesteps
+        self.seen = dict((key, set()) for key in self.keys) # Cells expanded by the searches of every robot
+        self.expanded = dict((key, 0) for key in self.keys)
+        self.stuck = set() # Robots whose last window could not avoid the robots planned before them
+        self.tick = 0
+
+    def done(self):
+        if all(self.positions[key] == self.goals[key] for key in self.keys):
+            return True
+        if self.maxsteps is not None and self.tick >= self.maxsteps:
+            return True
+        return self.deadline is not None and time.time() >= self.deadline
+
+    def getStatus(self, key):
+        '''
+        :return: FOUND if robot key is at its goal, UNREACHABLE if it cannot get there, and otherwise TIMEOUT if the
+        deadline passed or EXHAUSTED if the robots are still moving or stopped after maxsteps
+        '''
+        if key in self.stranded:
+            return UNREACHABLE
+        if self.positions[key] == self.goals[key]:
+            return FOUND
+        if self.deadline is not None and time.time() >= self.deadline:
+            return TIMEOUT
+        return EXHAUSTED
+
+    def replan(self):
+        '''Plans the next window of every robot, the first robot changing at every replan'''
+        table = ReservationTable(self.size)
+        first = (self.tick // self.period) % len(self.keys) if self.keys else 0
+        for key in self.keys[first:] + self.keys[:first]:
+            cells = self.planWindow(key, table, self.maxiterations)
+            if cells is None: # Cut short where it cannot wait; search the whole window instead
+                cells = self.planWindow(key, table)
+            if cells is None: # No way around the robots planned before it; its waits may meet them
+                self.stuck.add(key)
+                cells = [self.positions[key]]
+            else:
+                self.stuck.discard(key)
+            cells = cells + [cells[-1]] * (self.window + 1 - len(cells)) # Waits out the window where it ends
+            table.reserve(cells, key, park=False)
+            self.plans[key] = cells[1:]
+
+    def planWindow(self, key, table, maxiterations=1000000):
+        '''
+        Plans the next window of robot key around the reservations in table. A path that ends before the window
+        does, because the search reached the goal or ran out of iterations, is cut back to its longest part whose
+        last cell stays free until the end of the window, so that the robot can wait there.
+        :return: List of cell ids from the robot's position, or None if even staying put meets a reserved robot
+        '''
+        cells = self.search.searchWindow(self.positions[key], self.goals[key], table, self.window,
+                                         self.distances[self.goals[key]].distance, maxiterations, self.deadline)
+        self.expanded[key] += self.search.count
+        self.seen[key].update(state % self.size for state in self.search.closed)
+        cells = cells or [self.positions[key]]
+        for end in range(len(cells), 0, -1):
+            cell = cells[end - 1]
+            if all(table.vertexFree(cell, t) for t in range(end, self.window + 1)):
+                return cells[:end]
+        return None
+
+    def step(self):
+        '''
+        Moves every robot one timestep, replanning first if period timesteps have gone by
+        :return: dictionary of key -> ((row, col) pose after the move, (row, col) action), empty once every robot is
+        at its goal
+        '''
+        if self.done():
+            return {}
+        if self.tick % self.period == 0 or not all(self.plans.values()):
+            self.replan()
+        moves = {}
+        for key in self.keys:
+            (row, col) = divmod(self.positions[key], self.w)
+            self.positions[key] = self.plans[key].pop(0)
+            pose = divmod(self.positions[key], self.w)
+            moves[key] = (pose, (pose[0] - row, pose[1] - col))
+        self.tick += 1
+        return moves
+
+    def getVisited(self, key):
+        '''Returns a uint8 grid that is 1 on obstacles and on the cells expanded by the searches of robot key'''
+        visited = self.search.obstaclegrid.astype(np.uint8).ravel()
+        visited[list(self.seen[key])] = 1
+        return visited.reshape(self.h, self.w)
+
+def findConflicts(paths, first=False):
+    '''
+    :param paths: dictionary of key -> list of cell ids at every timestep; a robot stays at its last cell afterwards
+    :param first: if True, only return the conflict at the earliest timestep
+    :return: list of ('vertex', key1, key2, cell, t), two robots at cell at timestep t, and ('edge', key1, key2, a, b, t),
+    key1 moving from a to b while key2 moves from b to a between timesteps t and t + 1, in order of timestep
+    '''
+    keys = sorted(paths.keys())
+    if not keys:
+        return []
+    n = len(keys)
+    horizon = max(len(paths[key]) for key in keys)
+    positions = np.empty((n, horizon), dtype=np.int64)
+    for (i, key) in enumerate(keys):
+        cells = paths[key]
+        positions[i, :len(cells)] = cells
+        positions[i, len(cells):] = cells[-1]
+    size = int(positions.max()) + 1
+    times = np.arange(horizon, dtype=np.int64)
+    found = []
+
+    # Vertex conflicts: the same (timestep, cell) twice
+    stamps = (positions + times[None, :] * size).T.ravel() # Ordered by timestep, then by robot
+    order = np.argsort(stamps, kind='mergesort')
+    for d in np.flatnonzero(stamps[order][1:] == stamps[order][:-1]):
+        (t, i) = divmod(int(order[d]), n)
+        j = int(order[d + 1]) % n
+        found.append((t, ('vertex', keys[i], keys[j], int(positions[i, t]), t)))
+
+    # Swap conflicts: a move from a to b and a move from b to a between the same timesteps
+    if horizon > 1:
+        a = positions[:, :-1]
+        b = positions[:, 1:]
+        moving = a != b
+        forward = ((times[None, :-1] * size + a) * size + b)[moving]
+        backward = ((times[None, :-1] * size + b) * size + a)[moving]
+        (robots, steps) = np.nonzero(moving)
+        for m in np.flatnonzero(np.in1d(forward, backward)):
+            (i, t) = (int(robots[m]), int(steps[m]))
+            j = int(np.flatnonzero(moving[:, t] & (a[:, t] == b[i, t]) & (b[:, t] == a[i, t]))[0])
+            if i < j:
+                found.append((t, ('edge', keys[i], keys[j], int(a[i, t]), int(b[i, t]), t)))
+
+    found.sort(key=lambda item: item[0])
+    conflicts = [conflict for (t, conflict) in found]
+    return conflicts[:1] if first else conflicts
+
+
+def findGoalClashes(tasks, stays=()):
+    '''
+    Finds the robots that can never all be at their goals at once: robots sharing a goal cell, and robots whose goal
+    is the initial cell of a robot that never leaves it
+    :param tasks: list of (key, initpose, goalpose)
+    :param stays: keys of the robots kept at their initial pose, such as those that cannot reach their goal
+    :return: list of (key, other key, pose) of the robots that both end at pose, empty if every robot has a cell of
+    its own
+    '''
+    owners = {} # Pose where robots end -> their keys
+    for (key, initpose, goalpose) in tasks:
+        owners.setdefault(initpose if key in stays else goalpose, []).append(key)
+    clashes = []
+    for pose in sorted(owners.keys()):
+        keys = owners[pose]
+        clashes.extend((keys[0], other, pose) for other in keys[1:])
+    return clashes
+
+
+def planConflictBased(obstaclegrid, tasks, weight=1.0, maxnodes=10000, maxiterations=100000, search=None,
+                      deadline=None):
+    '''
+    Conflict-Based Search. Every robot is planned on its own; whenever two plans conflict, the constraint tree node is
+    split in two, each child forbidding the conflicting vertex or move to one of the two robots, and only that robot is
+    replanned. With weight 1 the plans are optimal (smallest sum of arrival timesteps); with weight above 1 this is
+    Enhanced CBS, whose low-level and high-level focal searches prefer fewer conflicts and return plans within weight
+    times the optimal cost.
+    :param obstaclegrid: A h x w grid that is nonzero on obstacles
+    :param tasks: list of (key, initpose, goalpose)
+    :param weight: suboptimality bound, at least 1
+    :param maxnodes: number of constraint tree nodes expanded before giving up
+    :param maxiterations: number of states taken from the agenda before giving up, per low-level search
+    :param search: SpaceTimeSearch to reuse, so its distance fields are kept between calls
+    :param deadline: time.time() value after which the search gives up, or None
+    :return: dictionary of key -> (path, visited, states expanded, status); the plans are free of vertex and swap
+    conflicts, or every path is empty if none were found. The status is FOUND, UNREACHABLE if two robots need the
+    same goal cell or no plan exists, EXHAUSTED if maxnodes or maxiterations ran out and TIMEOUT if the deadline
+    passed. A robot that cannot reach its goal is planned to stay at, or come back to, its initial pose, with status
+    UNREACHABLE.
+    '''
+    (h, w) = obstaclegrid.shape
+    size = h * w
+    if search is None:
+        search = SpaceTimeSearch(h, w)
+    search.setMap(obstaclegrid)
+    starts = dict((key, initpose[0] * w + initpose[1]) for (key, initpose, goalpose) in tasks)
+    goals = dict((key, goalpose[0] * w + goalpose[1]) for (key, initpose, goalpose) in tasks)
+    expanded = dict((key, 0) for key in starts)
+    seen = dict((key, set()) for key in starts) # Cells expanded by the low-level searches of each robot
+    planned = dict((key, ([], search.obstaclegrid.astype(np.uint8), 0, UNREACHABLE)) for key in starts)
+
+    def giveUp(status):
+        for key in planned.keys():
+            planned[key] = planned[key][:3] + (status,)
+        return planned
+
+    stranded = []
+    for (key, initpose, goalpose) in tasks:
+        if deadline is not None and time.time() >= deadline:
+            return giveUp(TIMEOUT)
+        if search.getDistances(goals[key])[starts[key]] < 0:
+            stranded.append(key)
+    for key in stranded: # Cannot get there; it stays, stepping aside if needed
+        goals[key] = starts[key]
+    # Two robots parked on one cell always conflict, and the constraint tree would be searched to the end for nothing
+    if findGoalClashes(tasks, stranded):
+        return planned
+
+    # Root: each robot avoids the robots planned before it where it can do so within the bound
+    constraints = dict((key, ()) for key in starts)
+    paths = {}
+    bounds = {}
+    avoid = ConflictTable(size)
+    for (key, initpose, goalpose) in tasks:
+        (cells, bound) = search.searchFocal(starts[key], goals[key], ConstraintTable(size), avoid, weight,
+                                            maxiterations=maxiterations, deadline=deadline)
+        expanded[key] += search.count
+        seen[key].update(state % size for state in search.closed)
+        if not cells:
+            return giveUp(search.status)
+        avoid.add(cells)
+        paths[key] = cells
+        bounds[key] = bound
+
+    # Constraint tree nodes are (cost, lower bound, conflicts, constraints, paths, bounds), referenced by number
+    nodes = {0: (sum(len(cells) - 1 for cells in paths.values()), sum(bounds.values()),
+                 findConflicts(paths), constraints, paths, bounds)}
+    created = 1
+    lowerbounds = [(nodes[0][1], 0)] # Heap of every open node by lower bound
+    pending = [(nodes[0][0], 0)] # Heap of the open nodes not yet in focal, by cost
+    focal = [] # Heap of the open nodes within the bound, by number of conflicts
+    done = set()
+    pruned = False # Whether a child was dropped because its low-level search ran out of iterations
+    while True:
+        if len(done) >= maxnodes:
+            return giveUp(EXHAUSTED)
+        if deadline is not None and time.time() >= deadline:
+            return giveUp(TIMEOUT)
+        while lowerbounds and lowerbounds[0][1] in done:
+            heapq.heappop(lowerbounds)
+        if not lowerbounds:
+            break
+        while pending and pending[0][0] <= weight * lowerbounds[0][0]:
+            (cost, number) = heapq.heappop(pending)
+            heapq.heappush(focal, (len(nodes[number][2]), cost, number))
+        if not focal:
+            break
+        (count, cost, number) = heapq.heappop(focal)
+        (cost, lowerbound, conflicts, constraints, paths, bounds) = nodes.pop(number)
+        done.add(number)
+        if not conflicts:
+            for key in paths.keys():
+                visited = search.obstaclegrid.astype(np.uint8).ravel()
+                visited[list(seen[key])] = 1
+                planned[key] = ([divmod(cell, w) for cell in paths[key]], visited.reshape(h, w), expanded[key],
+                                UNREACHABLE if key in stranded else FOUND)
+            return planned
+        conflict = conflicts[0]
+        if conflict[0] == 'vertex':
+            (kind, key1, key2, cell, t) = conflict
+            children = ((key1, ('vertex', cell, t)), (key2, ('vertex', cell, t)))
+        else:
+            (kind, key1, key2, a, b, t) = conflict
+            children = ((key1, ('edge', a, b, t)), (key2, ('edge', b, a, t)))
+        avoid = ConflictTable(size, paths.values())
+        for (key, constraint) in children:
+            childconstraints = dict(constraints)
+            childconstraints[key] = constraints[key] + (constraint,)
+            avoid.remove(paths[key]) # The replanned robot only counts the others
+            (cells, bound) = search.searchFocal(starts[key], goals[key], ConstraintTable(size, childconstraints[key]),
+                                                avoid, weight, maxiterations=maxiterations, deadline=deadline)
+            avoid.add(paths[key])
+            expanded[key] += search.count
+            seen[key].update(state % size for state in search.closed)
+            if search.status == TIMEOUT:
+                return giveUp(TIMEOUT)
+            if not cells:
+                pruned = pruned or search.status == EXHAUSTED
+                continue
+            childpaths = dict(paths)
+            childpaths[key] = cells
+            childbounds = dict(bounds)
+            childbounds[key] = bound
+            number = created
+            created += 1
+            cost = sum(len(cells) - 1 for cells in childpaths.values())
+            nodes[number] = (cost, sum(childbounds.values()), findConflicts(childpaths), childconstraints,
+                             childpaths, childbounds)
+            heapq.heappush(lowerbounds, (nodes[number][1], number))
+            heapq.heappush(pending, (cost, number))
+    return giveUp(EXHAUSTED if pruned else UNREACHABLE)
@@ -0,0 +1,1361 @@
+import heapq
+import math
+import multiprocessing
+import os
+import time
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+
+# Outcome of the last search, kept in the status attribute of the search object
+FOUND = 'found' # The path reaches the goal
+UNREACHABLE = 'unreachable' # Every reachable cell was expanded without meeting the goal
+EXHAUSTED = 'exhausted' # The expansion budget (maxiterations) ran out first
+TIMEOUT = 'timeout' # The deadline passed first
+
+
+class SearchBuffers:
+    '''Per-cell search state for a grid of h x w cells, kept between searches'''
+    def __init__(self, h, w):
+        '''
+        Cells are numbered row * w + col. The g-score and parent of a cell are only valid when its stamp equals
+        the current generation, so starting a new search is a counter increment instead of clearing the buffers.
+        :param h: height or number of rows of the grid
+        :param w: width or number of columns of the grid
+        '''
+        self.h = h
+        self.w = w
+        self.size = h * w
+        self.g = array('d', [0.0]) * self.size
+        self.parent = array('l', [-1]) * self.size
+        self.seen = array('L', [0]) * self.size # Generation in which the cell was reached
+        self.closed = array('L', [0]) * self.size # Generation in which the cell was expanded
+        self.generation = 0
+
+    def newSearch(self):
+        '''Invalidates the state of the previous search and returns the new generation'''
+        self.generation += 1
+        if self.generation >= 0xffffffff: # Stamps would wrap around; clear them once
+            self.seen = array('L', [0]) * self.size
+            self.closed = array('L', [0]) * self.size
+            self.generation = 1
+        return self.generation
+
+    def getClosedGrid(self):
+        '''Returns a boolean h x w grid of the cells expanded by the current search'''
+        stamps = np.frombuffer(self.closed, dtype=np.dtype(self.closed.typecode))
+        return (stamps == self.generation).reshape(self.h, self.w)
+
+
+class HeuristicFields:
+    '''Heuristic values of every cell for a goal, computed in one vectorized pass and cached by goal cell'''
+    def __init__(self, h, w, kind='euclidean', maxfields=16):
+        '''
+        :param h: height or number of rows of the grid
+        :param w: width or number of columns of the grid
+        :param kind: 'euclidean', 'manhattan' or 'octile'
+        :param maxfields: number of goal fields kept; the least recently used field is evicted first
+        '''
+        if kind not in ('euclidean', 'manhattan', 'octile'):
+            raise ValueError('Unknown heuristic : ' + str(kind))
+        self.h = h
+        self.w = w
+        self.kind = kind
+        self.maxfields = maxfields
+        self.fields = OrderedDict()
+
+    def computeField(self, goalpose):
+        '''Returns an h x w numpy grid of the heuristic distance from every cell to goalpose'''
+        drow = np.abs(np.arange(self.h, dtype=np.float64) - goalpose[0])[:, None]
+        dcol = np.abs(np.arange(self.w, dtype=np.float64) - goalpose[1])[None, :]
+        if self.kind == 'euclidean':
+            return np.sqrt(drow ** 2 + dcol ** 2)
+        elif self.kind == 'manhattan':
+            return drow + dcol
+        return np.maximum(drow, dcol) + (math.sqrt(2) - 1) * np.minimum(drow, dcol)
+
+    def getField(self, goalpose):
+        '''
+        :param goalpose: A tuple of row and column of the goal
+        :return: A flat array('d') of heuristic values indexed by cell id (row * w + col)
+        '''
+        key = goalpose[0] * self.w + goalpose[1]
+        field = self.fields.pop(key, None)
+        if field is None:
+            field = array('d', self.computeField(goalpose).ravel().tobytes())
+            if len(self.fields) >= self.maxfields:
+                self.fields.popitem(last=False)
+        self.fields[key] = field # Most recently used fields are kept at the end
+        return field
+
+
+class MoveModel:
+    '''
+    Table of the moves a robot can make, as (row step, column step, cost), and per-cell masks of which of them are
+    valid on an obstacle grid. With the masks precomputed, expanding a cell is one loop over the table without any
+    bounds or obstacle checks.
+    '''
+    def __init__(self, connectivity=4, cutcorners=False):
+        '''
+        :param connectivity: 4 for up/down/right/left moves at cost 1, 8 to also move diagonally at cost sqrt(2)
+        :param cutcorners: with connectivity 8, allow a diagonal move when one of the two cells beside it is an
+        obstacle; by default both must be free
+        '''
+        if connectivity not in (4, 8):
+            raise ValueError('Unknown connectivity : ' + str(connectivity))
+        self.connectivity = connectivity
+        self.cutcorners = cutcorners
+        self.moves = [(-1, 0, 1.0), (1, 0, 1.0), (0, 1, 1.0), (0, -1, 1.0)] # Up, down, right, left
+        if connectivity == 8:
+            self.moves += [(-1, 1, math.sqrt(2)), (1, 1, math.sqrt(2)), (1, -1, math.sqrt(2)), (-1, -1, math.sqrt(2))]
+        self.heuristic = 'manhattan' if connectivity == 4 else 'octile' # Exact distance on an empty grid
+
+    def computeMasks(self, obstaclegrid):
+        '''
+        :param obstaclegrid: A h x w grid that is nonzero on obstacles
+        :return: h x w uint8 grid whose bit i is set where move i of self.moves stays on the grid and ends on a free
+        cell (and, unless corners may be cut, passes two free cells when diagonal)
+        '''
+        (h, w) = np.shape(obstaclegrid)
+        free = np.zeros((h + 2, w + 2), dtype=bool) # Padded with a blocked border so no move leaves the grid
+        free[1:-1, 1:-1] = np.asarray(obstaclegrid) == 0
+        masks = np.zeros((h, w), dtype=np.uint8)
+        for (i, (drow, dcol, cost)) in enumerate(self.moves):
+            valid = free[1 + drow:h + 1 + drow, 1 + dcol:w + 1 + dcol].copy()
+            if drow and dcol and not self.cutcorners:
+                valid &= free[1 + drow:h + 1 + drow, 1:w + 1] & free[1:h + 1, 1 + dcol:w + 1 + dcol]
+            masks |= valid.astype(np.uint8) << i
+        return masks
+
+    def getKernel(self, w):
+        '''Returns the moves as (mask bit, cell id step, cost) tuples for a grid of width w'''
+        return tuple((1 << i, drow * w + dcol, cost) for (i, (drow, dcol, cost)) in enumerate(self.moves))
+
+
+def wavefrontDistances(obstaclegrid, sourcepose):
+    '''
+    Vectorized breadth-first wavefront over the 4-connected free cells of a grid
+    :param obstaclegrid: A h x w grid that is nonzero on obstacles
+    :param sourcepose: A tuple of row and column the distances are measured from
+    :return: Flat int32 array, indexed by cell id, of the number of moves from sourcepose (-1 where it cannot be reached)
+    '''
+    (h, w) = obstaclegrid.shape
+    free = (np.asarray(obstaclegrid) == 0).ravel()
+    distance = np.full(h * w, -1, dtype=np.int32)
+    frontier = np.array([sourcepose[0] * w + sourcepose[1]], dtype=np.int64)
+    if not free[frontier[0]]:
+        return distance
+    distance[frontier] = 0
+    slot = np.zeros(h * w, dtype=np.int64) # Scratch for dropping duplicates without sorting
+    step = 0
+    while len(frontier):
+        step += 1
+        cols = frontier % w
+        grown = np.concatenate((frontier[frontier >= w] - w, frontier[frontier < (h - 1) * w] + w,
+                                frontier[cols < w - 1] + 1, frontier[cols > 0] - 1))
+        grown = grown[free[grown] & (distance[grown] < 0)]
+        index = np.arange(len(grown))
+        slot[grown] = index # The last write wins, so each cell keeps exactly one of its copies
+        grown = grown[slot[grown] == index]
+        distance[grown] = step
+        frontier = grown
+    return distance
+
+class FlowFields:
+    '''
+    Distance-to-goal and next-step fields of a 4-connected grid, one per goal, computed by a vectorized breadth-first
+    wavefront from the goal. Every robot heading to the same goal follows the same field instead of searching.
+    '''
+    moves = ((-1, 0), (1, 0), (0, 1), (0, -1)) # Up, down, right, left; the next-step field stores an index into this
+
+    def __init__(self, h, w, maxfields=16):
+        '''
+        :param h: height or number of rows of the grid
+        :param w: width or number of columns of the grid
+        :param maxfields: number of goal fields kept; the least recently used field is evicted first
+        '''
+        self.h = h
+        self.w = w
+        self.maxfields = maxfields
+        self.fields = OrderedDict()
+        self.obstaclegrid = None # Obstacles the cached fields were computed on
+        self.count = 0 # Cells reached by the last computed field
+
+    def computeField(self, goalpose):
+        '''
+        :return: (distance, nextstep) h x w grids; distance is the number of moves to goalpose (-1 where the goal
+        cannot be reached) and nextstep the index in moves of the first move towards the goal (-1 where there is none)
+        '''
+        (h, w) = (self.h, self.w)
+        distance = wavefrontDistances(self.obstaclegrid, goalpose).reshape(h, w)
+        padded = np.full((h + 2, w + 2), -1, dtype=np.int32)
+        padded[1:-1, 1:-1] = distance
+        nextstep = np.full((h, w), -1, dtype=np.int8)
+        for (index, (drow, dcol)) in enumerate(self.moves):
+            neighbour = padded[1 + drow:h + 1 + drow, 1 + dcol:w + 1 + dcol]
+            downhill = (nextstep < 0) & (distance > 0) & (neighbour == distance - 1)
+            nextstep[downhill] = index
+        self.count = int((distance >= 0).sum())
+        return distance, nextstep
+
+    def getField(self, obstaclegrid, goalpose):
+        '''
+        :param obstaclegrid: A h x w grid that is nonzero on obstacles. Cached fields are dropped when it differs from
+        the grid they were computed on.
+        :param goalpose: A tuple of row and column of the goal
+        :return: (distance, nextstep) grids as returned by computeField
+        '''
+        if self.obstaclegrid is None or not np.array_equal(self.obstaclegrid, obstaclegrid != 0):
+            self.obstaclegrid = obstaclegrid != 0
+            self.fields.clear()
+        key = goalpose[0] * self.w + goalpose[1]
+        field = self.fields.pop(key, None)
+        if field is None:
+            field = self.computeField(goalpose)
+            if len(self.fields) >= self.maxfields:
+                self.fields.popitem(last=False)
+        self.fields[key] = field # Most recently used fields are kept at the end
+        return field
+
+    def followField(self, obstaclegrid, initpose, goalpose):
+        '''
+        :return: List of poses from initpose to goalpose along the next-step field, or an empty list if the goal
+        cannot be reached
+        '''
+        (distance, nextstep) = self.getField(obstaclegrid, goalpose)
+        pose = tuple(initpose)
+        if distance[pose] < 0:
+            return []
+        path = [pose]
+        while distance[pose] > 0:
+            (drow, dcol) = self.moves[nextstep[pose]]
+            pose = (pose[0] + drow, pose[1] + dcol)
+            path.append(pose)
+        return path
+
+
+class LandmarkFields(HeuristicFields):
+    '''
+    ALT (A*, Landmarks, Triangle inequality) heuristic for 4-connected grids. Exact distances from a few landmark
+    cells are stored once per map, and max over landmarks of |d(L, cell) - d(L, goal)| bounds the distance from a cell
+    to the goal from below. The bounds are only valid on the obstacle grid the tables were computed on.
+    '''
+    def __init__(self, obstaclegrid, landmarks, distances, maxfields=16):
+        '''
+        :param obstaclegrid: A h x w grid that is nonzero on obstacles, the tables were computed on it
+        :param landmarks: list of (row, col) landmark poses
+        :param distances: int32 array of shape (len(landmarks), h * w) of distances from every landmark, -1 where
+        the landmark cannot be reached
+        :param maxfields: number of goal fields kept; the least recently used field is evicted first
+        '''
+        HeuristicFields.__init__(self, obstaclegrid.shape[0], obstaclegrid.shape[1], 'manhattan', maxfields)
+        self.obstaclegrid = np.asarray(obstaclegrid) != 0
+        self.landmarks = [tuple(pose) for pose in landmarks]
+        self.distances = np.asarray(distances, dtype=np.int32).reshape(len(self.landmarks), self.h * self.w)
+
+    def computeField(self, goalpose):
+        '''Returns an h x w numpy grid of the larger of the landmark bound and the Manhattan distance to goalpose'''
+        field = HeuristicFields.computeField(self, goalpose)
+        if not self.landmarks:
+            return field
+        distances = self.distances
+        togoal = distances[:, goalpose[0] * self.w + goalpose[1]][:, None]
+        # A landmark that cannot reach the cell or the goal gives no bound
+        bounds = np.where((distances >= 0) & (togoal >= 0), np.abs(distances - togoal), 0)
+        return np.maximum(field, bounds.max(axis=0).reshape(self.h, self.w))
+
+    def matches(self, obstaclegrid):
+        '''Returns True if the tables were computed on this obstacle grid'''
+        return self.obstaclegrid.shape == np.shape(obstaclegrid) and \
+               np.array_equal(self.obstaclegrid, np.asarray(obstaclegrid) != 0)
+
+    def save(self, filename):
+        '''Writes the landmark tables to filename (numpy .npz format); see loadLandmarks'''
+        np.savez_compressed(filename, shape=np.array(self.obstaclegrid.shape, dtype=np.int64),
+                            obstacles=np.packbits(self.obstaclegrid.ravel()),
+                            landmarks=np.array(self.landmarks, dtype=np.int64).reshape(-1, 2),
+                            distances=self.distances)
+
+
+def computeLandmarks(obstaclegrid, count=8, seed=0):
+    '''
+    Picks landmarks by farthest-point selection, each new landmark being the free cell farthest from the landmarks
+    chosen so far, and computes their distance tables
+    :param obstaclegrid: A h x w grid that is nonzero on obstacles
+    :param count: number of landmarks
+    :param seed: seed of the random free cell the selection starts from
+    :return: LandmarkFields
+    '''
+    obstaclegrid = np.asarray(obstaclegrid)
+    (h, w) = obstaclegrid.shape
+    free = np.flatnonzero(obstaclegrid.ravel() == 0)
+    landmarks = []
+    distances = []
+    if len(free) and count > 0:
+        cell = int(free[np.random.RandomState(seed).randint(len(free))])
+        nearest = wavefrontDistances(obstaclegrid, divmod(cell, w)) # Distance to the closest landmark so far
+        while len(landmarks) < count:
+            cell = int(np.argmax(nearest))
+            if nearest[cell] <= 0 and landmarks:
+                break
+            landmarks.append(divmod(cell, w))
+            distances.append(wavefrontDistances(obstaclegrid, landmarks[-1]))
+            nearest = np.minimum(nearest, distances[-1]) if len(landmarks) > 1 else distances[-1]
+    return LandmarkFields(obstaclegrid, landmarks, np.array(distances, dtype=np.int32).reshape(len(landmarks), h * w))
+
+
+def loadLandmarks(filename, maxfields=16):
+    '''Reads landmark tables written by LandmarkFields.save and returns a LandmarkFields'''
+    data = np.load(filename)
+    (h, w) = [int(size) for size in data['shape']]
+    obstaclegrid = np.unpackbits(data['obstacles'])[:h * w].reshape(h, w)
+    return LandmarkFields(obstaclegrid, data['landmarks'].tolist(), data['distances'], maxfields)
+
+
+def getLandmarks(obstaclegrid, filename=None, count=8):
+    '''
+    Returns landmark tables for obstaclegrid, loaded from filename when it holds tables for the same grid, otherwise
+    computed and, if filename is given, saved there so the next run of the same map skips the preprocessing. count is
+    only used when the tables are computed.
+    '''
+    if filename is not None and os.path.exists(filename):
+        landmarks = loadLandmarks(filename)
+        if landmarks.matches(obstaclegrid):
+            return landmarks
+    landmarks = computeLandmarks(obstaclegrid, count)
+    if filename is not None:
+        landmarks.save(filename)
+    return landmarks
+
+
+class SearchHooks:
+    '''
+    Instrumentation interface of the planners. Subclass it, override the events of interest and install the object
+    with the hooks attribute of a GridSearch or with sim.useHooks. A search without hooks runs a loop that has no
+    calls to them. Poses are (row, col) tuples; key is the robot key in the multi-robot scripts and None otherwise.
+    '''
+    def onPush(self, pose, f, key=None):
+        '''A pose was put on the agenda with cost-plus-heuristic f'''
+        pass
+
+    def onPop(self, pose, f, size, key=None):
+        '''An entry was taken from the agenda, leaving size entries; stale entries are popped too'''
+        pass
+
+    def onExpand(self, pose, g, key=None):
+        '''A pose reached at cost g is expanded'''
+        pass
+
+    def onGoal(self, pose, count, key=None):
+        '''The goal was taken from the agenda after count expansions'''
+        pass
+
+    def onClash(self, pose, key):
+        '''Robot key could not move to pose because another robot moved there in the same step'''
+        pass
+
+
+class SearchRecorder(SearchHooks):
+    '''
+    Hooks that record what the searches did: the order in which cells were expanded, the agenda size after every
+    pop and, every sampleevery pops, the elapsed time
+    '''
+    def __init__(self, h, w, sampleevery=64):
+        '''
+        :param h: height or number of rows of the grid
+        :param w: width or number of columns of the grid
+        :param sampleevery: number of pops between two timing samples
+        '''
+        self.h = h
+        self.w = w
+        self.sampleevery = sampleevery
+        self.reset()
+
+    def reset(self):
+        '''Forgets everything recorded so far and restarts the clock'''
+        self.order = np.full((self.h, self.w), -1, dtype=np.int64) # Expansion index of every cell, -1 if never expanded
+        self.heat = np.zeros((self.h, self.w), dtype=np.int32) # Number of times every cell was expanded
+        self.agendasizes = array('l') # Agenda size after every pop
+        self.samples = [] # (pops, expansions, seconds since reset)
+        self.goals = [] # (key, pose, expansions) of every goal reached
+        self.clashes = [] # (key, pose) of every move refused because of another robot
+        self.pushes = 0
+        self.pops = 0
+        self.expansions = 0
+        self.started = time.time()
+
+    def onPush(self, pose, f, key=None):
+        self.pushes += 1
+
+    def onPop(self, pose, f, size, key=None):
+        self.pops += 1
+        self.agendasizes.append(size)
+        if not self.pops % self.sampleevery:
+            self.samples.append((self.pops, self.expansions, time.time() - self.started))
+
+    def onExpand(self, pose, g, key=None):
+        if self.order[pose] < 0:
+            self.order[pose] = self.expansions
+        self.heat[pose] += 1
+        self.expansions += 1
+
+    def onGoal(self, pose, count, key=None):
+        self.goals.append((key, pose, count))
+
+    def onClash(self, pose, key):
+        self.clashes.append((key, pose))
+
+    def getRate(self):
+        '''Returns the expansions per second between the first and last timing samples, or 0.0 with too few samples'''
+        if len(self.samples) < 2 or self.samples[-1][2] <= self.samples[0][2]:
+            return 0.0
+        return (self.samples[-1][1] - self.samples[0][1]) / (self.samples[-1][2] - self.samples[0][2])
+
+
+class GridSearch:
+    '''A* over a grid of h x w cells, using flat integer cell ids and buffers reused by every search'''
+    def __init__(self, h, w, heuristic='euclidean', maxfields=16, moves=None):
+        '''
+        :param h: height or number of rows of the grid
+        :param w: width or number of columns of the grid
+        :param heuristic: kind of heuristic field, see HeuristicFields, or a HeuristicFields object such as the
+        LandmarkFields of the map
+        :param maxfields: number of goal heuristic fields kept in the cache
+        :param moves: MoveModel of the robot, 4-connected by default
+        '''
+        self.h = h
+        self.w = w
+        self.buffers = SearchBuffers(h, w)
+        if isinstance(heuristic, HeuristicFields):
+            self.heuristics = heuristic
+        else:
+            self.heuristics = HeuristicFields(h, w, heuristic, maxfields)
+        self.moves = moves if moves is not None else MoveModel(4)
+        self.kernel = self.moves.getKernel(w)
+        self.masked = None # Obstacle buffer the masks were computed for
+        self.masks = None
+        self.count = 0 # Iterations taken by the last search
+        self.pushed = 0 # Entries put on the agenda by the last search
+        self.peak = 0 # Largest agenda size of the last search
+        self.reopened = 0 # Cells of the last search reached again at a lower cost
+        self.status = None # FOUND, UNREACHABLE, EXHAUSTED or TIMEOUT
+        self.closest = -1 # Expanded cell of the last search with the lowest heuristic value, see partialPath
+        self.hooks = None # SearchHooks called by searchCells, or None
+
+    def cellId(self, pose):
+        '''Returns the flat cell id of a (row, col) pose, as a Python int even for numpy coordinates'''
+        return int(pose[0]) * self.w + int(pose[1])
+
+    def cellPose(self, cell):
+        return (cell // self.w, cell % self.w)
+
+    def getBlocked(self, obstaclegrid):
+        '''Returns the obstacle grid as a flat bytearray indexed by cell id, nonzero on obstacles'''
+        return bytearray(np.ascontiguousarray(obstaclegrid, dtype=np.uint8).tobytes())
+
+    def search(self, obstaclegrid, initpose, goalpose, maxiterations=1000000, deadline=None):
+        '''
+        :param obstaclegrid: A h x w grid that is nonzero on obstacles
+        :param initpose: A tuple of row and column of the initial pose of the robot
+        :param goalpose: A tuple of row and column of the goal of the robot
+        :param maxiterations: number of nodes taken from the agenda before giving up
+        :param deadline: time.time() value after which the search gives up, or None
+        :return: List of poses from initpose to goalpose, or an empty list if the goal was not reached (see status
+        and partialPath)
+        '''
+        cells = self.searchCells(self.getBlocked(obstaclegrid), self.cellId(initpose), self.cellId(goalpose),
+                                 maxiterations, deadline)
+        return [self.cellPose(cell) for cell in cells]
+
+    def setStatistics(self, count, pushed, peak, reopened):
+        self.count = count
+        self.pushed = pushed
+        self.peak = peak
+        self.reopened = reopened
+
+    def partialPath(self):
+        '''
+        Returns the poses from the initial pose to the expanded cell closest to the goal by the heuristic, as the best
+        path so far of a search that ran out of budget. Only valid until the next search.
+        '''
+        if self.closest < 0:
+            return []
+        return [self.cellPose(cell) for cell in self.retraceCells(self.closest)]
+
+    def getMasks(self, blocked):
+        '''
+        Returns the move masks (see MoveModel.computeMasks) of an obstacle buffer, as a bytearray by cell id. The
+        buffer may also be a read-only flat uint8 array, such as MapFiles.GridMap.blocked, which cannot change and is
+        therefore neither copied nor compared.
+        '''
+        if isinstance(blocked, np.ndarray) and not blocked.flags.writeable:
+            if self.masked is not blocked:
+                self.masked = blocked
+                self.masks = bytearray(self.moves.computeMasks(blocked.reshape(self.h, self.w)).tobytes())
+            return self.masks
+        if isinstance(self.masked, np.ndarray) or self.masked != blocked:
+            self.masked = bytearray(blocked)
+            grid = np.frombuffer(bytes(self.masked), dtype=np.uint8).reshape(self.h, self.w)
+            self.masks = bytearray(self.moves.computeMasks(grid).tobytes())
+        return self.masks
+
+    def searchMany(self, obstaclegrid, pairs, maxiterations=1000000):
+        '''
+        Plans every (start, goal) pair on the same obstacle grid. The obstacle buffer and the bounds and free-cell
+        checks are done once for the whole batch, and pairs are searched grouped by goal so that heuristic fields
+        are reused.
+        :param obstaclegrid: A h x w grid that is nonzero on obstacles
+        :param pairs: array-like of n pairs ((start row, start col), (goal row, goal col)), or of shape (n, 4)
+        :param maxiterations: number of nodes taken from the agenda before giving up, per pair
+        :return: (poses, offsets) where poses is an int32 array of shape (m, 2) holding every path one after the
+        other and path i is poses[offsets[i]:offsets[i + 1]]. Invalid or unreachable pairs get an empty path.
+        '''
+        pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 4)
+        rows = pairs[:, [0, 2]]
+        cols = pairs[:, [1, 3]]
+        valid = ((rows >= 0) & (rows < self.h) & (cols >= 0) & (cols < self.w)).all(axis=1)
+        starts = np.where(valid, pairs[:, 0] * self.w + pairs[:, 1], 0)
+        goals = np.where(valid, pairs[:, 2] * self.w + pairs[:, 3], 0)
+        obstacles = np.asarray(obstaclegrid).ravel() != 0
+        valid &= ~obstacles[starts] & ~obstacles[goals]
+
+        blocked = self.getBlocked(obstaclegrid)
+        paths = [[]] * len(pairs)
+        for i in np.argsort(goals, kind='mergesort'):
+            if valid[i]:
+                paths[i] = self.searchCells(blocked, int(starts[i]), int(goals[i]), maxiterations)
+
+        offsets = np.zeros(len(pairs) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(path) for path in paths])
+        cells = np.fromiter((cell for path in paths for cell in path), dtype=np.int64, count=int(offsets[-1]))
+        poses = np.empty((len(cells), 2), dtype=np.int32)
+        poses[:, 0] = cells // self.w
+        poses[:, 1] = cells % self.w
+        return poses, offsets
+
+    def searchCells(self, blocked, start, goal, maxiterations=1000000, deadline=None):
+        '''
+        :param blocked: flat bytearray indexed by cell id, nonzero on obstacles (see getBlocked), or a read-only flat
+        uint8 array (see getMasks)
+        :param start: cell id of the initial pose of the robot
+        :param goal: cell id of the goal of the robot
+        :param maxiterations: number of nodes taken from the agenda before giving up
+        :param deadline: time.time() value after which the search gives up, checked every 64 expansions
+        :return: List of cell ids from start to goal, or an empty list if the goal was not reached
+        '''
+        if self.hooks is not None:
+            return self.searchCellsHooked(blocked, start, goal, maxiterations, deadline)
+        buffers = self.buffers
+        generation = buffers.newSearch()
+        g = buffers.g
+        parent = buffers.parent
+        seen = buffers.seen
+        closed = buffers.closed
+        hfield = self.heuristics.getField(self.cellPose(goal))
+        masks = self.getMasks(blocked)
+        kernel = self.kernel
+        heappush = heapq.heappush
+        heappop = heapq.heappop
+
+        g[start] = 0.0
+        parent[start] = -1
+        seen[start] = generation
+        agenda = [(hfield[start], 0, start)]
+        counter = 1 # Breaks ties between equal costs first-in first-out
+        count = 0
+        peak = 1 # Largest agenda size
+        reopened = 0
+        nearest = hfield[start]
+        self.closest = start
+        self.status = UNREACHABLE
+        while agenda:
+            cell = heappop(agenda)[2]
+            if closed[cell] == generation: # Stale entry, the cell was already expanded at a lower cost
+                continue
+            closed[cell] = generation
+            count += 1
+            if cell == goal:
+                self.setStatistics(count, counter, peak, reopened)
+                self.status = FOUND
+                self.closest = goal
+                return self.retraceCells(goal)
+            if hfield[cell] < nearest:
+                nearest = hfield[cell]
+                self.closest = cell
+            if count >= maxiterations:
+                self.status = EXHAUSTED
+                break
+            if deadline is not None and not count & 63 and time.time() >= deadline:
+                self.status = TIMEOUT
+                break
+            mask = masks[cell]
+            gcell = g[cell]
+            for (bit, step, cost) in kernel:
+                if not mask & bit:
+                    continue
+                nextcell = cell + step
+                if closed[nextcell] == generation:
+                    continue
+                gnext = gcell + cost
+                if seen[nextcell] != generation:
+                    seen[nextcell] = generation
+                elif gnext < g[nextcell]:
+                    reopened += 1
+                else:
+                    continue
+                g[nextcell] = gnext
+                parent[nextcell] = cell
+                heappush(agenda, (gnext + hfield[nextcell], counter, nextcell))
+                counter += 1
+            if len(agenda) > peak:
+                peak = len(agenda)
+        self.setStatistics(count, counter, peak, reopened)
+        return []
+
+    def searchCellsHooked(self, blocked, start, goal, maxiterations=1000000, deadline=None):
+        '''searchCells with a call to self.hooks at every push, pop, expansion and goal'''
+        hooks = self.hooks
+        w = self.w
+        buffers = self.buffers
+        generation = buffers.newSearch()
+        g = buffers.g
+        parent = buffers.parent
+        seen = buffers.seen
+        closed = buffers.closed
+        hfield = self.heuristics.getField(self.cellPose(goal))
+        masks = self.getMasks(blocked)
+        kernel = self.kernel
+        heappush = heapq.heappush
+        heappop = heapq.heappop
+
+        g[start] = 0.0
+        parent[start] = -1
+        seen[start] = generation
+        agenda = [(hfield[start], 0, start)]
+        hooks.onPush(divmod(start, w), hfield[start])
+        counter = 1
+        count = 0
+        peak = 1
+        reopened = 0
+        nearest = hfield[start]
+        self.closest = start
+        self.status = UNREACHABLE
+        while agenda:
+            (f, tie, cell) = heappop(agenda)
+            pose = divmod(cell, w)
+            hooks.onPop(pose, f, len(agenda))
+            if closed[cell] == generation:
+                continue
+            closed[cell] = generation
+            count += 1
+            hooks.onExpand(pose, g[cell])
+            if cell == goal:
+                self.setStatistics(count, counter, peak, reopened)
+                self.status = FOUND
+                self.closest = goal
+                hooks.onGoal(pose, count)
+                return self.retraceCells(goal)
+            if hfield[cell] < nearest:
+                nearest = hfield[cell]
+                self.closest = cell
+            if count >= maxiterations:
+                self.status = EXHAUSTED
+                break
+            if deadline is not None and not count & 63 and time.time() >= deadline:
+                self.status = TIMEOUT
+                break
+            mask = masks[cell]
+            gcell = g[cell]
+            for (bit, step, cost) in kernel:
+                if not mask & bit:
+                    continue
+                nextcell = cell + step
+                if closed[nextcell] == generation:
+                    continue
+                gnext = gcell + cost
+                if seen[nextcell] != generation:
+                    seen[nextcell] = generation
+                elif gnext < g[nextcell]:
+                    reopened += 1
+                else:
+                    continue
+                g[nextcell] = gnext
+                parent[nextcell] = cell
+                heappush(agenda, (gnext + hfield[nextcell], counter, nextcell))
+                hooks.onPush(divmod(nextcell, w), gnext + hfield[nextcell])
+                counter += 1
+            if len(agenda) > peak:
+                peak = len(agenda)
+        self.setStatistics(count, counter, peak, reopened)
+        return []
+
+    def retraceCells(self, cell):
+        '''Walks the parent buffer from cell back to the start of the current search and returns the cell ids'''
+        parent = self.buffers.parent
+        cells = []
+        while cell != -1:
+            cells.append(cell)
+            cell = parent[cell]
+        cells.reverse()
+        return cells
+
+    def getVisited(self, obstaclegrid):
+        '''Returns a uint8 grid that is 1 on obstacles and on the cells expanded by the last search'''
+        return (self.buffers.getClosedGrid() | (obstaclegrid != 0)).astype(np.uint8)
+
+
+class JumpPointSearch(GridSearch):
+    '''Jump Point Search over a uniform-cost grid, 4-connected or 8-connected without cutting corners'''
+    def __init__(self, h, w, connectivity=4, maxfields=16):
+        '''
+        :param h: height or number of rows of the grid
+        :param w: width or number of columns of the grid
+        :param connectivity: 4 for up/down/left/right moves, 8 to also move diagonally (at cost sqrt(2)) when both
+        cells beside the diagonal are free
+        :param maxfields: number of goal heuristic fields kept in the cache
+        '''
+        if connectivity not in (4, 8):
+            raise ValueError('Unknown connectivity : ' + str(connectivity))
+        GridSearch.__init__(self, h, w, 'manhattan' if connectivity == 4 else 'octile', maxfields)
+        self.connectivity = connectivity
+        self.blocked = None
+        self.goal = None
+        self.jumps = {} # Results of straight jumps in the current search, by cell and direction
+
+    def isFree(self, row, col):
+        return 0 <= row < self.h and 0 <= col < self.w and not self.blocked[row * self.w + col]
+
+    def jump(self, row, col, drow, dcol):
+        '''
+        Moves from (row, col) in direction (drow, dcol) until a jump point, the goal or a dead end
+        :return: cell id of the jump point, or None if the direction leads nowhere useful
+        '''
+        if not (drow and dcol):
+            return self.jumpStraight(row, col, drow, dcol)
+        free = self.isFree
+        while True:
+            if not free(row, col):
+                return None
+            cell = row * self.w + col
+            if cell == self.goal:
+                return cell
+            # A diagonal cell is a jump point if a straight jump from it finds one
+            if self.jumpStraight(row, col + dcol, 0, dcol) is not None or self.jumpStraight(row + drow, col, drow, 0) is not None:
+                return cell
+            if not (free(row, col + dcol) and free(row + drow, col)):
+                return None # Would cut a corner
+            row += drow
+            col += dcol
+
+    def jumpStraight(self, row, col, drow, dcol):
+        '''
+        Straight part of jump. Every cell passed on the way leads to the same result, so they are all remembered
+        for the rest of the search; diagonal jumps and vertical scans keep asking about the same rows and columns.
+        '''
+        free = self.isFree
+        direction = (drow + 1) * 3 + dcol + 1
+        scanned = []
+        result = None
+        while free(row, col):
+            cell = row * self.w + col
+            known = self.jumps.get(cell * 9 + direction, -2)
+            if known != -2:
+                result = None if known == -1 else known
+                break
+            scanned.append(cell)
+            if cell == self.goal:
+                result = cell
+                break
+            if dcol: # Horizontal; a jump point if there is a forced neighbour above or below
+                if (free(row - 1, col) and not free(row - 1, col - dcol)) or (
+                        free(row + 1, col) and not free(row + 1, col - dcol)):
+                    result = cell
+                    break
+            else: # Vertical
+                if (free(row, col - 1) and not free(row - drow, col - 1)) or (
+                        free(row, col + 1) and not free(row - drow, col + 1)):
+                    result = cell
+                    break
+                if self.connectivity == 4 and (self.jumpStraight(row, col + 1, 0, 1) is not None or
+                                               self.jumpStraight(row, col - 1, 0, -1) is not None):
+                    result = cell # Without diagonal moves, turns are only found by looking sideways
+                    break
+            row += drow
+            col += dcol
+        known = -1 if result is None else result
+        for cell in scanned:
+            self.jumps[cell * 9 + direction] = known
+        return result
+
+    def prunedNeighbours(self, cell, parentcell):
+        '''Returns the (drow, dcol) directions worth jumping in from cell, given the cell it was reached from'''
+        free = self.isFree
+        (row, col) = self.cellPose(cell)
+        directions = []
+        if parentcell == -1:
+            for (drow, dcol) in ((-1, 0), (1, 0), (0, 1), (0, -1)):
+                if free(row + drow, col + dcol):
+                    directions.append((drow, dcol))
+            if self.connectivity == 8:
+                for (drow, dcol) in ((-1, -1), (-1, 1), (1, -1), (1, 1)):
+                    if free(row + drow, col) and free(row, col + dcol):
+                        directions.append((drow, dcol))
+            return directions
+        (parentrow, parentcol) = self.cellPose(parentcell)
+        drow = (row > parentrow) - (row < parentrow)
+        dcol = (col > parentcol) - (col < parentcol)
+        if drow and dcol:
+            if free(row + drow, col):
+                directions.append((drow, 0))
+            if free(row, col + dcol):
+                directions.append((0, dcol))
+            if free(row + drow, col) and free(row, col + dcol):
+                directions.append((drow, dcol))
+        elif dcol:
+            if free(row, col + dcol):
+                directions.append((0, dcol))
+            for side in (-1, 1):
+                if free(row + side, col):
+                    directions.append((side, 0))
+                    if self.connectivity == 8 and free(row, col + dcol):
+                        directions.append((side, dcol))
+        else:
+            if free(row + drow, col):
+                directions.append((drow, 0))
+            for side in (-1, 1):
+                if free(row, col + side):
+                    directions.append((0, side))
+                    if self.connectivity == 8 and free(row + drow, col):
+                        directions.append((drow, side))
+        return directions
+
+    def searchCells(self, blocked, start, goal, maxiterations=1000000, deadline=None):
+        '''
+        Same interface as GridSearch.searchCells; the returned path has the cells between jump points filled in
+        '''
+        self.blocked = blocked
+        self.goal = goal
+        self.jumps = {}
+        buffers = self.buffers
+        generation = buffers.newSearch()
+        g = buffers.g
+        parent = buffers.parent
+        seen = buffers.seen
+        closed = buffers.closed
+        hfield = self.heuristics.getField(self.cellPose(goal))
+        diagonal = math.sqrt(2)
+
+        g[start] = 0.0
+        parent[start] = -1
+        seen[start] = generation
+        agenda = [(hfield[start], 0.0, 0, start)]
+        counter = 1 # Equal costs go to the deepest jump point first, then first-in first-out
+        count = 0
+        peak = 1 # Largest agenda size
+        reopened = 0
+        nearest = hfield[start]
+        self.closest = start
+        self.status = UNREACHABLE
+        while agenda:
+            cell = heapq.heappop(agenda)[3]
+            if closed[cell] == generation:
+                continue
+            closed[cell] = generation
+            count += 1
+            if cell == goal:
+                self.setStatistics(count, counter, peak, reopened)
+                self.status = FOUND
+                self.closest = goal
+                return self.fillPath(self.retraceCells(goal))
+            if hfield[cell] < nearest:
+                nearest = hfield[cell]
+                self.closest = cell
+            if count >= maxiterations:
+                self.status = EXHAUSTED
+                break
+            if deadline is not None and not count & 63 and time.time() >= deadline:
+                self.status = TIMEOUT
+                break
+            (row, col) = self.cellPose(cell)
+            for (drow, dcol) in self.prunedNeighbours(cell, parent[cell]):
+                nextcell = self.jump(row + drow, col + dcol, drow, dcol)
+                if nextcell is None or closed[nextcell] == generation:
+                    continue
+                steps = max(abs(nextcell // self.w - row), abs(nextcell % self.w - col))
+                gnext = g[cell] + (steps * diagonal if drow and dcol else steps)
+                if seen[nextcell] != generation:
+                    seen[nextcell] = generation
+                elif gnext < g[nextcell]:
+                    reopened += 1
+                else:
+                    continue
+                g[nextcell] = gnext
+                parent[nextcell] = cell
+                heapq.heappush(agenda, (gnext + hfield[nextcell], -gnext, counter, nextcell))
+                counter += 1
+            if len(agenda) > peak:
+                peak = len(agenda)
+        self.setStatistics(count, counter, peak, reopened)
+        return []
+
+    def partialPath(self):
+        if self.closest < 0:
+            return []
+        return [self.cellPose(cell) for cell in self.fillPath(self.retraceCells(self.closest))]
+
+    def fillPath(self, jumppoints):
+        '''Returns the cell ids along the straight or diagonal segments joining consecutive jump points'''
+        cells = jumppoints[:1]
+        for i in range(1, len(jumppoints)):
+            (row, col) = self.cellPose(jumppoints[i - 1])
+            (nextrow, nextcol) = self.cellPose(jumppoints[i])
+            drow = (nextrow > row) - (nextrow < row)
+            dcol = (nextcol > col) - (nextcol < col)
+            while (row, col) != (nextrow, nextcol):
+                row += drow
+                col += dcol
+                cells.append(row * self.w + col)
+        return cells
+
+
+class BidirectionalSearch(GridSearch):
+    '''A* run from the start and from the goal at once, stopping once the two frontiers have met'''
+    def __init__(self, h, w, heuristic='euclidean', maxfields=16, moves=None):
+        '''
+        Same arguments as GridSearch. The search from the goal keeps its own buffers in self.backward; every move
+        model is symmetric, so it expands with the same masks.
+        '''
+        GridSearch.__init__(self, h, w, heuristic, maxfields, moves)
+        self.backward = SearchBuffers(h, w)
+
+    def searchCells(self, blocked, start, goal, maxiterations=1000000, deadline=None):
+        '''
+        Same interface as GridSearch.searchCells. Each step expands the side with the smaller agenda. Every time a
+        cell is reached from both sides, the path through it is a candidate; the best candidate is optimal once it
+        costs no more than the lowest f-score left on either agenda, because any other path has to leave through
+        both frontiers.
+        '''
+        masks = self.getMasks(blocked)
+        kernel = self.kernel
+        heappush = heapq.heappush
+        heappop = heapq.heappop
+        sides = []
+        for (buffers, root, target) in ((self.buffers, start, goal), (self.backward, goal, start)):
+            generation = buffers.newSearch()
+            buffers.g[root] = 0.0
+            buffers.parent[root] = -1
+            buffers.seen[root] = generation
+            hfield = self.heuristics.getField(self.cellPose(target))
+            sides.append((buffers, generation, hfield, [(hfield[root], 0, root)]))
+        (forward, backward) = sides
+        best = float('inf')
+        meet = start if start == goal else -1
+        counter = 1
+        count = 0
+        peak = 1 # Largest agenda size
+        reopened = 0
+        nearest = forward[2][start]
+        self.closest = start # Only the search from the start gives partial paths
+        self.status = UNREACHABLE
+        while True:
+            for (buffers, generation, hfield, agenda) in sides: # Drop entries of cells expanded since they were pushed
+                while agenda and buffers.closed[agenda[0][2]] == generation:
+                    heappop(agenda)
+            if not forward[3] or not backward[3] or meet == start:
+                break
+            if best <= max(forward[3][0][0], backward[3][0][0]):
+                break
+            if count >= maxiterations:
+                self.status = EXHAUSTED
+                break
+            if deadline is not None and not count & 63 and time.time() >= deadline:
+                self.status = TIMEOUT
+                break
+            if len(forward[3]) <= len(backward[3]):
+                (side, other) = (forward, backward)
+            else:
+                (side, other) = (backward, forward)
+            (buffers, generation, hfield, agenda) = side
+            g = buffers.g
+            parent = buffers.parent
+            seen = buffers.seen
+            closed = buffers.closed
+            othergeneration = other[1]
+            otherg = other[0].g
+            otherseen = other[0].seen
+            cell = heappop(agenda)[2]
+            closed[cell] = generation
+            count += 1
+            if side is forward and hfield[cell] < nearest:
+                nearest = hfield[cell]
+                self.closest = cell
+            mask = masks[cell]
+            gcell = g[cell]
+            for (bit, step, cost) in kernel:
+                if not mask & bit:
+                    continue
+                nextcell = cell + step
+                if closed[nextcell] == generation:
+                    continue
+                gnext = gcell + cost
+                if seen[nextcell] != generation:
+                    seen[nextcell] = generation
+                elif gnext < g[nextcell]:
+                    reopened += 1
+                else:
+                    continue
+                g[nextcell] = gnext
+                parent[nextcell] = cell
+                heappush(agenda, (gnext + hfield[nextcell], counter, nextcell))
+                counter += 1
+                if otherseen[nextcell] == othergeneration and gnext + otherg[nextcell] < best:
+                    best = gnext + otherg[nextcell]
+                    meet = nextcell
+            if len(forward[3]) + len(backward[3]) > peak:
+                peak = len(forward[3]) + len(backward[3])
+        self.setStatistics(count, counter + 1, peak, reopened) # Both roots were pushed
+        if meet == -1:
+            return []
+        self.status = FOUND
+        cells = self.retraceCells(meet)
+        parent = self.backward.parent
+        cell = parent[meet]
+        while cell != -1:
+            cells.append(cell)
+            cell = parent[cell]
+        return cells
+
+    def getVisited(self, obstaclegrid):
+        '''Returns a uint8 grid that is 1 on obstacles and on the cells expanded from either side'''
+        closed = self.buffers.getClosedGrid() | self.backward.getClosedGrid()
+        return (closed | (obstaclegrid != 0)).astype(np.uint8)
+
+
+class AnytimeSearch(GridSearch):
+    '''
+    Anytime Repairing A* (ARA*). A first path is found quickly with the heuristic inflated by epsilon, then epsilon is
+    lowered towards 1 round after round. Each round keeps the g-scores of the previous ones and only expands again
+    the cells whose g-score improved, so the earlier effort is reused.
+    '''
+    def __init__(self, h, w, heuristic='euclidean', maxfields=16, moves=None, epsilon=3.0, decrement=0.5):
+        '''
+        Same arguments as GridSearch, and
+        :param epsilon: inflation of the heuristic in the first round
+        :param decrement: amount epsilon is lowered by after every round
+        '''
+        GridSearch.__init__(self, h, w, heuristic, maxfields, moves)
+        self.epsilon = epsilon
+        self.decrement = decrement
+        self.rounds = array('L', [0]) * (h * w) # Round in which the cell was last expanded
+        self.round = 0
+        self.bound = float('inf') # Suboptimality bound of the last path found
+
+    def improve(self, obstaclegrid, initpose, goalpose, maxiterations=1000000, deadline=None):
+        '''
+        Same as improveCells, with poses
+        :return: yields (list of poses from initpose to goalpose, bound)
+        '''
+        for (cells, bound) in self.improveCells(self.getBlocked(obstaclegrid), self.cellId(initpose),
+                                                self.cellId(goalpose), maxiterations, deadline):
+            yield [self.cellPose(cell) for cell in cells], bound
+
+    def improveCells(self, blocked, start, goal, maxiterations=1000000, deadline=None):
+        '''
+        Generator of better and better paths; no other search may run on this object until it is exhausted
+        :param maxiterations: number of nodes expanded over all rounds before giving up
+        :param deadline: time.time() value after which no more rounds are run
+        :return: yields (cell ids from start to goal, bound) every time a round found a better path or a tighter bound,
+        where the cost of the path is at most bound times the optimal cost. Stops once the path is proven optimal.
+        '''
+        buffers = self.buffers
+        generation = buffers.newSearch()
+        g = buffers.g
+        parent = buffers.parent
+        seen = buffers.seen
+        closed = buffers.closed
+        rounds = self.rounds
+        hfield = self.heuristics.getField(self.cellPose(goal))
+        masks = self.getMasks(blocked)
+        kernel = self.kernel
+        heappush = heapq.heappush
+        heappop = heapq.heappop
+
+        epsilon = max(self.epsilon, 1.0)
+        g[start] = 0.0
+        parent[start] = -1
+        seen[start] = generation
+        agenda = [(epsilon * hfield[start], 0, start, 0.0)] # (f, counter, cell, g when pushed)
+        inconsistent = set() # Cells whose g-score improved after they were expanded in the current round
+        counter = 1
+        count = 0
+        peak = 1 # Largest agenda size
+        reopened = 0
+        self.count = 0
+        self.bound = float('inf')
+        best = float('inf') # Cost of the last path reported
+        nearest = hfield[start]
+        self.closest = start
+        self.status = UNREACHABLE
+        while True:
+            self.round += 1
+            current = self.round
+            while agenda:
+                (f, tie, cell, gcell) = agenda[0]
+                if gcell != g[cell] or rounds[cell] == current: # Stale entry
+                    heappop(agenda)
+                    continue
+                if seen[goal] == generation and g[goal] <= f:
+                    break
+                if count >= maxiterations:
+                    self.status = EXHAUSTED
+                    break
+                if deadline is not None and not count & 63 and time.time() >= deadline:
+                    self.status = TIMEOUT
+                    break
+                heappop(agenda)
+                rounds[cell] = current
+                closed[cell] = generation
+                count += 1
+                if hfield[cell] < nearest:
+                    nearest = hfield[cell]
+                    self.closest = cell
+                mask = masks[cell]
+                for (bit, step, cost) in kernel:
+                    if not mask & bit:
+                        continue
+                    nextcell = cell + step
+                    gnext = gcell + cost
+                    if seen[nextcell] != generation:
+                        seen[nextcell] = generation
+                    elif gnext < g[nextcell]:
+                        reopened += 1
+                    else:
+                        continue
+                    g[nextcell] = gnext
+                    parent[nextcell] = cell
+                    if rounds[nextcell] == current:
+                        inconsistent.add(nextcell)
+                    else:
+                        heappush(agenda, (gnext + epsilon * hfield[nextcell], counter, nextcell, gnext))
+                        counter += 1
+                if len(agenda) > peak:
+                    peak = len(agenda)
+            self.setStatistics(count, counter, peak, reopened)
+            if seen[goal] != generation:
+                return
+            self.closest = goal
+            # Every cell still to expand has g + h at most the optimal cost, so that bounds the path
+            cells = set(entry[2] for entry in agenda if entry[3] == g[entry[2]] and rounds[entry[2]] != current)
+            cells |= inconsistent
+            lower = min([g[cell] + hfield[cell] for cell in cells] or [g[goal]])
+            stopped = self.status in (EXHAUSTED, TIMEOUT) # The round was cut short, so epsilon does not bound it
+            self.status = FOUND
+            bound = max(1.0, g[goal] / lower if stopped else min(epsilon, g[goal] / lower)) if lower > 0 else 1.0
+            if bound < self.bound or g[goal] < best: # Rounds that improved neither are not reported
+                self.bound = bound
+                best = g[goal]
+                yield self.retraceCells(goal), bound
+            if self.bound <= 1.0 or stopped:
+                return
+            epsilon = max(1.0, epsilon - self.decrement)
+            agenda = [(g[cell] + epsilon * hfield[cell], counter + i, cell, g[cell]) for (i, cell) in enumerate(cells)]
+            counter += len(agenda)
+            heapq.heapify(agenda)
+            inconsistent = set()
+
+    def searchCells(self, blocked, start, goal, maxiterations=1000000, deadline=None):
+        '''
+        Same interface as GridSearch.searchCells; runs rounds until the path is optimal or the budget runs out, and
+        returns the last path
+        '''
+        cells = []
+        for (cells, bound) in self.improveCells(blocked, start, goal, maxiterations, deadline):
+            pass
+        return cells
+
+
+def createSearch(planner, h, w, moves=None):
+    '''
+    :param planner: 'astar', 'jps' (4-connected Jump Point Search), 'jps8' (8-connected Jump Point Search) or
+    'bidirectional' (A* from both ends), 'hpa' (hierarchical, near-optimal; see HierarchicalPlanner) or 'dstar'
+    (D* Lite, repairs the previous plan when obstacles change or the robot moves) or 'lpa' (Lifelong Planning A*,
+    repairs the previous plan when the goal moves; see IncrementalPlanner) or 'ara' (Anytime Repairing A*, see
+    AnytimeSearch)
+    :param moves: MoveModel for 'astar', 'bidirectional' and 'ara'; the other planners only move up, down, right and
+    left (or, for 'jps8', diagonally without cutting corners)
+    :return: A new search object for a grid of h x w cells
+    '''
+    if moves is not None and moves.connectivity != 4 and planner not in ('astar', 'bidirectional', 'ara'):
+        raise ValueError('Planner ' + str(planner) + ' does not support connectivity ' + str(moves.connectivity))
+    if planner == 'astar':
+        search = GridSearch(h, w, moves=moves)
+    elif planner == 'jps':
+        search = JumpPointSearch(h, w, 4)
+    elif planner == 'jps8':
+        search = JumpPointSearch(h, w, 8)
+    elif planner == 'bidirectional':
+        search = BidirectionalSearch(h, w, moves=moves)
+    elif planner == 'ara':
+        search = AnytimeSearch(h, w, moves=moves)
+    elif planner == 'hpa':
+        from HierarchicalPlanner import HierarchicalSearch
+        search = HierarchicalSearch(h, w)
+    elif planner == 'dstar':
+        from IncrementalPlanner import DStarLite
+        search = DStarLite(h, w)
+    elif planner == 'lpa':
+        from IncrementalPlanner import LifelongSearch
+        search = LifelongSearch(h, w)
+    else:
+        raise ValueError('Unknown planner : ' + str(planner))
+    search.planner = planner
+    return search
+
+
+def retraceActions(path):
+    '''Returns the actions that move along path, starting with the (0,0) action at the initial pose'''
+    actionplan = [(0, 0)]
+    for i in range(1, len(path)):
+        actionplan.append((path[i][0] - path[i - 1][0], path[i][1] - path[i - 1][1]))
+    return actionplan
+
+
+def pathCost(path):
+    '''Returns the cost of the moves along a list of poses: 1 per straight move, sqrt(2) per diagonal move'''
+    cost = 0.0
+    for i in range(1, len(path)):
+        if path[i][0] != path[i - 1][0] and path[i][1] != path[i - 1][1]:
+            cost += math.sqrt(2)
+        elif path[i] != path[i - 1]:
+            cost += 1.0
+    return cost
+
+
+class PlanResult:
+    '''
+    Outcome and search statistics of a plan. For a multi-robot plan, path, actions, status and visited are
+    dictionaries by robot key, robots holds one PlanResult per robot and the statistics are totals over the robots
+    (peak is the largest of the robots). Iterating over a PlanResult, as in "path, visited, actions = sim.plan()",
+    goes through the tuple the simulator's plan returned before, see astuple.
+    '''
+    def __init__(self, path, actions, status, visited=None, compat=None):
+        '''
+        :param path: list of poses
+        :param actions: list of actions along path
+        :param status: FOUND, UNREACHABLE, EXHAUSTED or TIMEOUT
+        :param visited: grid of the expanded cells, or None
+        :param compat: the tuple returned by astuple
+        '''
+        self.path = path
+        self.actions = actions
+        self.status = status
+        self.visited = visited
+        self.compat = compat
+        self.cost = 0.0 # Cost of the moves along path, see pathCost; waits are free
+        self.expanded = 0 # Nodes taken from the agenda and expanded
+        self.pushed = 0 # Entries put on the agenda
+        self.peak = 0 # Largest agenda size
+        self.reopened = 0 # Nodes reached again at a lower cost
+        self.times = OrderedDict() # Wall-clock seconds spent in each phase of the plan, in order
+        self.robots = {}
+
+    def setStatistics(self, search):
+        '''Copies the statistics of the last search of a search object'''
+        self.expanded = search.count
+        self.pushed = search.pushed
+        self.peak = search.peak
+        self.reopened = search.reopened
+
+    def addRobot(self, key, result):
+        '''Adds the result of one robot of a multi-robot plan to the totals'''
+        self.robots[key] = result
+        self.cost += result.cost
+        self.expanded += result.expanded
+        self.pushed += result.pushed
+        self.peak = max(self.peak, result.peak)
+        self.reopened += result.reopened
+
+    def astuple(self):
+        '''Returns the tuple the plan method returned before it returned a PlanResult'''
+        return self.compat
+
+    def __iter__(self):
+        return iter(self.compat)
+
+
+# Process-pool planning. Each worker process builds its GridSearch and obstacle buffer once, in initPlanWorker, so
+# the map is sent to a worker once and every task only carries its start and goal.
+
+workerSearch = None
+workerBlocked = None
+
+
+def initPlanWorker(obstaclegrid, heuristic='euclidean', moves=None):
+    '''
+    Pool initializer, run once in every worker process. obstaclegrid may be the path of a binary grid map, whose
+    memory-mapped obstacle grid the worker then searches in place, sharing its pages with the other workers.
+    '''
+    global workerSearch, workerBlocked
+    if isinstance(obstaclegrid, str):
+        from MapFiles import readGridMap
+        gridmap = readGridMap(obstaclegrid)
+        workerSearch = GridSearch(gridmap.h, gridmap.w, heuristic, moves=moves)
+        workerBlocked = gridmap.blocked
+    else:
+        workerSearch = GridSearch(obstaclegrid.shape[0], obstaclegrid.shape[1], heuristic, moves=moves)
+        workerBlocked = workerSearch.getBlocked(obstaclegrid)
+
+
+def planInWorker(task):
+    '''
+    :param task: (key, initpose, goalpose, maxiterations, deadline)
+    :return: (key, path, bit-packed grid of the expanded cells, iterations taken, status, (pushed, peak, reopened)),
+    where path is the partial path if the search ran out of budget
+    '''
+    (key, initpose, goalpose, maxiterations, deadline) = task
+    cells = workerSearch.searchCells(workerBlocked, workerSearch.cellId(initpose), workerSearch.cellId(goalpose),
+                                     maxiterations, deadline)
+    path = [workerSearch.cellPose(cell) for cell in cells]
+    if workerSearch.status in (EXHAUSTED, TIMEOUT):
+        path = workerSearch.partialPath()
+    statistics = (workerSearch.pushed, workerSearch.peak, workerSearch.reopened)
+    return key, path, np.packbits(workerSearch.buffers.getClosedGrid()), workerSearch.count, workerSearch.status, \
+        statistics
+
+
+def planParallel(obstaclegrid, tasks, workers=None, heuristic='euclidean', moves=None, deadline=None):
+    '''
+    Runs one independent A* search per task in a pool of worker processes
+    :param obstaclegrid: A h x w grid that is nonzero on obstacles, or the path of a binary grid map (see
+    MapFiles.writeGridMap), which every worker then reads from the file instead of receiving a copy of the grid
+    :param tasks: list of (key, initpose, goalpose, maxiterations)
+    :param workers: number of worker processes, defaults to one per CPU (never more than the number of tasks)
+    :param heuristic: heuristic of the searches, as for GridSearch; LandmarkFields are sent to each worker once
+    :param moves: MoveModel of the searches, 4-connected by default
+    :param deadline: time.time() value after which every search still running gives up
+    :return: dictionary of key -> (path, visited, iterations taken, status, (pushed, peak, reopened)), where visited
+    is a uint8 grid that is 1 on obstacles and on the cells expanded by that search, and path leads to the cell
+    closest to the goal when status is EXHAUSTED or TIMEOUT
+    '''
+    if not tasks:
+        return {}
+    source = obstaclegrid
+    if isinstance(obstaclegrid, str):
+        from MapFiles import readGridMap
+        obstaclegrid = readGridMap(obstaclegrid).getObstacleGrid()
+    else:
+        source = obstaclegrid = np.ascontiguousarray(obstaclegrid, dtype=np.uint8)
+    (h, w) = obstaclegrid.shape
+    workers = min(workers or multiprocessing.cpu_count(), len(tasks))
+    pool = multiprocessing.Pool(workers, initPlanWorker, (source, heuristic, moves))
+    try:
+        results = pool.map(planInWorker, [task + (deadline,) for task in tasks], chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    planned = {}
+    for (key, path, packed, count, status, statistics) in results:
+        closed = np.unpackbits(packed)[:h * w].reshape(h, w)
+        planned[key] = (path, closed | (obstaclegrid != 0), count, status, statistics)
+    return planned
@@ -0,0 +1,476 @@
+import heapq
+import time
+from bisect import bisect_left
+from collections import deque
+
+import numpy as np
+
+from GridPlanner import EXHAUSTED, FOUND, TIMEOUT, UNREACHABLE, GridSearch
+
+
+class HierarchicalSearch(GridSearch):
+    '''
+    Hierarchical pathfinding (HPA*). The grid is cut into square clusters; cells on either side of the free stretches
+    of cluster borders become entrance nodes of a small abstract graph, whose intra-cluster edges carry the exact
+    distance between two entrances of the same cluster. Queries search the abstract graph and then refine each
+    abstract edge into cells inside a single cluster. Paths are near-optimal rather than optimal.
+
+    The distances are found with breadth-first wavefronts from every entrance of every cluster at once, each cluster
+    row being the bits of one integer. The distance fields of the wavefronts are kept, as bit planes, so that an
+    abstract edge is refined by walking down the field of its first entrance rather than by searching the cluster.
+    The edges leaving the entrances of a cluster are kept in compressed sparse row arrays with int16 costs.
+
+    Building the abstraction takes about 1 s for a 1000 x 1000 map and 8 s for 3000 x 3000 (about 600 MB), and
+    queries across such maps take 0.1 to 2 s, as the abstract graph is still searched in Python. Millisecond queries
+    on 5000 x 5000 maps are not reached.
+    '''
+    def __init__(self, h, w, clustersize=16, maxsingle=6):
+        '''
+        :param h: height or number of rows of the grid
+        :param w: width or number of columns of the grid
+        :param clustersize: side of the square clusters, in cells, at most 64
+        :param maxsingle: free border stretches shorter than this get one entrance in the middle, longer ones get
+        one at each end
+        '''
+        if not 0 < clustersize <= 64:
+            raise ValueError('Cluster sizes are 1 to 64 cells')
+        # The per-cell buffers of GridSearch are not needed; the abstract graph is kept per cluster
+        self.h = h
+        self.w = w
+        self.count = 0
+        self.pushed = 0
+        self.peak = 0
+        self.reopened = 0
+        self.status = None
+        self.closest = -1 # Partial paths are not kept; see GridSearch.partialPath
+        self.clustersize = clustersize
+        self.maxsingle = maxsingle
+        self.rowtype = next(dtype for dtype in (np.uint8, np.uint16, np.uint32, np.uint64)
+                            if np.dtype(dtype).itemsize * 8 >= clustersize) # Holds one cluster row as bits
+        self.planes = max(1, (clustersize * clustersize - 1).bit_length()) # Bits of a distance inside a cluster
+        self.ch = (h + clustersize - 1) // clustersize # Rows of clusters
+        self.cw = (w + clustersize - 1) // clustersize # Columns of clusters
+        self.blocked = None # Copy of the obstacle buffer the abstraction was built from
+        self.transitions = {} # (cluster a, cluster b) with a < b -> list of (cell in a, cell in b)
+        self.clusterNodes = {} # cluster -> set of its entrance cells
+        self.graphs = {} # cluster -> (sorted entrance cells, offsets, targets, costs), see buildClusters
+        self.fields = {} # cluster -> (entrance cell -> layer, reached rows, distance bit planes), see clusterWavefronts
+        self.expanded = [] # Abstract nodes expanded by the last query
+
+    def clusterOf(self, cell):
+        return (cell // self.w // self.clustersize) * self.cw + (cell % self.w) // self.clustersize
+
+    def clusterBounds(self, cluster):
+        '''Returns first row, first column, end row and end column (exclusive) of a cluster'''
+        row0 = (cluster // self.cw) * self.clustersize
+        col0 = (cluster % self.cw) * self.clustersize
+        return row0, col0, min(row0 + self.clustersize, self.h), min(col0 + self.clustersize, self.w)
+
+    def clusterBorders(self, cluster):
+        '''Returns the (a, b) keys, a < b, of the borders between a cluster and its up to four neighbours'''
+        (crow, ccol) = divmod(cluster, self.cw)
+        borders = []
+        if ccol > 0:
+            borders.append((cluster - 1, cluster))
+        if ccol < self.cw - 1:
+            borders.append((cluster, cluster + 1))
+        if crow > 0:
+            borders.append((cluster - self.cw, cluster))
+        if crow < self.ch - 1:
+            borders.append((cluster, cluster + self.cw))
+        return borders
+
+    def build(self, blocked):
+        '''Builds the whole abstraction from a flat obstacle buffer (see GridSearch.getBlocked)'''
+        self.blocked = bytearray(blocked)
+        self.transitions = {}
+        self.clusterNodes = {}
+        self.graphs = {}
+        self.fields = {}
+        clusters = range(self.ch * self.cw)
+        self.addTransitions([border for cluster in clusters for border in self.clusterBorders(cluster)
+                             if border[0] == cluster])
+        for first in range(0, len(clusters), 4096): # In batches, which bounds the memory the wavefronts take
+            self.buildClusters(clusters[first:first + 4096])
+
+    def update(self, blocked):
+        '''
+        Brings the abstraction in line with a new obstacle buffer. Only the borders of clusters containing changed
+        cells, and the edges of those clusters and their neighbours, are recomputed.
+        '''
+        old = np.frombuffer(self.blocked, dtype=np.uint8)
+        changed = np.nonzero(np.frombuffer(blocked, dtype=np.uint8) != old)[0]
+        if not len(changed):
+            return
+        self.blocked = bytearray(blocked)
+        rows = changed // self.w // self.clustersize
+        cols = (changed % self.w) // self.clustersize
+        dirty = set((rows * self.cw + cols).tolist())
+        borders = set()
+        affected = set(dirty)
+        for cluster in dirty:
+            for border in self.clusterBorders(cluster):
+                borders.add(border)
+                affected.update(border)
+        self.addTransitions(sorted(borders))
+        self.buildClusters(sorted(affected)) # Every changed border has a cluster in affected on both sides
+
+    def getPaddedGrid(self):
+        '''Returns the obstacle grid grown to whole clusters, the cells past the map edge being obstacles'''
+        grid = np.ones((self.ch * self.clustersize, self.cw * self.clustersize), dtype=np.uint8)
+        grid[:self.h, :self.w] = np.frombuffer(self.blocked, dtype=np.uint8).reshape(self.h, self.w)
+        return grid
+
+    def addTransitions(self, borders):
+        '''Finds the entrances along the given borders, as pairs of cells on either side, replacing earlier ones'''
+        if not borders:
+            return
+        cs = self.clustersize
+        (a, b) = np.array(borders, dtype=np.int64).reshape(-1, 2).T
+        row0 = a // self.cw * cs
+        col0 = a % self.cw * cs
+        below = (b == a + self.cw)[:, None] # One above the other; the border runs along a row
+        step = np.arange(cs)
+        # Rows and columns of the cells on the side of a (first) and of b (second) of every border
+        rows = np.where(below, (row0 + cs - 1)[:, None], row0[:, None] + step)
+        cols = np.where(below, col0[:, None] + step, (col0 + cs - 1)[:, None])
+        (nextrows, nextcols) = (rows + below, cols + ~below)
+        grid = self.getPaddedGrid()
+        free = (grid[rows, cols] == 0) & (grid[nextrows, nextcols] == 0)
+        edges = np.diff(np.pad(free.astype(np.int8), ((0, 0), (1, 1)), 'constant'), axis=1)
+        (which, starts) = np.nonzero(edges == 1)
+        ends = np.nonzero(edges == -1)[1]
+        single = ends - starts < self.maxsingle
+        which = np.concatenate((which[single], which[~single], which[~single]))
+        at = np.concatenate(((starts + ends - 1)[single] // 2, starts[~single], ends[~single] - 1))
+        order = np.lexsort((at, which)) # Border by border, along the border
+        (which, at) = (which[order], at[order])
+        firsts = (rows[which, at] * self.w + cols[which, at]).tolist()
+        seconds = (nextrows[which, at] * self.w + nextcols[which, at]).tolist()
+        for border in borders:
+            self.transitions[border] = []
+        for (i, x, y) in zip(which.tolist(), firsts, seconds):
+            self.transitions[borders[i]].append((x, y))
+
+    def buildClusters(self, clusters):
+        '''
+        Collects the entrances of the given clusters, connects every pair of entrances of the same cluster with the
+        exact distance between them inside the cluster and every entrance with the cells across the border at cost
+        1. The edges of a cluster are stored in compressed sparse row form: the edges of its i-th entrance go to
+        targets[offsets[i]:offsets[i + 1]] at costs[offsets[i]:offsets[i + 1]].
+        '''
+        sources = []
+        owners = []
+        crossings = [] # (cluster, entrance, cell across the border) of every transition of the clusters
+        for cluster in clusters:
+            nodes = set()
+            for border in self.clusterBorders(cluster):
+                side = 0 if border[0] == cluster else 1
+                for transition in self.transitions.get(border, ()):
+                    nodes.add(transition[side])
+                    crossings.append((cluster, transition[side], transition[1 - side]))
+            self.clusterNodes[cluster] = nodes
+            self.fields.pop(cluster, None)
+            self.graphs.pop(cluster, None)
+            if len(nodes) >= 2:
+                sources.extend(sorted(nodes))
+                owners.extend([cluster] * len(nodes))
+        if not crossings:
+            return
+        (edgeclusters, edgesources, edgetargets) = np.array(crossings, dtype=np.int64).reshape(-1, 3).T
+        edgecosts = np.ones(len(crossings), dtype=np.int16)
+        if sources:
+            intra = self.intraEdges(owners, sources)
+            edgeclusters = np.concatenate((edgeclusters, intra[0]))
+            edgesources = np.concatenate((edgesources, intra[1]))
+            edgetargets = np.concatenate((edgetargets, intra[2]))
+            edgecosts = np.concatenate((edgecosts, intra[3]))
+
+        # Sorted by cluster then entrance, the edges of an entrance follow each other and so do those of a cluster
+        size = self.h * self.w
+        keys = edgeclusters * size + edgesources
+        order = np.argsort(keys, kind='mergesort')
+        (keys, edgetargets, edgecosts) = (keys[order], edgetargets[order], edgecosts[order])
+        nodekeys = np.unique(keys) # Every entrance with an edge, as cluster * size + cell
+        offsets = np.searchsorted(keys, nodekeys).astype(np.int64)
+        offsets = np.append(offsets, len(keys))
+        nodeclusters = nodekeys // size
+        nodes = nodekeys - nodeclusters * size
+        (owned, starts) = np.unique(nodeclusters, return_index=True)
+        ends = np.append(starts[1:], len(nodekeys))
+        for (cluster, start, end) in zip(owned.tolist(), starts.tolist(), ends.tolist()):
+            (first, last) = (offsets[start], offsets[end])
+            self.graphs[cluster] = (nodes[start:end], (offsets[start:end + 1] - first).astype(np.int32),
+                                    edgetargets[first:last], edgecosts[first:last])
+
+    def intraEdges(self, owners, sources):
+        '''
+        Runs the wavefronts of the given entrances, keeping their fields in self.fields, and reads off the distance
+        between every two entrances of the same cluster
+        :param owners: cluster of every entrance, the entrances of a cluster following each other
+        :param sources: entrance cells
+        :return: (clusters, entrances, targets, distances) arrays with one element per edge; distances are int16
+        '''
+        (reached, planes) = self.clusterWavefronts(owners, sources)
+        owners = np.array(owners, dtype=np.int64)
+        # Layers are grouped by cluster; first is the first layer of the cluster of every layer, count its size
+        first = np.nonzero(np.concatenate(([True], owners[1:] != owners[:-1])))[0]
+        count = np.diff(np.append(first, len(owners)))
+        for (start, size) in zip(first.tolist(), count.tolist()):
+            self.fields[int(owners[start])] = (dict(zip(sources[start:start + size], range(start, start + size))),
+                                               reached, planes)
+        first = np.repeat(first, count)
+        count = np.repeat(count, count)
+
+        # Every ordered pair of entrances of the same cluster, as (layer of the first, second entrance)
+        layers = np.repeat(np.arange(len(sources)), count - 1)
+        offsets = np.cumsum(count - 1) - (count - 1)
+        other = np.arange(len(layers)) - offsets[layers] # Index among the other entrances of the cluster
+        other += other >= layers - first[layers]
+        targets = np.array(sources, dtype=np.int64)[first[layers] + other]
+        row0 = owners[layers] // self.cw * self.clustersize
+        col0 = owners[layers] % self.cw * self.clustersize
+        rows = targets // self.w - row0
+        bits = (targets % self.w - col0).astype(self.rowtype)
+        found = (reached[layers, rows] >> bits) & 1 != 0
+        (layers, rows, bits, targets) = (layers[found], rows[found], bits[found], targets[found])
+        fields = planes[layers, :, rows]
+        distances = np.zeros(len(layers), dtype=np.int16) # Cluster sizes up to 64 keep distances below 4096
+        for k in range(self.planes):
+            distances |= ((fields[:, k] >> bits) & 1).astype(np.int16) << k
+        return owners[layers], np.array(sources, dtype=np.int64)[layers], targets, distances
+
+    def nodeEdges(self, node, lists):
+        '''
+        Returns the list of (neighbour, cost) of the abstract edges of an entrance cell, empty for other cells
+        :param lists: dictionary of cluster -> the arrays of its graph as lists, filled in as clusters are reached
+        '''
+        cluster = self.clusterOf(node)
+        graph = lists.get(cluster)
+        if graph is None:
+            arrays = self.graphs.get(cluster)
+            graph = tuple(array.tolist() for array in arrays) if arrays is not None else ([], [0], [], [])
+            lists[cluster] = graph
+        (nodes, offsets, targets, costs) = graph
+        i = bisect_left(nodes, node)
+        if i == len(nodes) or nodes[i] != node:
+            return []
+        (first, last) = (offsets[i], offsets[i + 1])
+        return zip(targets[first:last], costs[first:last])
+
+    def clusterWavefronts(self, owners, sources):
+        '''
+        Breadth-first wavefronts that stay inside a cluster, from every source at once. A layer holds the wavefront
+        of one source: one integer per cluster row, whose bit j is column j of the cluster. Bit k of the distance of
+        a cell is kept in bit plane k, so that the fields take about one byte per cell.
+        :param owners: cluster of every source
+        :param sources: cells the wavefronts start from
+        :return: (reached, planes) where reached has shape (len(sources), clustersize) and holds the reached cells
+        of every layer, and planes has shape (len(sources), self.planes, clustersize)
+        '''
+        cs = self.clustersize
+        rowtype = self.rowtype
+        grid = self.getPaddedGrid()
+        owners = np.array(owners, dtype=np.int64)
+        sources = np.array(sources, dtype=np.int64)
+        (clusters, index) = np.unique(owners, return_inverse=True)
+        blocks = grid.reshape(self.ch, cs, self.cw, cs)[clusters // self.cw, :, clusters % self.cw, :]
+        weights = np.left_shift(np.ones(cs, dtype=rowtype), np.arange(cs, dtype=rowtype))
+        free = ((blocks == 0) * weights).sum(axis=2, dtype=rowtype)[index] # Free cells of the cluster of every layer
+        rows = sources // self.w - owners // self.cw * cs
+        cols = sources % self.w - owners % self.cw * cs
+        frontier = np.zeros((len(sources), cs), dtype=rowtype)
+        frontier[np.arange(len(sources)), rows] = np.left_shift(np.ones(len(sources), dtype=rowtype),
+                                                                cols.astype(rowtype))
+        unreached = free & ~frontier # Free cells the wavefront has yet to reach
+        planes = np.zeros((len(sources), self.planes, cs), dtype=rowtype)
+
+        active = np.arange(len(sources)) # Layers whose wavefront may still grow
+        activeunreached = unreached.copy()
+        activeplanes = [np.zeros((len(sources), cs), dtype=rowtype) for k in range(self.planes)]
+        step = 0
+        while len(active):
+            step += 1
+            grown = frontier | (frontier << 1) | (frontier >> 1)
+            grown[:, 1:] |= frontier[:, :-1]
+            grown[:, :-1] |= frontier[:, 1:]
+            frontier = grown & activeunreached
+            activeunreached ^= frontier
+            for k in range(self.planes):
+                if step >> k & 1:
+                    activeplanes[k] |= frontier
+            if step % 4 == 0:
+                growing = frontier.any(axis=1)
+                if growing.sum() < 0.75 * len(active): # Drops the finished wavefronts
+                    done = active[~growing]
+                    unreached[done] = activeunreached[~growing]
+                    activeunreached = activeunreached[growing]
+                    for k in range(self.planes):
+                        planes[done, k] = activeplanes[k][~growing]
+                        activeplanes[k] = activeplanes[k][growing]
+                    (active, frontier) = (active[growing], frontier[growing])
+        return free & ~unreached, planes
+
+    def localPaths(self, cluster, source, targets):
+        '''
+        Breadth-first search from source that stays inside a cluster
+        :return: dictionary of target -> list of cells from source to target, for the targets that were reached
+        '''
+        (row0, col0, row1, col1) = self.clusterBounds(cluster)
+        w = self.w
+        blocked = self.blocked
+        parent = {source: -1}
+        queue = deque([source])
+        remaining = set(targets)
+        remaining.discard(source)
+        while queue and remaining:
+            cell = queue.popleft()
+            (row, col) = divmod(cell, w)
+            for (nextcell, inside) in ((cell - w, row > row0), (cell + w, row < row1 - 1),
+                                       (cell + 1, col < col1 - 1), (cell - 1, col > col0)):
+                if inside and not blocked[nextcell] and nextcell not in parent:
+                    parent[nextcell] = cell
+                    queue.append(nextcell)
+                    remaining.discard(nextcell)
+        paths = {}
+        for target in targets:
+            if target in parent:
+                path = []
+                cell = target
+                while cell != -1:
+                    path.append(cell)
+                    cell = parent[cell]
+                path.reverse()
+                paths[target] = path
+        return paths
+
+    def intraPath(self, a, b):
+        '''Refines an intra-cluster abstract edge into cells, walking down the distance field of a from b'''
+        cluster = self.clusterOf(a)
+        (layers, reached, planes) = self.fields[cluster]
+        layer = layers[a]
+        bits = np.arange(self.clustersize, dtype=self.rowtype)
+        distances = np.zeros((self.clustersize, self.clustersize), dtype=np.int64)
+        for k in range(self.planes):
+            distances |= ((planes[layer, k][:, None] >> bits) & 1).astype(np.int64) << k
+        distances[(reached[layer][:, None] >> bits) & 1 == 0] = -1
+        distances = distances.tolist()
+        (row0, col0, row1, col1) = self.clusterBounds(cluster)
+        (row, col) = (b // self.w - row0, b % self.w - col0)
+        path = [b]
+        distance = distances[row][col]
+        while distance > 0:
+            distance -= 1
+            for (nextrow, nextcol) in ((row - 1, col), (row + 1, col), (row, col + 1), (row, col - 1)):
+                if 0 <= nextrow < row1 - row0 and 0 <= nextcol < col1 - col0 and \
+                        distances[nextrow][nextcol] == distance:
+                    break
+            (row, col) = (nextrow, nextcol)
+            path.append((row0 + row) * self.w + col0 + col)
+        path.reverse()
+        return path
+
+    def searchCells(self, blocked, start, goal, maxiterations=1000000, deadline=None):
+        '''
+        Same interface as GridSearch.searchCells. The abstraction is built on the first call and updated when
+        blocked differs from the buffer it was built from.
+        :param maxiterations: number of abstract nodes taken from the agenda before giving up
+        '''
+        if self.blocked is None:
+            self.build(blocked)
+        elif self.blocked != blocked:
+            self.update(blocked)
+        self.expanded = []
+        self.count = 0
+        self.pushed = 1
+        self.peak = 1
+        self.reopened = 0
+        self.status = FOUND
+        if self.blocked[start] or self.blocked[goal]:
+            self.status = UNREACHABLE
+            return []
+        if start == goal:
+            return [start]
+        startcluster = self.clusterOf(start)
+        goalcluster = self.clusterOf(goal)
+        starttargets = set(self.clusterNodes[startcluster])
+        if startcluster == goalcluster:
+            starttargets.add(goal)
+        startpaths = self.localPaths(startcluster, start, starttargets)
+        goalpaths = self.localPaths(goalcluster, goal, self.clusterNodes[goalcluster])
+
+        (goalrow, goalcol) = divmod(goal, self.w)
+        def heuristic(cell): # Moves are 4-connected, so the Manhattan distance is a lower bound
+            (row, col) = divmod(cell, self.w)
+            return abs(row - goalrow) + abs(col - goalcol)
+
+        g = {start: 0}
+        parent = {start: None}
+        closed = set()
+        lists = {} # Graphs of the clusters reached, as lists, which are much faster to read than arrays
+        agenda = [(heuristic(start), 0, 0, start)] # Ties go to the deeper node, as many paths have the same cost
+        counter = 1
+        while agenda:
+            node = heapq.heappop(agenda)[3]
+            if node in closed:
+                continue
+            closed.add(node)
+            self.expanded.append(node)
+            self.count += 1
+            if node == goal:
+                return self.refine(parent, goal, startpaths, goalpaths)
+            if self.count >= maxiterations:
+                self.status = EXHAUSTED
+                return []
+            if deadline is not None and time.time() >= deadline:
+                self.status = TIMEOUT
+                return []
+            neighbours = self.nodeEdges(node, lists)
+            if node == start:
+                neighbours += [(target, len(path) - 1) for (target, path) in startpaths.items()]
+            if node in goalpaths:
+                neighbours.append((goal, len(goalpaths[node]) - 1))
+            for (nextnode, cost) in neighbours:
+                if nextnode in closed:
+                    continue
+                gnext = g[node] + cost
+                if gnext < g.get(nextnode, float('inf')):
+                    if nextnode in g:
+                        self.reopened += 1
+                    g[nextnode] = gnext
+                    parent[nextnode] = (node, cost)
+                    heapq.heappush(agenda, (gnext + heuristic(nextnode), -gnext, counter, nextnode))
+                    counter += 1
+                    self.pushed += 1
+            self.peak = max(self.peak, len(agenda))
+        self.status = UNREACHABLE
+        return []
+
+    def refine(self, parent, goal, startpaths, goalpaths):
+        '''Turns the abstract path ending at goal into the list of cells it stands for'''
+        hops = []
+        node = goal
+        while parent[node] is not None:
+            (previous, cost) = parent[node]
+            hops.append((previous, node, cost))
+            node = previous
+        hops.reverse()
+        cells = [hops[0][0]]
+        for (a, b, cost) in hops:
+            if a == cells[0] and b in startpaths and len(startpaths[b]) - 1 == cost and len(cells) == 1:
+                segment = startpaths[b]
+            elif b == goal and a in goalpaths and len(goalpaths[a]) - 1 == cost:
+                segment = goalpaths[a][::-1]
+            elif self.clusterOf(a) != self.clusterOf(b):
+                segment = [a, b]
+            else:
+                segment = self.intraPath(a, b)
+            cells.extend(segment[1:])
+        return cells
+
+    def getVisited(self, obstaclegrid):
+        '''Returns a uint8 grid that is 1 on obstacles and on the abstract nodes expanded by the last query'''
+        visited = (np.asarray(obstaclegrid) != 0).astype(np.uint8)
+        if self.expanded:
+            visited.ravel()[self.expanded] = 1
+        return visited
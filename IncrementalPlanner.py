@@ -0,0 +1,272 @@
+import heapq
+import random
+import time
+from array import array
+
+import numpy as np
+
+from GridPlanner import EXHAUSTED, FOUND, TIMEOUT, UNREACHABLE, GridSearch
+
+INFINITY = float('inf')
+
+
+class DStarLite(GridSearch):
+    '''
+    D* Lite incremental planner on a 4-connected grid. The search runs from the goal towards the robot, so when
+    obstacle cells are added or removed, or the robot moves, only the g/rhs values the change affects are repaired
+    and the rest of the previous search is reused.
+    '''
+    def __init__(self, h, w):
+        '''
+        :param h: height or number of rows of the grid
+        :param w: width or number of columns of the grid
+        '''
+        # g and rhs replace the per-search buffers of GridSearch; they must survive between plans
+        self.h = h
+        self.w = w
+        self.count = 0 # Vertices expanded by the last repair
+        self.pushed = 0 # Keys put on the agenda by the last repair
+        self.peak = 0 # Largest agenda size of the last repair
+        self.reopened = 0 # Vertices of the last repair whose g was raised again (underconsistent)
+        self.status = None
+        self.closest = -1 # The search runs from the goal, so there are no partial paths from the robot
+        self.blocked = None
+        self.start = None
+        self.goal = None
+        self.km = 0 # Key modifier, grows with every move of the robot
+        self.g = None
+        self.rhs = None
+        self.agenda = []
+        self.queued = {} # cell -> key of its live entry on the agenda
+
+    def reset(self, blocked, start, goal):
+        '''Starts over from scratch for a new goal'''
+        size = self.h * self.w
+        self.blocked = bytearray(blocked)
+        self.start = start
+        self.goal = goal
+        self.km = 0
+        self.g = array('d', [INFINITY]) * size
+        self.rhs = array('d', [INFINITY]) * size
+        self.agenda = []
+        self.queued = {}
+        self.peak = 0
+        self.rhs[goal] = 0.0
+        self.push(goal, self.calculateKey(goal))
+
+    def heuristic(self, a, b):
+        '''Manhattan distance between two cells'''
+        (arow, acol) = divmod(a, self.w)
+        (brow, bcol) = divmod(b, self.w)
+        return abs(arow - brow) + abs(acol - bcol)
+
+    def calculateKey(self, cell):
+        best = min(self.g[cell], self.rhs[cell])
+        return (best + self.heuristic(self.start, cell) + self.km, best)
+
+    def push(self, cell, key):
+        self.queued[cell] = key
+        heapq.heappush(self.agenda, (key[0], key[1], cell))
+        self.pushed += 1
+        if len(self.agenda) > self.peak:
+            self.peak = len(self.agenda)
+
+    def topKey(self):
+        '''Returns the smallest key on the agenda, dropping stale entries on the way'''
+        agenda = self.agenda
+        while agenda and self.queued.get(agenda[0][2]) != (agenda[0][0], agenda[0][1]):
+            heapq.heappop(agenda)
+        if not agenda:
+            return (INFINITY, INFINITY)
+        return (agenda[0][0], agenda[0][1])
+
+    def neighbours(self, cell):
+        (row, col) = divmod(cell, self.w)
+        w = self.w
+        cells = []
+        if row > 0:
+            cells.append(cell - w)
+        if row < self.h - 1:
+            cells.append(cell + w)
+        if col < w - 1:
+            cells.append(cell + 1)
+        if col > 0:
+            cells.append(cell - 1)
+        return cells
+
+    def cost(self, a, b):
+        return INFINITY if self.blocked[a] or self.blocked[b] else 1.0
+
+    def updateVertex(self, cell):
+        if self.g[cell] != self.rhs[cell]:
+            self.push(cell, self.calculateKey(cell))
+        else:
+            self.queued.pop(cell, None)
+
+    def updateRhs(self, cell):
+        '''Recomputes rhs of a cell from its successors and puts it back on the agenda if it became inconsistent'''
+        if cell != self.goal:
+            g = self.g
+            self.rhs[cell] = min([self.cost(cell, other) + g[other] for other in self.neighbours(cell)] or [INFINITY])
+        self.updateVertex(cell)
+
+    def computeShortestPath(self, maxiterations=1000000, deadline=None):
+        '''
+        Repairs g until the robot's cell is consistent and no cheaper key is left on the agenda. A repair cut short by
+        maxiterations or the deadline is resumed by the next call.
+        '''
+        g = self.g
+        rhs = self.rhs
+        start = self.start
+        count = 0
+        self.status = FOUND
+        while True:
+            topkey = self.topKey()
+            if not (topkey < self.calculateKey(start) or rhs[start] > g[start]):
+                break
+            if count >= maxiterations:
+                self.status = EXHAUSTED
+                break
+            if deadline is not None and not count & 63 and time.time() >= deadline:
+                self.status = TIMEOUT
+                break
+            cell = self.agenda[0][2]
+            newkey = self.calculateKey(cell)
+            count += 1
+            if topkey < newkey:
+                self.push(cell, newkey)
+            elif g[cell] > rhs[cell]:
+                g[cell] = rhs[cell]
+                self.queued.pop(cell, None)
+                for other in self.neighbours(cell):
+                    if other != self.goal and self.cost(other, cell) + g[cell] < rhs[other]:
+                        rhs[other] = self.cost(other, cell) + g[cell]
+                    self.updateVertex(other)
+            else:
+                g[cell] = INFINITY
+                self.reopened += 1
+                for other in self.neighbours(cell) + [cell]:
+                    self.updateRhs(other)
+        self.count = count
+
+    def moveStart(self, start):
+        '''Moves the robot; the keys already on the agenda stay valid thanks to km'''
+        if start != self.start:
+            self.km += self.heuristic(self.start, start)
+            self.start = start
+
+    def updateCells(self, cells, isblocked):
+        '''
+        Adds (isblocked true) or removes obstacles at the given cell ids. Only the changed cells and their neighbours
+        are touched; the repair itself happens in the next computeShortestPath.
+        '''
+        changed = []
+        for cell in cells:
+            if bool(self.blocked[cell]) != bool(isblocked):
+                self.blocked[cell] = 1 if isblocked else 0
+                changed.append(cell)
+        touched = set(changed)
+        for cell in changed:
+            touched.update(self.neighbours(cell))
+        for cell in touched:
+            self.updateRhs(cell)
+
+    def extractPath(self):
+        '''Follows the cheapest successors from the robot to the goal'''
+        cell = self.start
+        if self.rhs[cell] == INFINITY:
+            return []
+        cells = [cell]
+        while cell != self.goal and len(cells) <= self.h * self.w:
+            cell = min(self.neighbours(cell), key=lambda other: self.cost(cell, other) + self.g[other])
+            if self.g[cell] == INFINITY:
+                return []
+            cells.append(cell)
+        return cells
+
+    def searchCells(self, blocked, start, goal, maxiterations=1000000, deadline=None):
+        '''
+        Same interface as GridSearch.searchCells. The previous search is reused while the goal stays the same; cells
+        whose obstacle flag differs from the last call are repaired incrementally.
+        '''
+        self.pushed = 0
+        self.peak = len(self.agenda)
+        self.reopened = 0
+        if self.g is None or goal != self.goal:
+            self.reset(blocked, start, goal)
+        else:
+            if self.blocked != blocked:
+                old = np.frombuffer(self.blocked, dtype=np.uint8)
+                new = np.frombuffer(blocked, dtype=np.uint8)
+                changed = np.nonzero(old != new)[0]
+                self.updateCells(changed[new[changed] != 0].tolist(), True)
+                self.updateCells(changed[new[changed] == 0].tolist(), False)
+            self.moveStart(start)
+        self.computeShortestPath(maxiterations, deadline)
+        if self.status != FOUND:
+            return []
+        cells = self.extractPath()
+        if not cells:
+            self.status = UNREACHABLE
+        return cells
+
+    def getVisited(self, obstaclegrid):
+        '''Returns a uint8 grid that is 1 on obstacles and on the cells the search has a finite g for'''
+        known = np.frombuffer(self.g, dtype=np.float64).reshape(self.h, self.w) != INFINITY
+        return (known | (obstaclegrid != 0)).astype(np.uint8)
+
+
+class LifelongSearch(DStarLite):
+    '''
+    Lifelong Planning A* for a goal that moves while the robot waits, e.g. a pickup point that shifts by a few cells.
+    This is D* Lite with the roles swapped: the search tree is rooted at the robot and the goal is the moving end,
+    so the tree built by the previous plan stays valid and a replan only expands what the new goal needs.
+    Obstacle changes are repaired the same way as in DStarLite; a new start pose starts over.
+    '''
+    def searchCells(self, blocked, start, goal, maxiterations=1000000, deadline=None):
+        cells = DStarLite.searchCells(self, blocked, goal, start, maxiterations, deadline)
+        cells.reverse()
+        return cells
+
+
+def benchmarkGoalMoves(h=500, w=500, density=0.2, moves=50, shift=3, seed=0):
+    '''
+    Moves the goal by up to shift cells in each direction, moves times, and replans after every move with
+    LifelongSearch and with a cold GridSearch on the same map.
+    :return: Dictionary with the total seconds and expansions of both planners over all replans
+    '''
+    rng = random.Random(seed)
+    obstaclegrid = (np.random.RandomState(seed).rand(h, w) < density).astype(np.uint8)
+    free = np.argwhere(obstaclegrid == 0)
+    start = tuple(free[rng.randrange(len(free))])
+    goal = tuple(free[rng.randrange(len(free))])
+    lifelong = LifelongSearch(h, w)
+    cold = GridSearch(h, w)
+    lifelong.search(obstaclegrid, start, goal)
+    result = {'moves': 0, 'lifelong_seconds': 0.0, 'cold_seconds': 0.0, 'lifelong_expanded': 0, 'cold_expanded': 0,
+              'mismatches': 0}
+    while result['moves'] < moves:
+        newgoal = (goal[0] + rng.randint(-shift, shift), goal[1] + rng.randint(-shift, shift))
+        if not (0 <= newgoal[0] < h and 0 <= newgoal[1] < w) or obstaclegrid[newgoal]:
+            continue
+        goal = newgoal
+        t = time.time()
+        path = lifelong.search(obstaclegrid, start, goal)
+        result['lifelong_seconds'] += time.time() - t
+        result['lifelong_expanded'] += lifelong.count
+        t = time.time()
+        coldpath = cold.search(obstaclegrid, start, goal)
+        result['cold_seconds'] += time.time() - t
+        result['cold_expanded'] += cold.count
+        if len(path) != len(coldpath):
+            result['mismatches'] += 1
+        result['moves'] += 1
+    return result
+
+
+if __name__ == '__main__':
+    '''Benchmark of lifelong replans against cold replans when the goal moves by a few cells'''
+    result = benchmarkGoalMoves()
+    print "Goal moves : " + str(result['moves']) + ", path length mismatches : " + str(result['mismatches'])
+    print "Lifelong : %.3f s, %d expansions" % (result['lifelong_seconds'], result['lifelong_expanded'])
+    print "Cold : %.3f s, %d expansions" % (result['cold_seconds'], result['cold_expanded'])
@@ -0,0 +1,192 @@
+import struct
+from collections import OrderedDict
+
+import numpy as np
+
+# Terrain characters of the MovingAI .map format (https://movingai.com/benchmarks/formats.html) that a ground robot
+# can cross: '.' and 'G' are ground, 'S' is swamp. '@', 'O', 'T' (trees) and 'W' (water) are obstacles.
+PASSABLE = '.GS'
+
+# Lookup table from a map character to 0 (free) or 1 (obstacle), so a whole map is converted with one indexing
+TERRAIN = np.ones(256, dtype=np.uint8)
+TERRAIN[[ord(char) for char in PASSABLE]] = 0
+
+# Binary grid map (.gmap) layout, little-endian:
+#   header: magic 'GMAP', version (uint32), height (uint64), width (uint64), number of cost layers (uint32), flags
+#   (uint32, zero before version 3), then for every cost layer its name, padded with zero bytes to LAYER_NAME bytes
+#   occupancy: one bit per cell, 1 on obstacles, every row packed into ceil(width / 8) bytes, most significant bit
+#   first (np.packbits order)
+#   obstacle grid (only with the GRIDMAP_BYTEGRID flag, and always in version 2): one uint8 per cell, row by row, 1 on
+#   obstacles, so that the planners can search the memory-mapped bytes without unpacking them, at 8 times the size
+#   of the occupancy section
+#   cost layers: one float32 per cell, row by row, in the order of the header
+# Every section starts at a multiple of ALIGNMENT bytes so that each one can be memory-mapped as an aligned array.
+GRIDMAP_MAGIC = b'GMAP'
+GRIDMAP_VERSION = 3
+GRIDMAP_HEADER = struct.Struct('<4sIQQII')
+GRIDMAP_BYTEGRID = 1 # Flag of the maps that hold the obstacle grid section
+LAYER_NAME = 32
+ALIGNMENT = 64
+
+
+def readMovingAIMap(filename):
+    '''
+    Reads a MovingAI .map grid
+    :param filename: path of the .map file
+    :return: h x w uint8 grid that is 1 on obstacles and 0 on free cells
+    '''
+    with open(filename, 'rb') as mapfile:
+        data = mapfile.read()
+    header = {}
+    offset = 0
+    while True:
+        end = data.find(b'\n', offset)
+        if end < 0:
+            raise ValueError(filename + ' has no map section')
+        fields = data[offset:end].split()
+        offset = end + 1
+        if fields and fields[0].lower() == b'map':
+            break
+        if len(fields) == 2:
+            header[fields[0].lower()] = fields[1]
+    try:
+        (h, w) = (int(header[b'height']), int(header[b'width']))
+    except (KeyError, ValueError):
+        raise ValueError(filename + ' has no valid height and width')
+    cells = np.frombuffer(data, dtype=np.uint8, offset=offset)
+    cells = cells[(cells != ord('\n')) & (cells != ord('\r'))] # Line ends may be \n or \r\n
+    if len(cells) < h * w:
+        raise ValueError(filename + ' holds ' + str(len(cells)) + ' cells, expected ' + str(h * w))
+    return TERRAIN[cells[:h * w]].reshape(h, w)
+
+
+def readMovingAIScenarios(filename):
+    '''
+    Reads a MovingAI .scen scenario file. Coordinates are (x, y) = (column, row) in the file and are turned into
+    (row, col) poses. The optimal lengths are those of 8-connected moves that do not cut corners, i.e. of
+    MoveModel(8) paths.
+    :param filename: path of the .scen file (version 1)
+    :return: dictionary with 'map', the name of the map file of the first scenario, 'pairs', an int64 array of
+    shape (n, 4) of (start row, start col, goal row, goal col) that GridSearch.searchMany and planMany take as they
+    are, 'buckets', an int64 array of the bucket of every scenario, and 'optimal', a float64 array of their optimal
+    path lengths
+    '''
+    with open(filename, 'rb') as scenfile:
+        lines = scenfile.read().splitlines()
+    if lines and lines[0].split() and lines[0].split()[0].lower() == b'version':
+        lines = lines[1:]
+    rows = [line.split() for line in lines if line.strip()]
+    if not rows:
+        return {'map': None, 'pairs': np.zeros((0, 4), dtype=np.int64), 'buckets': np.zeros(0, dtype=np.int64),
+                'optimal': np.zeros(0)}
+    if any(len(row) != 9 for row in rows):
+        raise ValueError(filename + ' is not a version 1 scenario file')
+    columns = np.array([row[:1] + row[2:] for row in rows]).astype(np.float64) # All but the map name
+    pairs = columns[:, [4, 3, 6, 5]].astype(np.int64)
+    return {'map': rows[0][1].decode(), 'pairs': pairs, 'buckets': columns[:, 0].astype(np.int64),
+            'optimal': columns[:, 7]}
+
+
+def align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def writeGridMap(filename, obstaclegrid, layers=None, bytegrid=False):
+    '''
+    Writes a binary grid map (see the layout above)
+    :param filename: path of the .gmap file
+    :param obstaclegrid: A h x w grid that is nonzero on obstacles
+    :param layers: optional dictionary of layer name -> h x w grid of per-cell costs, stored as float32
+    :param bytegrid: also write the obstacles as one byte per cell, which readers then map instead of unpacking
+    the bits into a copy of their own
+    '''
+    obstaclegrid = np.asarray(obstaclegrid)
+    (h, w) = obstaclegrid.shape
+    layers = OrderedDict(layers or ())
+    names = [name.encode('utf-8') if not isinstance(name, bytes) else name for name in layers.keys()]
+    if any(len(name) > LAYER_NAME for name in names):
+        raise ValueError('Layer names are at most ' + str(LAYER_NAME) + ' bytes')
+    header = GRIDMAP_HEADER.pack(GRIDMAP_MAGIC, GRIDMAP_VERSION, h, w, len(names),
+                                 GRIDMAP_BYTEGRID if bytegrid else 0) + \
+        b''.join(name.ljust(LAYER_NAME, b'\0') for name in names)
+    with open(filename, 'wb') as mapfile:
+        mapfile.write(header.ljust(align(len(header)), b'\0'))
+        packed = np.packbits(obstaclegrid != 0, axis=1)
+        mapfile.write(packed.tobytes().ljust(align(packed.nbytes), b'\0'))
+        if bytegrid:
+            cells = (obstaclegrid != 0).astype(np.uint8)
+            mapfile.write(cells.tobytes().ljust(align(cells.nbytes), b'\0'))
+        for grid in layers.values():
+            if np.shape(grid) != (h, w):
+                raise ValueError('Cost layers must be ' + str(h) + ' x ' + str(w))
+            costs = np.ascontiguousarray(grid, dtype='<f4')
+            mapfile.write(costs.tobytes().ljust(align(costs.nbytes), b'\0'))
+
+
+class GridMap:
+    '''
+    A binary grid map opened with np.memmap. packed and the arrays in layers are read-only views of the file, read
+    only as they are used, so processes that open the same map share the pages the operating system caches for it.
+    blocked is the flat obstacle grid indexed by cell id, which GridSearch.searchCells takes as its obstacle buffer;
+    it is a view of the obstacle grid section of maps written with bytegrid, and is otherwise unpacked from packed
+    into a read-only array of this process when the map is opened.
+    '''
+    def __init__(self, filename):
+        '''
+        :param filename: path of a .gmap file written by writeGridMap
+        '''
+        with open(filename, 'rb') as mapfile:
+            header = mapfile.read(GRIDMAP_HEADER.size)
+            if len(header) < GRIDMAP_HEADER.size:
+                raise ValueError(filename + ' is not a grid map')
+            (magic, self.version, self.h, self.w, count, self.flags) = GRIDMAP_HEADER.unpack(header)
+            if magic != GRIDMAP_MAGIC:
+                raise ValueError(filename + ' is not a grid map')
+            if self.version > GRIDMAP_VERSION:
+                raise ValueError(filename + ' has grid map version ' + str(self.version) + ', at most ' +
+                                 str(GRIDMAP_VERSION) + ' is supported')
+            names = [mapfile.read(LAYER_NAME).rstrip(b'\0').decode('utf-8') for i in range(count)]
+        self.filename = filename
+        offset = align(GRIDMAP_HEADER.size + LAYER_NAME * count)
+        rowbytes = -(-self.w // 8)
+        self.packed = np.memmap(filename, dtype=np.uint8, mode='r', offset=offset, shape=(self.h, rowbytes))
+        offset += align(self.h * rowbytes)
+        self.offset = None # Offset of the obstacle grid section
+        if self.version == 2 or self.flags & GRIDMAP_BYTEGRID:
+            self.offset = offset
+            self.blocked = np.memmap(filename, dtype=np.uint8, mode='r', offset=offset, shape=(self.h * self.w,))
+            offset += align(self.h * self.w)
+        else:
+            self.blocked = np.unpackbits(self.packed, axis=1)[:, :self.w].ravel()
+            self.blocked.flags.writeable = False
+        self.layers = OrderedDict()
+        for name in names:
+            self.layers[name] = np.memmap(filename, dtype='<f4', mode='r', offset=offset, shape=(self.h, self.w))
+            offset += align(4 * self.h * self.w)
+
+    def isBlocked(self, row, col):
+        '''Returns True if the cell is an obstacle, reading a single byte of the occupancy layer'''
+        return bool(self.packed[row, col >> 3] & (0x80 >> (col & 7)))
+
+    def getObstacleGrid(self, top=0, bottom=None):
+        '''
+        Returns rows top to bottom (exclusive, by default the last row) of the obstacle grid, without a copy
+        :return: read-only (bottom - top) x w uint8 grid that is 1 on obstacles
+        '''
+        return self.blocked.reshape(self.h, self.w)[top:bottom]
+
+    def getOccupancies(self):
+        '''
+        Returns the obstacle grid as a copy-on-write view of the file if it holds the obstacle grid section: it can be
+        changed, and only the pages written to are copied, into this process and never back to the file. Otherwise
+        it is a copy of blocked.
+        :return: h x w uint8 grid that is 1 on obstacles
+        '''
+        if self.offset is None:
+            return self.getObstacleGrid().copy()
+        return np.memmap(self.filename, dtype=np.uint8, mode='c', offset=self.offset, shape=(self.h, self.w))
+
+
+def readGridMap(filename):
+    '''Opens a binary grid map written by writeGridMap; see GridMap'''
+    return GridMap(filename)